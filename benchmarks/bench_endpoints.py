@@ -0,0 +1,70 @@
+"""The full POST /games/<id>/clear round trip through the Flask test client, on a scratch
+SQLite database file: token check, loading and replaying the game, the move, the
+compare-and-swap save with its move log rows, and encoding the response.
+
+Run with ``python benchmarks/bench_endpoints.py``.
+"""
+import os
+import tempfile
+
+import common
+
+USER = {"email": "bench@test.com", "password": "bananasurf123"}
+
+
+def load_app(database: str):
+    """Imports the app configured for benchmarking: a scratch database and no background threads."""
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{database}"
+    os.environ["BOARD_POOL_SIZE"] = "0"
+    import app as app_module
+    app_module.app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{database}"
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    return app_module
+
+
+def covered_safe_cell(app_module, user_id: int, game_id: int):
+    with app_module.app.app_context():
+        board = app_module.find_game(user_id, game_id).board
+        app_module.db.session.rollback()
+    return next((r, c) for r in range(board.rows) for c in range(board.columns)
+                if board.status(r, c) == "C" and not board.is_mine(r, c) and board.value(r, c) > 0)
+
+
+def run(repeat: int = 20):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        app_module = load_app(os.path.join(directory, "games.db"))
+        client = app_module.app.test_client()
+        client.post("/register", json=USER)
+        headers = {"x-access-tokens": client.post("/authenticate", json=USER).json["token"]}
+        with app_module.app.app_context():
+            user_id = app_module.user_for_token(headers["x-access-tokens"]).id
+
+        for side, mines in ((10, 20), (50, 250)):
+            params = {"side": side, "mines": mines}
+            settings = {"rows": side, "columns": side, "mines": mines}
+
+            def new_game():
+                return client.post("/games", headers=headers, json=settings).json["id"]
+
+            def clear(game_id, cell=(0, 0)):
+                response = client.post(f"/games/{game_id}/clear", headers=headers,
+                                       json={"row": cell[0], "column": cell[1]})
+                assert response.status_code == 200, response.status_code
+
+            # The first clear also places the mines and writes a snapshot.
+            results.append(common.measure("endpoint.clear_first", clear, new_game, repeat, **params))
+
+            def played_game():
+                game_id = new_game()
+                clear(game_id)
+                return game_id, covered_safe_cell(app_module, user_id, game_id)
+
+            results.append(common.measure("endpoint.clear", lambda game: clear(*game), played_game, repeat, **params))
+    return results
+
+
+if __name__ == "__main__":
+    common.print_results(run())
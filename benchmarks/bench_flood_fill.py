@@ -0,0 +1,55 @@
+"""Compares the iterative flood fill against the previous recursive implementation on open boards.
+
+Run with ``python benchmarks/bench_flood_fill.py``.
+"""
+import random
+import sys
+
+import common
+from services.board import Board, MINE, UNCOVERED, FLAGGED
+
+
+def recursive_reveal(board: Board, row: int, column: int):
+    """The recursive _clear_adjacents this repo used before the queue-based flood fill."""
+    if not board.in_bounds(row, column):
+        return
+    if board.status(row, column) in (UNCOVERED, FLAGGED):
+        return
+    cell_value = board.value(row, column)
+    if cell_value != MINE:
+        board.set_status(row, column, UNCOVERED)
+        if cell_value == 0:
+            for r in range(row-1, row+2):
+                for c in range(column-1, column+2):
+                    if not (r==row and c==column):
+                        recursive_reveal(board, r, c)
+
+
+def open_board(side: int, mines: int, seed: int = 7):
+    rng = random.Random(seed)
+    board = Board(side, side)
+    for index in rng.sample(range(1, side * side), mines):
+        board.values[index] = MINE
+    for r in range(side):
+        for c in range(side):
+            if not board.is_mine(r, c):
+                board.set_value(r, c, sum(1 for n in board.neighbors(r, c) if board.is_mine(*n)))
+    return board
+
+
+def run(repeat: int = 20):
+    results = []
+    for side, mines in ((10, 1), (30, 5), (50, 10)):
+        template = open_board(side, mines).to_bytes()
+        setup = lambda: Board.from_bytes(template)
+        results.append(common.measure("flood_fill.iterative", lambda b: b.flood_reveal(0, 0), setup,
+                                      repeat, side=side, mines=mines))
+        results.append(common.measure("flood_fill.recursive", lambda b: recursive_reveal(b, 0, 0), setup,
+                                      repeat, side=side, mines=mines))
+    return results
+
+
+if __name__ == "__main__":
+    # The recursive version needs roughly one frame per revealed cell.
+    sys.setrecursionlimit(20000)
+    common.print_results(run())
@@ -0,0 +1,67 @@
+"""Board generation across sizes and mine densities.
+
+Compares GameService._generate_board (one-shot sampling plus vectorized neighbour
+counts when NumPy is installed) with the pure Python fallback and with the previous
+rejection sampling / per-cell counting implementation.
+
+Run with ``python benchmarks/bench_generation.py``.
+"""
+import random
+
+import common
+import services.board as board_module
+from services.board import Board, MINE
+from services.game_service import GameService
+from models import Game
+
+
+def legacy_generate(rows: int, columns: int, mines: int):
+    """The generation code this repo used before sampling without replacement."""
+    board = Board(rows, columns)
+    while mines > 0:
+        target_row = random.randint(0, rows-1)
+        target_column = random.randint(0, columns-1)
+        if board.value(target_row, target_column) == 0:
+            board.set_value(target_row, target_column, MINE)
+            mines -= 1
+    for i in range(rows):
+        for j in range(columns):
+            if board.is_mine(i, j):
+                continue
+            count = 0
+            for r in range(i-1, i+2):
+                for c in range(j-1, j+2):
+                    if 0 <= r < rows and 0 <= c < columns and not (r==i and c==j) and board.is_mine(r, c):
+                        count += 1
+            board.set_value(i, j, count)
+    return board
+
+
+def generate(rows: int, columns: int, mines: int):
+    service = GameService(Game(), seed=1)
+    service._generate_board(rows, columns, mines)
+    return service.game.board
+
+
+CASES = [(side, density) for side in (10, 30, 50) for density in (0.1, 0.5, 0.9)]
+
+
+def run(repeat: int = 10):
+    results = []
+    numpy = board_module.numpy
+    for side, density in CASES:
+        mines = int(side * side * density)
+        params = {"side": side, "density": density}
+        if numpy is not None:
+            results.append(common.measure("generate.numpy", lambda: generate(side, side, mines), repeat=repeat, **params))
+        board_module.numpy = None
+        try:
+            results.append(common.measure("generate.pure", lambda: generate(side, side, mines), repeat=repeat, **params))
+        finally:
+            board_module.numpy = numpy
+        results.append(common.measure("generate.legacy", lambda: legacy_generate(side, side, mines), repeat=repeat, **params))
+    return results
+
+
+if __name__ == "__main__":
+    common.print_results(run())
@@ -0,0 +1,79 @@
+"""No-guess board generation: boards per second by size and mine density, searching in
+process and on a NoGuessGenerator pool, and the cost of validating one candidate board.
+
+Every timed call searches with the same seeds, so each run does the same work.
+
+Run with ``python benchmarks/bench_no_guess.py``.
+"""
+import os
+import random
+
+import common
+from services.board import Board, make_rng, sample_cells
+from services.no_guess import NoGuessGenerator, find_mines, first_clear_cells
+from services.solver import solvable
+
+# (rows, columns, mines): beginner, intermediate and expert, and two densities on 30x30.
+CASES = [(9, 9, 10), (16, 16, 40), (16, 30, 99), (30, 30, 90), (30, 30, 180)]
+BOARDS = 3
+
+
+def with_rate(result, boards: int):
+    return dict(result, boards_per_second=round(boards * 1000 / result["median_ms"], 2))
+
+
+def candidates(rows: int, columns: int, mines: int, count: int = 20):
+    """Random boards with the first clear's area kept free, most of them not solvable."""
+    rng = make_rng(1)
+    row, column = rows // 2, columns // 2
+    boards = []
+    for _ in range(count):
+        board = Board(rows, columns)
+        board.place_mines(sample_cells(rng, rows * columns, mines, first_clear_cells(rows, columns, row, column)))
+        board.calculate_values()
+        boards.append(board)
+    return boards
+
+
+def run(repeat: int = 3):
+    results = []
+    processes = min(os.cpu_count() or 1, 4)
+    generator = NoGuessGenerator(processes=processes, budget=60)
+    try:
+        for rows, columns, mines in CASES:
+            params = {"rows": rows, "columns": columns, "mines": mines}
+            row, column = rows // 2, columns // 2
+
+            def search():
+                for seed in range(BOARDS):
+                    assert find_mines(rows, columns, mines, row, column, seed, attempts=10000) is not None
+            results.append(with_rate(common.measure("no_guess.generate", search, repeat=repeat, **params), BOARDS))
+
+            boards = candidates(rows, columns, mines)
+            results.append(common.measure("no_guess.validate_x20",
+                                          lambda: [solvable(board, row, column) for board in boards],
+                                          repeat=repeat, **params))
+
+            if processes > 1:
+                rng = random.Random(1)
+                # The first round also starts the worker processes.
+                generator.generate(rows, columns, mines, row, column, rng)
+
+                def pooled():
+                    for _ in range(BOARDS):
+                        assert generator.generate(rows, columns, mines, row, column, rng) is not None
+                results.append(with_rate(common.measure("no_guess.generate_pool", pooled, repeat=repeat,
+                                                        processes=processes, **params), BOARDS))
+    finally:
+        generator.stop()
+    return results
+
+
+if __name__ == "__main__":
+    results = run()
+    common.print_results(results)
+    print()
+    for result in results:
+        if "boards_per_second" in result:
+            params = " ".join(f"{k}={v}" for k, v in result["params"].items())
+            print(f"{result['name']:<40} {params:<48} {result['boards_per_second']:8.2f} boards/s")
@@ -0,0 +1,66 @@
+"""GameService hot paths: clear on boards where the first click floods most of the board,
+is_complete, and masking/encoding the board for a response.
+
+Run with ``python benchmarks/bench_service.py``.
+"""
+import common
+from models import Game
+from services.board import new_board, load_board, make_rng, sample_cells
+from services.game_service import GameService
+
+
+def open_game(side: int, mines: int, seed: int = 7):
+    """A started game whose mines stay clear of the top left corner, so clearing (0, 0) floods."""
+    board = new_board(side, side)
+    corner = [board.index(r, c) for r in range(2) for c in range(2)]
+    board.place_mines(sample_cells(make_rng(seed), side * side, mines, corner))
+    board.calculate_values()
+    return Game(id=1, user_id=1, rows=side, columns=side, mines=mines, mines_left=mines, flags=0,
+                covered_safe_cells=side * side - mines, status="started", version=0, board=board)
+
+
+def game_factory(template: Game):
+    data = template.board.to_bytes()
+
+    def setup():
+        game = Game(**{column: getattr(template, column) for column in
+                       ("id", "user_id", "rows", "columns", "mines", "mines_left", "flags",
+                        "covered_safe_cells", "status", "version")})
+        game.board = load_board(data)
+        return GameService(game)
+    return setup
+
+
+def half_cleared(side: int, mines: int):
+    """A service on a game whose flood fill from the corner already uncovered most of the board."""
+    service = GameService(open_game(side, mines))
+    service.clear(0, 0)
+    return service
+
+
+def run(repeat: int = 20):
+    results = []
+    for side, mines in ((50, 10), (200, 100), (1000, 1000)):
+        params = {"side": side, "mines": mines}
+        results.append(common.measure("service.clear_flood", lambda service: service.clear(0, 0),
+                                      game_factory(open_game(side, mines)), repeat, **params))
+
+    service = half_cleared(50, 250)
+    results.append(common.measure("service.is_complete_x1000",
+                                  lambda: [service.is_complete() for _ in range(1000)], repeat=repeat, side=50))
+    for side, mines in ((10, 20), (50, 250)):
+        service = half_cleared(side, mines)
+        params = {"side": side, "mines": mines}
+        results.append(common.measure("service.mask_board", service._mask_board, repeat=repeat, **params))
+        results.append(common.measure("service.encode_game_info", service.encode_game_info, repeat=repeat, **params))
+
+    service = half_cleared(1000, 1000)
+    params = {"side": 1000, "mines": 1000}
+    results.append(common.measure("service.encode_game_info", service.encode_game_info, repeat=repeat, **params))
+    results.append(common.measure("service.encode_game_info_viewport",
+                                  lambda: service.encode_game_info((400, 400, 200, 200)), repeat=repeat, **params))
+    return results
+
+
+if __name__ == "__main__":
+    common.print_results(run())
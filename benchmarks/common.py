@@ -0,0 +1,37 @@
+"""Shared helpers for the benchmark scripts.
+
+The API modules import each other relative to ``src/api`` (``from models import ...``),
+so benchmarks put that directory on the path the same way the app runs.
+"""
+import os
+import statistics
+import sys
+import time
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "api")
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+
+def measure(name: str, fn, setup=None, repeat: int = 20, **params):
+    """Times ``fn(setup())`` ``repeat`` times, excluding setup, and returns a result dict in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg) if setup else fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "name": name,
+        "params": params,
+        "repeat": repeat,
+        "min_ms": min(timings),
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.mean(timings),
+    }
+
+
+def print_results(results):
+    for result in results:
+        params = " ".join(f"{k}={v}" for k, v in result["params"].items())
+        print(f"{result['name']:<40} {params:<36} median {result['median_ms']:9.3f} ms   min {result['min_ms']:9.3f} ms")
@@ -0,0 +1,135 @@
+"""Load test of the Flask app against the ASGI serving mode.
+
+Starts each server on a fresh SQLite database file, then runs ``--concurrency`` virtual
+players against it for ``--duration`` seconds. Each player starts its own game and keeps
+polling it, with every ``--poll-ratio``th request being a move instead. Reports requests
+per second and latency percentiles.
+
+Run with ``python benchmarks/load_test.py`` (needs httpx and uvicorn), or point it at
+already running servers with ``--url name=http://host:port``.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+import common
+
+SERVERS = {
+    "flask": [sys.executable, "-m", "flask", "run", "--port", "{port}", "--with-threads"],
+    "asgi": [sys.executable, "-m", "uvicorn", "asgi:app", "--port", "{port}", "--log-level", "warning"],
+}
+
+
+def start_server(name: str, port: int, database: str):
+    env = dict(os.environ, FLASK_APP="app.py", SECRET_KEY="load-test",
+               SQLALCHEMY_DATABASE_URI=f"sqlite:///{database}")
+    subprocess.run([sys.executable, "-m", "flask", "upgrade-db"], cwd=common.API_DIR, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    command = [part.format(port=port) for part in SERVERS[name]]
+    return subprocess.Popen(command, cwd=common.API_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_until_up(url: str, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while True:
+            try:
+                await client.get("/spec")
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+
+async def player(client: httpx.AsyncClient, headers: dict, deadline: float, poll_ratio: int, latencies: list,
+                 errors: list, size: int):
+    game = (await client.post("/games", headers=headers, json={"rows": size, "columns": size, "mines": size})).json()
+    requests = 0
+    while time.monotonic() < deadline:
+        requests += 1
+        start = time.perf_counter()
+        if requests % poll_ratio:
+            response = await client.get(f"/games/{game['id']}", headers=headers)
+        else:
+            response = await client.post(f"/games/{game['id']}/toggle", headers=headers,
+                                         json={"row": 0, "column": 0})
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+
+async def load(name: str, url: str, concurrency: int, duration: float, poll_ratio: int, size: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        credentials = {"email": "load@test.com", "password": "bananasurf123"}
+        await client.post("/register", json=credentials)
+        token = (await client.post("/authenticate", json=credentials)).json()["token"]
+        headers = {"x-access-tokens": token}
+
+        latencies, errors = [], []
+        start = time.monotonic()
+        await asyncio.gather(*[player(client, headers, start + duration, poll_ratio, latencies, errors, size)
+                               for _ in range(concurrency)])
+        elapsed = time.monotonic() - start
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "name": name,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentiles[49],
+        "p99_ms": percentiles[98],
+    }
+
+
+def run(targets=("flask", "asgi"), urls=None, concurrency: int = 32, duration: float = 10, poll_ratio: int = 5,
+        size: int = 50):
+    results = []
+    for index, name in enumerate(targets):
+        server = None
+        url = (urls or {}).get(name)
+        with tempfile.TemporaryDirectory() as directory:
+            if url is None:
+                port = 5800 + index
+                url = f"http://127.0.0.1:{port}"
+                server = start_server(name, port, os.path.join(directory, "games.db"))
+            try:
+                asyncio.run(wait_until_up(url))
+                results.append(asyncio.run(load(name, url, concurrency, duration, poll_ratio, size)))
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.wait()
+    return results
+
+
+def print_results(results):
+    for result in results:
+        print(f"{result['name']:<8} {result['requests']:>8} requests  {result['rps']:9.1f} req/s   "
+              f"p50 {result['p50_ms']:8.2f} ms   p99 {result['p99_ms']:8.2f} ms   {result['errors']} errors")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--poll-ratio", type=int, default=5)
+    parser.add_argument("--size", type=int, default=50, help="board side of every player's game")
+    parser.add_argument("--url", action="append", default=[], metavar="NAME=URL")
+    parser.add_argument("targets", nargs="*", default=["flask", "asgi"], help="flask and/or asgi")
+    args = parser.parse_args()
+    for target in args.targets:
+        if target not in SERVERS:
+            parser.error(f"unknown target {target}")
+    urls = dict(url.split("=", 1) for url in args.url)
+    print_results(run(args.targets, urls, args.concurrency, args.duration, args.poll_ratio, args.size))
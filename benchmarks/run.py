@@ -0,0 +1,139 @@
+"""Runs the benchmark suites, writes their results as JSON and compares them with a baseline.
+
+A benchmark regresses when its fastest run is more than ``--tolerance`` slower than in the
+baseline, and by more than ``--floor-ms``, so sub-millisecond noise does not count. Any
+regression makes the script exit with status 1. The fastest run is compared rather than the
+median because it is the least disturbed by whatever else the machine is doing. Both runs
+also time a fixed pure Python workload, and the baseline is scaled by how much faster or
+slower the machine ran it, which absorbs most of the drift between runs on shared hosts.
+
+Baselines only mean something on the machine they were recorded on: record one with
+``python benchmarks/run.py --update-baseline`` before comparing against it elsewhere.
+
+Run with ``python benchmarks/run.py [--output results.json] [suite ...]``.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import warnings
+
+import common
+import bench_endpoints
+import bench_flood_fill
+import bench_generation
+import bench_no_guess
+import bench_service
+import services.board as board_module
+
+SUITES = {
+    "generation": bench_generation,
+    "flood_fill": bench_flood_fill,
+    "service": bench_service,
+    "endpoints": bench_endpoints,
+    "no_guess": bench_no_guess,
+}
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def result_key(result):
+    params = ",".join(f"{name}={value}" for name, value in sorted(result["params"].items()))
+    return f"{result['name']}[{params}]"
+
+
+def calibration_workload():
+    counts = {}
+    for number in range(200000):
+        counts[number % 97] = counts.get(number % 97, 0) + number
+    return sorted(counts.values())
+
+
+def calibrate():
+    return common.measure("calibration", calibration_workload, repeat=10)["min_ms"]
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": board_module.numpy.__version__ if board_module.numpy is not None else None,
+    }
+
+
+def run(suites, repeat: int = None):
+    results = []
+    calibration = calibrate()
+    for name in suites:
+        kwargs = {"repeat": repeat} if repeat is not None else {}
+        for result in SUITES[name].run(**kwargs):
+            results.append(dict(result, suite=name))
+    # Timed before and after, the machine may speed up or slow down while the suites run.
+    calibration = min(calibration, calibrate())
+    return {"environment": environment(), "calibration_ms": calibration, "results": results}
+
+
+def compare(report, baseline, tolerance: float = 0.5, floor_ms: float = 0.1):
+    """Returns (regressions, rows), rows being (key, baseline ms, current ms, ratio) for every
+    benchmark in both, and regressions the keys of the rows that got too slow. Baseline times
+    are scaled by the ratio of the two calibration times."""
+    previous = {result_key(result): result for result in baseline["results"]}
+    scale = report["calibration_ms"] / baseline["calibration_ms"]
+    regressions, rows = [], []
+    for result in report["results"]:
+        key = result_key(result)
+        if key not in previous:
+            continue
+        before, now = previous[key]["min_ms"] * scale, result["min_ms"]
+        ratio = now / before if before else float("inf")
+        rows.append((key, before, now, ratio))
+        if now > before * (1 + tolerance) and now - before > floor_ms:
+            regressions.append(key)
+    return regressions, rows
+
+
+def print_comparison(regressions, rows):
+    for key, before, now, ratio in rows:
+        marker = "  REGRESSION" if key in regressions else ""
+        print(f"{key:<70} {before:10.3f} ms -> {now:10.3f} ms  {ratio:6.2f}x{marker}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline JSON to compare with (default %(default)s)")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown, 0.5 being 50%%")
+    parser.add_argument("--floor-ms", type=float, default=0.1, help="ignore slowdowns smaller than this")
+    parser.add_argument("--repeat", type=int, help="runs per benchmark (default: each suite's own)")
+    parser.add_argument("suites", nargs="*", default=list(SUITES), help=", ".join(SUITES))
+    args = parser.parse_args()
+    for suite in args.suites:
+        if suite not in SUITES:
+            parser.error(f"unknown suite {suite}")
+
+    # The recursive flood fill in bench_flood_fill needs roughly one frame per revealed cell.
+    sys.setrecursionlimit(20000)
+    warnings.simplefilter("ignore")
+    report = run(args.suites, args.repeat)
+    common.print_results(report["results"])
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        sys.exit(0)
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, record one with --update-baseline")
+        sys.exit(0)
+
+    with open(args.baseline) as baseline:
+        regressions, rows = compare(report, json.load(baseline), args.tolerance, args.floor_ms)
+    print()
+    print_comparison(regressions, rows)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
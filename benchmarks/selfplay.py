@@ -0,0 +1,339 @@
+"""Self-play simulator and load generator: plays whole games with a random or a solver
+driven strategy on a pool of worker processes and reports throughput, latency percentiles
+per endpoint and game statistics (win rate, moves, guesses, flood fill sizes).
+
+Games are played against one of these targets:
+
+- ``service``: GameService in the worker process, with no HTTP or database in between.
+- ``client``: the Flask app through its test client, on a scratch SQLite file per worker.
+- ``flask`` or ``asgi``: a local server started on a scratch SQLite file, as load_test.py does.
+- any ``http://host:port`` URL of an already running server.
+
+The ``random`` strategy clears random covered cells and flags one now and then. The
+``solver`` strategy asks for a hint before each turn (GameService.hint, or GET /games/<id>/hint
+over HTTP), flags the certain mines, clears the safe cells by chording a number when its
+mines are all flagged, and only guesses the likeliest safe cell when nothing is certain.
+
+Run with ``python benchmarks/selfplay.py --games 1000 --processes 4 --target client``.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+import common
+
+MOVES = ("clear", "toggle", "chord")
+
+
+class ServiceTarget:
+    """Plays on GameService directly. Timings cover the move and encoding the game."""
+
+    def __init__(self):
+        from services.game_service import GameService
+        self.service_class = GameService
+        self.service = None
+
+    def start(self, rows: int, columns: int, mines: int, no_guess: bool, seed: int):
+        self.service = self.service_class(seed=seed)
+        self.service.start_game(1, rows, columns, mines, no_guess)
+        return self.service.encode_game_info()
+
+    def move(self, action: str, row: int, column: int):
+        getattr(self.service, action)(row, column)
+        return self.service.encode_game_info()
+
+    def hint(self):
+        return self.service.hint()
+
+
+class ClientTarget:
+    """Plays through the Flask test client on a scratch SQLite database."""
+
+    def __init__(self):
+        import bench_endpoints
+        # Each worker is a process of its own, no-guess games search in it.
+        os.environ.setdefault("NO_GUESS_PROCESSES", "1")
+        self.directory = tempfile.TemporaryDirectory()
+        app_module = bench_endpoints.load_app(os.path.join(self.directory.name, "games.db"))
+        self.client = app_module.app.test_client()
+        self.client.post("/register", json=bench_endpoints.USER)
+        self.headers = {"x-access-tokens": self.client.post("/authenticate", json=bench_endpoints.USER).json["token"]}
+        self.game_id = None
+
+    def request(self, method: str, path: str, body: dict = None):
+        response = self.client.open(path, method=method, headers=self.headers, json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"{method} {path} answered {response.status_code}: {response.get_data(as_text=True)}")
+        return response.json
+
+    def start(self, rows: int, columns: int, mines: int, no_guess: bool, seed: int):
+        game = self.request("POST", "/games", {"rows": rows, "columns": columns, "mines": mines, "no_guess": no_guess})
+        self.game_id = game["id"]
+        return game
+
+    def move(self, action: str, row: int, column: int):
+        return self.request("POST", f"/games/{self.game_id}/{action}", {"row": row, "column": column})
+
+    def hint(self):
+        return self.request("GET", f"/games/{self.game_id}/hint")
+
+
+class HTTPTarget(ClientTarget):
+    """Plays against a running server over one keep-alive connection per worker."""
+
+    def __init__(self, url: str):
+        import httpx
+        self.client = httpx.Client(base_url=url, timeout=30)
+        # A user per worker, so runs never share games.
+        user = {"email": f"selfplay-{uuid.uuid4().hex}@test.com", "password": "bananasurf123"}
+        self.client.post("/register", json=user)
+        self.headers = {"x-access-tokens": self.client.post("/authenticate", json=user).json()["token"]}
+        self.game_id = None
+
+    def request(self, method: str, path: str, body: dict = None):
+        response = self.client.request(method, path, headers=self.headers, json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"{method} {path} answered {response.status_code}: {response.text}")
+        return response.json()
+
+
+def make_target(target: str):
+    if target == "service":
+        return ServiceTarget()
+    if target == "client":
+        return ClientTarget()
+    return HTTPTarget(target)
+
+
+class Player:
+    """Plays one game and records the latency of every call and the size of every clear."""
+
+    def __init__(self, target, strategy: str, rng: random.Random):
+        self.target = target
+        self.strategy = strategy
+        self.rng = rng
+        self.latencies = {}
+        self.floods = []
+        self.moves = 0
+        self.guesses = 0
+        self.state = None
+
+    def timed(self, endpoint: str, call, *args):
+        start = time.perf_counter()
+        result = call(*args)
+        self.latencies.setdefault(endpoint, []).append((time.perf_counter() - start) * 1000)
+        return result
+
+    def play(self, rows: int, columns: int, mines: int, no_guess: bool, seed: int):
+        self.state = self.timed("start", self.target.start, rows, columns, mines, no_guess, seed)
+        self.move("clear", rows // 2, columns // 2)
+        turn = self.solver_turn if self.strategy == "solver" else self.random_turn
+        # Every turn makes at least one move, which bounds a game by its cells.
+        for _ in range(3 * rows * columns):
+            if self.state["status"] != "started":
+                break
+            turn()
+        return self.state["status"]
+
+    def move(self, action: str, row: int, column: int):
+        before = uncovered(self.state["board"])
+        self.state = self.timed(action, self.target.move, action, row, column)
+        self.moves += 1
+        if action != "toggle":
+            self.floods.append(uncovered(self.state["board"]) - before)
+
+    def covered(self, statuses=("C",)):
+        board = self.state["board"]
+        return [(r, c) for r, cells in enumerate(board) for c, cell in enumerate(cells) if cell in statuses]
+
+    def random_turn(self):
+        if self.rng.random() < 0.1:
+            self.move("toggle", *self.rng.choice(self.covered(("C", "F", "?"))))
+        else:
+            self.move("clear", *self.rng.choice(self.covered(("C", "?")) or self.covered(("C", "F", "?"))))
+
+    def solver_turn(self):
+        hint = self.timed("hint", self.target.hint)
+        board = self.state["board"]
+        for r, c in hint["mines"]:
+            if board[r][c] == "C":
+                self.move("toggle", r, c)
+        for r, c in hint["safe"]:
+            if self.state["status"] != "started":
+                return
+            board = self.state["board"]
+            if not isinstance(board[r][c], str):
+                continue
+            number = self.chordable(r, c)
+            self.move("chord", *number) if number else self.move("clear", r, c)
+        if hint["safe"]:
+            return
+        # Nothing is certain: guess the cell least likely to be a mine.
+        candidates = [(probability, (r, c)) for r, c, probability in hint["probabilities"]]
+        if hint["unconstrained_probability"] is not None:
+            constrained = {(r, c) for r, c, _ in hint["probabilities"]}
+            others = [cell for cell in self.covered(("C", "?")) if cell not in constrained]
+            if others:
+                candidates.append((hint["unconstrained_probability"], self.rng.choice(others)))
+        if not candidates:
+            candidates = [(1, cell) for cell in self.covered(("C", "?"))]
+        self.guesses += 1
+        self.move("clear", *min(candidates)[1])
+
+    def chordable(self, row: int, column: int):
+        """A number next to the cell whose mines are all flagged, which a chord would clear."""
+        board = self.state["board"]
+        rows, columns = len(board), len(board[0])
+        for r in range(max(row - 1, 0), min(row + 2, rows)):
+            for c in range(max(column - 1, 0), min(column + 2, columns)):
+                value = board[r][c]
+                if isinstance(value, str) or value <= 0:
+                    continue
+                flags = sum(board[nr][nc] == "F" for nr in range(max(r - 1, 0), min(r + 2, rows))
+                            for nc in range(max(c - 1, 0), min(c + 2, columns)))
+                if flags == value:
+                    return r, c
+        return None
+
+
+def uncovered(board):
+    return sum(not isinstance(cell, str) for cells in board for cell in cells)
+
+
+_target = None
+
+
+def _start_worker(target: str):
+    global _target
+    _target = make_target(target)
+
+
+def _ready(_):
+    return _target is not None
+
+
+def play_game(args):
+    """Plays one game on the worker's target. Returns its record and latencies."""
+    strategy, rows, columns, mines, no_guess, seed = args
+    player = Player(_target, strategy, random.Random(seed))
+    status = player.play(rows, columns, mines, no_guess, seed)
+    return {"status": status, "moves": player.moves, "guesses": player.guesses, "floods": player.floods}, player.latencies
+
+
+def percentile(values, share: float):
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+def simulate(target: str, games: int, processes: int = 1, strategy: str = "solver", rows: int = 16,
+             columns: int = 16, mines: int = 40, no_guess: bool = False, seed: int = 0):
+    """Plays games and returns the report."""
+    tasks = [(strategy, rows, columns, mines, no_guess, seed + number) for number in range(games)]
+    if processes <= 1:
+        _start_worker(target)
+        start = time.perf_counter()
+        outcomes = [play_game(task) for task in tasks]
+    else:
+        with multiprocessing.get_context("spawn").Pool(processes, _start_worker, (target,)) as pool:
+            # Starting the workers, and the app in them, is not part of the run.
+            pool.map(_ready, range(processes), chunksize=1)
+            start = time.perf_counter()
+            outcomes = list(pool.imap_unordered(play_game, tasks, chunksize=max(1, games // (processes * 8))))
+    elapsed = time.perf_counter() - start
+
+    records = [record for record, _ in outcomes]
+    latencies = {}
+    for _, samples in outcomes:
+        for endpoint, values in samples.items():
+            latencies.setdefault(endpoint, []).extend(values)
+    floods = [size for record in records for size in record["floods"]]
+    moves = sum(record["moves"] for record in records)
+    requests = sum(len(values) for values in latencies.values())
+    statuses = [record["status"] for record in records]
+    return {
+        "settings": {"target": target, "games": games, "processes": processes, "strategy": strategy,
+                     "rows": rows, "columns": columns, "mines": mines, "no_guess": no_guess, "seed": seed},
+        "seconds": elapsed,
+        "games_per_second": games / elapsed,
+        "moves_per_second": moves / elapsed,
+        "requests_per_second": requests / elapsed,
+        "games": {
+            "won": statuses.count("won"),
+            "lost": statuses.count("lost"),
+            "unfinished": statuses.count("started"),
+            "win_rate": statuses.count("won") / games,
+            "moves_per_game": moves / games,
+            "guesses_per_game": sum(record["guesses"] for record in records) / games,
+        },
+        "flood_fill": {
+            "clears": len(floods),
+            "mean": statistics.mean(floods) if floods else 0,
+            "p50": percentile(floods, 0.5) if floods else 0,
+            "p95": percentile(floods, 0.95) if floods else 0,
+            "max": max(floods, default=0),
+        },
+        "latency_ms": {endpoint: {"count": len(values), "p50": percentile(values, 0.5), "p90": percentile(values, 0.9),
+                                  "p99": percentile(values, 0.99), "max": max(values)}
+                       for endpoint, values in sorted(latencies.items())},
+    }
+
+
+def print_report(report):
+    settings, games, floods = report["settings"], report["games"], report["flood_fill"]
+    print(f"{settings['games']} {settings['rows']}x{settings['columns']}x{settings['mines']} games on "
+          f"{settings['target']} with the {settings['strategy']} strategy, {settings['processes']} process(es): "
+          f"{report['seconds']:.2f} s")
+    print(f"  {report['games_per_second']:.1f} games/s, {report['moves_per_second']:.1f} moves/s, "
+          f"{report['requests_per_second']:.1f} calls/s")
+    print(f"  won {games['won']} ({games['win_rate']:.1%}), lost {games['lost']}, unfinished {games['unfinished']}, "
+          f"{games['moves_per_game']:.1f} moves and {games['guesses_per_game']:.2f} guesses per game")
+    print(f"  flood fill: {floods['clears']} clears, mean {floods['mean']:.1f} cells, p50 {floods['p50']}, "
+          f"p95 {floods['p95']}, max {floods['max']}")
+    print(f"  {'endpoint':<8} {'calls':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, latency in report["latency_ms"].items():
+        print(f"  {endpoint:<8} {latency['count']:>8} {latency['p50']:9.3f} {latency['p90']:9.3f} "
+              f"{latency['p99']:9.3f} {latency['max']:9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="service", help="service, client, flask, asgi or a server URL")
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--strategy", choices=("random", "solver"), default="solver")
+    parser.add_argument("--rows", type=int, default=16)
+    parser.add_argument("--columns", type=int, default=16)
+    parser.add_argument("--mines", type=int, default=40)
+    parser.add_argument("--no-guess", action="store_true", help="start no-guess games")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game, the others count up from it")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    args = parser.parse_args()
+    if args.rows > 50 or args.columns > 50:
+        parser.error("games larger than 50x50 are sent as a window, the players need the whole board")
+
+    server, directory, target = None, None, args.target
+    if target in ("flask", "asgi"):
+        import asyncio
+        import load_test
+        directory = tempfile.TemporaryDirectory()
+        server = load_test.start_server(target, 5900, os.path.join(directory.name, "games.db"))
+        target = "http://127.0.0.1:5900"
+        asyncio.run(load_test.wait_until_up(target))
+    try:
+        report = simulate(target, args.games, args.processes, args.strategy, args.rows, args.columns, args.mines,
+                          args.no_guess, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            directory.cleanup()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
@@ -1,15 +1,20 @@
+import atexit
+import queue
 import datetime
+import time
 import uuid
 import os
 import jwt
+import click
 
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, make_response, has_app_context, json, stream_with_context, g
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import and_
+from sqlalchemy import and_, event, select
 from flask_swagger import swagger
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
+from contextlib import contextmanager
 from os.path import join, dirname
 from dotenv import load_dotenv
 
@@ -18,11 +23,25 @@ from schemas.user_registration import UserRegistration
 from schemas.authentication import Authentication
 from schemas.cell_action import CellAction
 from schemas.game_settings import GameSettings
+from schemas.viewport import Viewport
+from schemas.move_batch import MoveBatch
+from schemas.game_list_query import GameListQuery
 from sqlalchemy.exc import IntegrityError
 
 from models import db, User, Game
+import migrations
+from services import move_log
+from storage import configure_storage
 from services.game_service import GameService, InvalidClearException
-from exceptions import InvalidClearException, GameNotFoundException, InvalidGameSettingsException
+from services.game_cache import GameCache
+from services.token_cache import TokenCache, CurrentUser
+from services.encoded_game_cache import EncodedGameCache
+from services.broker import LocalBroker
+from services.board_pool import BoardPool
+from services.no_guess import NoGuessGenerator
+from services.metrics import metrics, RequestProfiler
+from services import encoding
+from exceptions import InvalidClearException, GameNotFoundException, InvalidGameSettingsException, ConcurrentUpdateException
 
 app = Flask(__name__)
 
@@ -31,10 +50,138 @@ load_dotenv(join(dirname(__file__), "../../.env"))
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = os.getenv("SQLALCHEMY_TRACK_MODIFICATIONS")
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("SQLALCHEMY_DATABASE_URI")
-
+# Write-behind game cache, disabled with size 0. Only enable it when a single process serves each game:
+# the flush window is how many seconds of moves can be lost if the process dies.
+app.config["GAME_CACHE_SIZE"] = int(os.getenv("GAME_CACHE_SIZE", 0))
+app.config["GAME_CACHE_IDLE_SECONDS"] = float(os.getenv("GAME_CACHE_IDLE_SECONDS", 300))
+app.config["GAME_CACHE_FLUSH_SECONDS"] = float(os.getenv("GAME_CACHE_FLUSH_SECONDS", 5))
+app.config["TOKEN_CACHE_SIZE"] = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+app.config["TOKEN_CACHE_TTL_SECONDS"] = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", 300))
+# Boards kept ready per "rowsxcolumnsxmines" setting so new games skip generation, 0 disables the pool.
+app.config["BOARD_POOL_SIZE"] = int(os.getenv("BOARD_POOL_SIZE", 20))
+app.config["BOARD_POOL_REFILL_BELOW"] = int(os.getenv("BOARD_POOL_REFILL_BELOW", 10))
+app.config["BOARD_POOL_SETTINGS"] = [tuple(int(side) for side in setting.split("x")) for setting in
+                                     os.getenv("BOARD_POOL_SETTINGS", "10x10x20,9x9x10,16x16x40,16x30x99").split(",")]
+# Moves between board snapshots. Saves in between only append to the move log.
+app.config["MOVE_SNAPSHOT_INTERVAL"] = int(os.getenv("MOVE_SNAPSHOT_INTERVAL", 50))
+# Seconds that replaying the moves since the last snapshot may take before a save snapshots early.
+app.config["MOVE_SNAPSHOT_SECONDS"] = float(os.getenv("MOVE_SNAPSHOT_SECONDS", 0.05))
+# Encoded GET /games/<id> responses kept per game version and viewport, 0 disables it.
+app.config["ENCODED_GAME_CACHE_SIZE"] = int(os.getenv("ENCODED_GAME_CACHE_SIZE", 1024))
+# Worker processes searching for no-guess boards (1 searches in the request thread), and the
+# seconds they may take before the game gets an ordinary board.
+app.config["NO_GUESS_PROCESSES"] = int(os.getenv("NO_GUESS_PROCESSES", os.cpu_count() or 1))
+app.config["NO_GUESS_BUDGET"] = float(os.getenv("NO_GUESS_BUDGET", 2.0))
+# Solved hints kept per game version and viewport, 0 disables it.
+app.config["HINT_CACHE_SIZE"] = int(os.getenv("HINT_CACHE_SIZE", 256))
+# Seconds the solver may spend on a hint before answering with what it found so far.
+app.config["HINT_TIME_BUDGET"] = float(os.getenv("HINT_TIME_BUDGET", 0.2))
+# Seconds between keepalive comments on idle game event streams.
+app.config["EVENTS_KEEPALIVE_SECONDS"] = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", 15))
+# How many times a move is replayed on a fresh copy of the game when another request saved it first.
+app.config["GAME_UPDATE_RETRIES"] = int(os.getenv("GAME_UPDATE_RETRIES", 3))
+# Request stage timings and counters served on /metrics, off by default.
+app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+# When set, a PROFILE_SAMPLE_RATE share of requests is profiled into this directory.
+app.config["PROFILE_DIR"] = os.getenv("PROFILE_DIR")
+app.config["PROFILE_SAMPLE_RATE"] = float(os.getenv("PROFILE_SAMPLE_RATE", 0.01))
+# Response compression in order of preference (br needs the brotli package), empty disables it.
+app.config["RESPONSE_COMPRESSION"] = [name.strip() for name in os.getenv("RESPONSE_COMPRESSION", "br,gzip").split(",")
+                                      if name.strip()]
+app.config["COMPRESS_MIN_BYTES"] = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+app.config["COMPRESS_LEVEL"] = int(os.getenv("COMPRESS_LEVEL", 6))
+# Per-backend database tuning, see storage.py. Each setting only applies to its backend.
+app.config["SQLITE_JOURNAL_MODE"] = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+app.config["SQLITE_SYNCHRONOUS"] = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+app.config["DB_POOL_SIZE"] = int(os.getenv("DB_POOL_SIZE", 10))
+app.config["DB_MAX_OVERFLOW"] = int(os.getenv("DB_MAX_OVERFLOW", 20))
+app.config["DB_POOL_TIMEOUT"] = float(os.getenv("DB_POOL_TIMEOUT", 30))
+app.config["DB_POOL_RECYCLE"] = int(os.getenv("DB_POOL_RECYCLE", 1800))
+app.config["DB_STATEMENT_CACHE_SIZE"] = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500))
+app.config["DB_PREPARE_THRESHOLD"] = int(os.getenv("DB_PREPARE_THRESHOLD", 5))
+
+# Tokens are only ever issued and accepted with this algorithm.
+JWT_ALGORITHM = "HS256"
+JWT_ALGORITHMS = [JWT_ALGORITHM]
+
+configure_storage(app)
 db.init_app(app)
 CORS(app)
 
+token_cache = TokenCache(app.config["TOKEN_CACHE_SIZE"], app.config["TOKEN_CACHE_TTL_SECONDS"])
+
+metrics.enabled = app.config["METRICS_ENABLED"]
+profiler = None
+if app.config["PROFILE_DIR"]:
+   profiler = RequestProfiler(app.config["PROFILE_DIR"], app.config["PROFILE_SAMPLE_RATE"])
+
+@app.before_request
+def start_request_metrics():
+   g.request_start = time.perf_counter()
+   if profiler is not None:
+      g.profile = (profiler, profiler.start())
+
+def request_route():
+   return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+def finish_request_profile():
+   request_profiler, profile = g.pop("profile", (None, None))
+   if profile is not None:
+      request_profiler.finish(profile, f"{request.method} {request_route()}")
+
+@app.after_request
+def finish_request_metrics(response):
+   if "request_start" in g:
+      metrics.observe("request_seconds", time.perf_counter() - g.request_start,
+                      route=request_route(), method=request.method, status=response.status_code)
+   finish_request_profile()
+   return response
+
+def jsonify(data):
+   """Flask's jsonify, with orjson when it is installed."""
+   return app.response_class(encoding.dumps(data), mimetype=app.config["JSONIFY_MIMETYPE"])
+
+def response_encoding(size: int, headers=None):
+   """The compression to send a body of size bytes with, or None."""
+   if size < app.config["COMPRESS_MIN_BYTES"]:
+      return None
+   headers = request.headers if headers is None else headers
+   return encoding.choose_encoding(headers.get("Accept-Encoding", ""),
+                                   encoding.supported_encodings(app.config["RESPONSE_COMPRESSION"]))
+
+def set_content_encoding(response, content_encoding):
+   response.headers["Content-Encoding"] = content_encoding
+   response.vary.add("Accept-Encoding")
+   # The compressed body is another representation of the same game version.
+   etag, weak = response.get_etag()
+   if etag is not None and not weak:
+      response.set_etag(etag, weak=True)
+
+@app.after_request
+def compress_response(response):
+   if (response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers
+         or not response.is_json):
+      return response
+   body = response.get_data()
+   content_encoding = response_encoding(len(body))
+   if content_encoding is not None:
+      with metrics.stage("compress"):
+         response.set_data(encoding.compress(body, content_encoding, app.config["COMPRESS_LEVEL"]))
+      set_content_encoding(response, content_encoding)
+   else:
+      response.vary.add("Accept-Encoding")
+   return response
+
+@app.teardown_request
+def stop_request_profile(exception=None):
+   # after_request is skipped when a request fails, the profiler must not stay on for the thread.
+   finish_request_profile()
+
+@event.listens_for(User, "after_delete")
+def forget_deleted_user(mapper, connection, user):
+   token_cache.invalidate_user(user.email)
+
 def jwt_required(f):
    @wraps(f)
    def decorator(*args, **kwargs):
@@ -45,32 +192,277 @@ def jwt_required(f):
       if not token:
          return jsonify({"message": "Missing token."})
 
-      try:
-         algos = jwt.algorithms.get_default_algorithms()
-         data = jwt.decode(token, key=app.config["SECRET_KEY"], algorithms=algos)
-         current_user = User.query.filter_by(email=data["email"]).first()
-      except:
+      current_user = user_for_token(token)
+      if current_user is None:
          return {"message": "Invalid token."}, 401
 
       return f(current_user, *args, **kwargs)
    return decorator
 
+def user_for_token(token: str):
+   """Returns the CurrentUser a token was issued to, or None if it is invalid or the user is gone."""
+   current_user = token_cache.get(token)
+   if current_user is None:
+      try:
+         with metrics.stage("jwt_decode"):
+            data = jwt.decode(token, key=app.config["SECRET_KEY"], algorithms=JWT_ALGORITHMS)
+         with metrics.stage("user_lookup"):
+            user = User.query.filter_by(email=data["email"]).first()
+      except:
+         return None
+      if not user:
+         return None
+      current_user = CurrentUser(user.id, user.email)
+      token_cache.put(token, current_user, data.get("exp"))
+   return current_user
+
+def ensure_board_pool():
+   """Starts filling the board pool, if there is one. Games take pooled boards on their first clear."""
+   if board_pool is not None:
+      board_pool.start()
+
 def find_game(user_id: int, game_id: int):
-   game = Game.query.filter(and_(Game.id==game_id, Game.user_id==user_id)).first()
+   with metrics.stage("find_game"):
+      game = Game.query.filter(and_(Game.id==game_id, Game.user_id==user_id)).first()
    if not game:
       raise GameNotFoundException(None, f"Game with ID {game_id} not found.")
-   return game
+   with metrics.stage("catch_up"):
+      return move_log.catch_up(db.session, game)
 
-def update_game(user_id,game_id,game):
-   update_data = {
+def game_values(game, snapshot: bool = True):
+   """The columns a move can change, as written by update_game. The board is only written with snapshots."""
+   values = {
          "start_time": game.start_time,
          "end_time": game.end_time,
-         "board": game.board,
          "status": game.status,
-         "mines_left": game.mines_left
+         "mines_left": game.mines_left,
+         "mines": game.mines,
+         "flags": game.flags,
+         "covered_safe_cells": game.covered_safe_cells,
+         "version": game.version,
+         "sequence": game.sequence,
+         "snapshot_sequence": game.snapshot_sequence,
+         "mines_placed_at": game.mines_placed_at
       }
-   db.session.query(Game).filter(and_(Game.id==game_id, Game.user_id==user_id)).update(update_data)
-   db.session.commit()
+   if snapshot:
+      values["board"] = game.board
+   return values
+
+def update_game(user_id,game_id,game,expected_version=None):
+   """Saves the game: appends its unsaved moves to the move log and updates the games row,
+   with the board only when a snapshot is due. With expected_version the game is only saved
+   if it is still at that version and no other move was logged since it was loaded, otherwise
+   ConcurrentUpdateException is raised and nothing is written."""
+   expected_sequence = game.sequence
+   moves, snapshot, counters = move_log.prepare_save(game, app.config["MOVE_SNAPSHOT_INTERVAL"],
+                                                     app.config["MOVE_SNAPSHOT_SECONDS"])
+   update_data = dict(game_values(game, snapshot is not None), **counters)
+   query = db.session.query(Game).filter(and_(Game.id==game_id, Game.user_id==user_id))
+   if expected_version is not None:
+      query = query.filter(and_(Game.version==expected_version, Game.sequence==expected_sequence))
+   with metrics.stage("update_game"):
+      updated = query.update(update_data, synchronize_session=False)
+   if not updated and expected_version is not None:
+      db.session.rollback()
+      # Anything encoded from this copy of the game may be for a version that was never stored.
+      if encoded_games is not None:
+         encoded_games.invalidate(game.id)
+      if hints is not None:
+         hints.invalidate(game.id)
+      raise ConcurrentUpdateException(game, f"Game with ID {game_id} was changed by another request.")
+   try:
+      with metrics.stage("commit"):
+         move_log.write(db.session, moves, snapshot, game.mines_placed_at)
+         db.session.commit()
+   except Exception:
+      # E.g. the database is unreachable: nothing was written and the game can be saved again.
+      db.session.rollback()
+      raise
+   move_log.saved(game, counters)
+
+def persist_game(game, expected_version=None):
+   if has_app_context():
+      update_game(game.user_id, game.id, game, expected_version)
+   else:
+      with app.app_context():
+         update_game(game.user_id, game.id, game, expected_version)
+
+broker = LocalBroker()
+
+board_pool = None
+if app.config["BOARD_POOL_SIZE"] > 0:
+   # Started by the first new game rather than on import, see ensure_board_pool.
+   board_pool = BoardPool(app.config["BOARD_POOL_SETTINGS"], app.config["BOARD_POOL_SIZE"],
+                          app.config["BOARD_POOL_REFILL_BELOW"])
+   atexit.register(board_pool.stop)
+
+no_guess_generator = NoGuessGenerator(app.config["NO_GUESS_PROCESSES"], app.config["NO_GUESS_BUDGET"])
+atexit.register(no_guess_generator.stop)
+
+encoded_games = None
+if app.config["ENCODED_GAME_CACHE_SIZE"] > 0:
+   encoded_games = EncodedGameCache(app.config["ENCODED_GAME_CACHE_SIZE"])
+
+hints = None
+if app.config["HINT_CACHE_SIZE"] > 0:
+   hints = EncodedGameCache(app.config["HINT_CACHE_SIZE"])
+
+game_cache = None
+if app.config["GAME_CACHE_SIZE"] > 0:
+   game_cache = GameCache(persist_game, max_size=app.config["GAME_CACHE_SIZE"],
+                          idle_seconds=app.config["GAME_CACHE_IDLE_SECONDS"],
+                          flush_seconds=app.config["GAME_CACHE_FLUSH_SECONDS"])
+   game_cache.start()
+   atexit.register(game_cache.stop)
+
+@contextmanager
+def open_game(user_id: int, game_id, modify: bool = True):
+   """Yields a GameService for one of the user's games and, when modify is set, saves the game
+   once the block completes. Goes through the game cache when it is enabled."""
+   if game_cache is None:
+      game = find_game(user_id, game_id)
+      # Detached so only update_game writes it, and only if nobody saved the game in between.
+      db.session.expunge(game)
+      service = GameService(game, board_pool=board_pool, no_guess_generator=no_guess_generator)
+      yield service
+      if modify:
+         update_game(user_id, game_id, service.game, service.base_version)
+      return
+
+   try:
+      key = (user_id, int(game_id))
+   except ValueError:
+      raise GameNotFoundException(None, f"Game with ID {game_id} not found.")
+
+   def load():
+      game = find_game(user_id, game_id)
+      db.session.expunge(game)
+      return game
+
+   with game_cache.checkout(key, load, modify) as game:
+      yield GameService(game, board_pool=board_pool, no_guess_generator=no_guess_generator)
+
+def play_move(user_id: int, game_id, move, expected_version: int = None):
+   """Opens the game, runs move(service) and saves the game, returning what move returned.
+
+   When another request saved the game in the meantime the move is replayed on a fresh copy,
+   up to GAME_UPDATE_RETRIES times. Conditional moves, made with the version the client last
+   saw, are never replayed: ConcurrentUpdateException is raised if the game has moved on."""
+   attempts = 1 if expected_version is not None else app.config["GAME_UPDATE_RETRIES"] + 1
+   for attempt in range(attempts):
+      try:
+         with open_game(user_id, game_id) as service:
+            if expected_version is not None and service.game.version != expected_version:
+               raise ConcurrentUpdateException(service.game,
+                  f"Game with ID {game_id} is at version {service.game.version}, not {expected_version}.")
+            with metrics.stage("move"), move_log.replay_cost(service.game):
+               result = move(service)
+      except ConcurrentUpdateException:
+         if attempt == attempts - 1:
+            raise
+      else:
+         publish_changes(service)
+         return result
+
+def game_channel(game_id: int):
+   return f"games/{game_id}"
+
+def publish_changes(service):
+   """Sends the cells a saved move changed to the game's event streams."""
+   channel = game_channel(service.game.id)
+   if service.game.version != service.base_version and broker.has_subscribers(channel):
+      broker.publish(channel, {
+         "version": service.game.version,
+         "status": service.game.status,
+         "data": json.dumps(service.encode_game_delta())
+      })
+
+def requested_version(headers=None):
+   """Returns the game version a conditional move was made against, sent as If-Match, or None."""
+   headers = request.headers if headers is None else headers
+   value = headers.get("If-Match", "").strip()
+   if not value or value == "*":
+      return None
+   if value.startswith("W/"):
+      value = value[2:]
+   try:
+      return int(value.strip('"'))
+   except ValueError:
+      raise ValidationError({"If-Match": ["Must be a game version."]})
+
+def wants_delta(args=None, headers=None):
+   """Moves answer with only the changed cells when asked to with ?mode=delta or an X-Response-Mode: delta header."""
+   args = request.args if args is None else args
+   headers = request.headers if headers is None else headers
+   mode = args.get("mode") or headers.get("X-Response-Mode")
+   return mode == "delta"
+
+def requested_board_format(args=None):
+   """Returns the board_format asked for in the query string, "cells" by default."""
+   args = request.args if args is None else args
+   board_format = args.get("board_format", "cells")
+   if board_format not in encoding.BOARD_FORMATS:
+      raise ValidationError({"board_format": [f"Must be one of: {', '.join(encoding.BOARD_FORMATS)}."]})
+   return board_format
+
+def requested_viewport(args=None):
+   """Returns the (row, column, height, width) board window asked for in the query string, or None."""
+   args = request.args if args is None else args
+   keys = ("row", "column", "height", "width")
+   args = {key: args[key] for key in keys if key in args}
+   if not args:
+      return None
+   window = Viewport().load(args)
+   return tuple(window[key] for key in keys)
+
+def encode_move_result(service, viewport=None, board_format="cells", **extra):
+   with metrics.stage("encode"):
+      if wants_delta():
+         result = service.encode_game_delta()
+      else:
+         result = service.encode_game_info(viewport, board_format)
+      result.update(extra)
+      response = jsonify(result)
+   response.set_etag(str(service.game.version))
+   return response
+
+def encoded_game_info(service, viewport=None, board_format="cells", headers=None):
+   """Returns encode_game_info as JSON bytes, compressed when the request accepts it and the
+   body is large enough, and the Content-Encoding of the compression or None. Reuses the
+   body of the same game version, viewport, board format and compression when it is in the
+   encoded game cache."""
+   game = service.game
+   cached = cached_game_info(game, viewport, board_format, headers)
+   if cached is not None:
+      return cached
+   accepted = response_encoding(float("inf"), headers)
+   with metrics.stage("encode"):
+      body = encoding.dumps(service.encode_game_info(viewport, board_format))
+   content_encoding = accepted if len(body) >= app.config["COMPRESS_MIN_BYTES"] else None
+   if content_encoding is not None:
+      with metrics.stage("compress"):
+         body = encoding.compress(body, content_encoding, app.config["COMPRESS_LEVEL"])
+   if encoded_games is not None:
+      encoded_games.put(game.id, game.version, (viewport, board_format, accepted), (body, content_encoding))
+   return body, content_encoding
+
+def cached_game_info(game, viewport=None, board_format="cells", headers=None):
+   """Returns what encoded_game_info would from the encoded game cache, or None on a miss."""
+   if encoded_games is None:
+      return None
+   return encoded_games.get(game.id, game.version, (viewport, board_format, response_encoding(float("inf"), headers)))
+
+def game_hint(service, viewport=None):
+   """Returns service.hint, reusing the hint of the same game version and viewport when it is
+   in the hint cache."""
+   game = service.game
+   hint = hints.get(game.id, game.version, viewport) if hints is not None else None
+   if hint is None:
+      with metrics.stage("hint"):
+         hint = service.hint(viewport, app.config["HINT_TIME_BUDGET"])
+      if hints is not None:
+         hints.put(game.id, game.version, viewport, hint)
+   return hint
 
 @app.route("/register", methods=["POST"])
 def register():
@@ -114,7 +506,7 @@ def authenticate():
    
    user = User.query.filter_by(email=data["email"]).first()
    if user and check_password_hash(user.password,data["password"]):
-      token = jwt.encode({'email': user.email, 'exp' : datetime.datetime.utcnow() + datetime.timedelta(days=30)}, app.config['SECRET_KEY'])
+      token = jwt.encode({'email': user.email, 'exp' : datetime.datetime.utcnow() + datetime.timedelta(days=30)}, app.config['SECRET_KEY'], algorithm=JWT_ALGORITHM)
       return {'token' : token.decode('UTF-8')}
    else:
       return {"message": "Authentication failed."}, 401
@@ -133,6 +525,7 @@ def new_game(current_user):
 
    try:
       settings = schema.load(data)
+      board_format = requested_board_format()
    except ValidationError as err:
       return jsonify(err.messages), 400
 
@@ -140,15 +533,18 @@ def new_game(current_user):
    columns = settings["columns"]
    mines =  settings["mines"]
    
+   ensure_board_pool()
    service = GameService()
    try:
-      service.start_game(current_user.id, rows, columns, mines)
+      service.start_game(current_user.id, rows, columns, mines, settings["no_guess"])
       db.session.add(service.game)
+      db.session.flush()
+      move_log.write(db.session, [], move_log.snapshot_values(service.game))
       db.session.commit()
    except InvalidGameSettingsException as exc:
       return jsonify({"message": str(exc)}), 400
    
-   return jsonify(service.encode_game_info())
+   return jsonify(service.encode_game_info(board_format=board_format))
 
 @app.route("/games/<id>", methods=["GET"])
 @jwt_required
@@ -158,13 +554,49 @@ def retrieve_game(current_user, id):
    swagger_from_file: src/swagger/game_retrieve.yml
    """
    try:
-      game = find_game(current_user.id, id)
-      service = GameService(game)
+      viewport = requested_viewport()
+      board_format = requested_board_format()
+   except ValidationError as err:
+      return jsonify(err.messages), 400
+
+   try:
+      with open_game(current_user.id, id, modify=False) as service:
+         etag = str(service.game.version)
+         if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+         body, content_encoding = encoded_game_info(service, viewport, board_format)
+         response = app.response_class(body, mimetype=app.config["JSONIFY_MIMETYPE"])
+         response.set_etag(etag)
+         if content_encoding is not None:
+            set_content_encoding(response, content_encoding)
+         return response
    except GameNotFoundException as gnf:
       return jsonify({"message": str(gnf)}), 404
 
-   return jsonify(service.encode_game_info())
 
+@app.route("/games/<id>/hint", methods=["GET"])
+@jwt_required
+def game_hint_endpoint(current_user, id):
+   """
+   Cells of a game that are certainly safe or mines, and the mine probability of the others
+   swagger_from_file: src/swagger/game_hint.yml
+   """
+   try:
+      viewport = requested_viewport()
+   except ValidationError as err:
+      return jsonify(err.messages), 400
+
+   try:
+      with open_game(current_user.id, id, modify=False) as service:
+         response = jsonify(game_hint(service, viewport))
+         response.set_etag(str(service.game.version))
+         return response
+   except GameNotFoundException as gnf:
+      return jsonify({"message": str(gnf)}), 404
+   except InvalidClearException as exc:
+      return jsonify({"message": str(exc)}), 400
 
 @app.route("/games", methods=["GET"])
 @jwt_required
@@ -173,11 +605,38 @@ def list_games(current_user):
    List existing games for the current user
    swagger_from_file: src/swagger/game_list.yml
    """
-   games = Game.query.filter_by(user_id=current_user.id).all()
-   all_games = []
-   for game in games:
-      all_games.append({"id": game.id, "status": game.status})
-   return {"games": all_games}
+   schema = GameListQuery()
+   try:
+      params = schema.load(request.args)
+   except ValidationError as err:
+      return jsonify(err.messages), 400
+
+   games = db.session.execute(game_list_query(current_user.id, params)).all()
+   return jsonify(encode_game_list(games, params["limit"]))
+
+def game_list_query(user_id: int, params: dict):
+   """Selects the summary columns of one page of games, plus one row telling whether there is a next page."""
+   query = select(Game.id, Game.status, Game.start_time, Game.end_time, Game.rows, Game.columns)\
+      .where(Game.user_id==user_id)
+   if "status" in params:
+      query = query.where(Game.status==params["status"])
+   if "after" in params:
+      query = query.where(Game.id>params["after"])
+   return query.order_by(Game.id).limit(params["limit"] + 1)
+
+def encode_game_list(games, limit: int):
+   page = []
+   for game in games[:limit]:
+      page.append({
+         "id": game.id,
+         "status": game.status,
+         "start_time": game.start_time,
+         "end_time": game.end_time,
+         "rows": game.rows,
+         "columns": game.columns
+      })
+   next_cursor = page[-1]["id"] if len(games) > limit else None
+   return {"games": page, "next": next_cursor}
 
 
 @app.route("/games/<id>/clear", methods=["POST"])
@@ -189,24 +648,26 @@ def clear(current_user, id):
    """
    data = request.get_json(silent=True)
    schema = CellAction()
-   try:
-      game = find_game(current_user.id, id)
-      service = GameService(game)
-   except GameNotFoundException as gnf:
-      return jsonify({"message": str(gnf)}), 404
-
    try:
       coords = schema.load(data)
+      viewport = requested_viewport()
+      board_format = requested_board_format()
+      expected_version = requested_version()
    except ValidationError as err:
       return jsonify(err.messages), 400
-   
-   try:
+
+   def move(service):
       service.clear(coords["row"], coords["column"])
-      update_game(current_user.id, id, service.game)
+      return encode_move_result(service, viewport, board_format)
+
+   try:
+      return play_move(current_user.id, id, move, expected_version)
+   except GameNotFoundException as gnf:
+      return jsonify({"message": str(gnf)}), 404
    except InvalidClearException as exc:
       return jsonify({"message": str(exc)}), 400
-   
-   return jsonify(service.encode_game_info())
+   except ConcurrentUpdateException as exc:
+      return jsonify({"message": str(exc)}), 409
 
 
 @app.route("/games/<id>/toggle", methods=["POST"])
@@ -219,23 +680,181 @@ def toggle(current_user, id):
    data = request.get_json(silent=True)
    schema = CellAction()
    try:
-      game = find_game(current_user.id, id)
-      service = GameService(game)
+      coords = schema.load(data)
+      viewport = requested_viewport()
+      board_format = requested_board_format()
+      expected_version = requested_version()
+   except ValidationError as err:
+      return jsonify(err.messages), 400
+
+   def move(service):
+      service.toggle(coords["row"], coords["column"])
+      return encode_move_result(service, viewport, board_format)
+
+   try:
+      return play_move(current_user.id, id, move, expected_version)
    except GameNotFoundException as gnf:
       return jsonify({"message": str(gnf)}), 404
+   except InvalidClearException as exc:
+      return jsonify({"message": str(exc)}), 400
+   except ConcurrentUpdateException as exc:
+      return jsonify({"message": str(exc)}), 409
 
+@app.route("/games/<id>/chord", methods=["POST"])
+@jwt_required
+def chord(current_user, id):
+   """
+   Clear all the neighbors of a number whose mines are flagged
+   swagger_from_file: src/swagger/game_chord_cell.yml
+   """
+   data = request.get_json(silent=True)
+   schema = CellAction()
    try:
       coords = schema.load(data)
+      viewport = requested_viewport()
+      board_format = requested_board_format()
+      expected_version = requested_version()
    except ValidationError as err:
       return jsonify(err.messages), 400
-   
+
+   def move(service):
+      service.chord(coords["row"], coords["column"])
+      return encode_move_result(service, viewport, board_format)
+
    try:
-      service.toggle(coords["row"], coords["column"])
-      update_game(current_user.id, id, service.game)
+      return play_move(current_user.id, id, move, expected_version)
+   except GameNotFoundException as gnf:
+      return jsonify({"message": str(gnf)}), 404
    except InvalidClearException as exc:
       return jsonify({"message": str(exc)}), 400
-   
-   return jsonify(service.encode_game_info())
+   except ConcurrentUpdateException as exc:
+      return jsonify({"message": str(exc)}), 409
+
+@app.route("/games/<id>/moves", methods=["POST"])
+@jwt_required
+def moves(current_user, id):
+   """
+   Apply several moves at once
+   swagger_from_file: src/swagger/game_moves.yml
+   """
+   data = request.get_json(silent=True)
+   schema = MoveBatch()
+   try:
+      batch = schema.load(data)
+      viewport = requested_viewport()
+      board_format = requested_board_format()
+      expected_version = requested_version()
+   except ValidationError as err:
+      return jsonify(err.messages), 400
+
+   def move(service):
+      applied = service.apply_moves(batch["moves"])
+      return encode_move_result(service, viewport, board_format, applied=applied)
+
+   try:
+      return play_move(current_user.id, id, move, expected_version)
+   except GameNotFoundException as gnf:
+      return jsonify({"message": str(gnf)}), 404
+   except InvalidClearException as exc:
+      return jsonify({"message": str(exc)}), 400
+   except ConcurrentUpdateException as exc:
+      return jsonify({"message": str(exc)}), 409
+
+@app.route("/games/<id>/events", methods=["GET"])
+def game_events(id):
+   """
+   Stream a game's changes
+   swagger_from_file: src/swagger/game_events.yml
+   """
+   # EventSource cannot send headers, so the token may also come in the query string.
+   token = request.headers.get("x-access-tokens") or request.args.get("token")
+   if not token:
+      return jsonify({"message": "Missing token."}), 401
+   current_user = user_for_token(token)
+   if current_user is None:
+      return jsonify({"message": "Invalid token."}), 401
+
+   try:
+      viewport = requested_viewport()
+   except ValidationError as err:
+      return jsonify(err.messages), 400
+
+   # Moves publish on the numeric id, whatever form it took in the URL (e.g. "05").
+   try:
+      channel = game_channel(int(id))
+   except ValueError:
+      return jsonify({"message": f"Game with ID {id} not found."}), 404
+   # Subscribed before loading the game so no move falls in between.
+   messages = queue.Queue()
+   unsubscribe = broker.subscribe(channel, messages.put)
+   try:
+      with open_game(current_user.id, id, modify=False) as service:
+         game = service.game
+         state = json.dumps(service.encode_game_info(viewport))
+   except GameNotFoundException as gnf:
+      unsubscribe()
+      return jsonify({"message": str(gnf)}), 404
+
+   response = app.response_class(stream_with_context(event_stream(messages, state, game.version, game.status)),
+                                 mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+   response.call_on_close(unsubscribe)
+   return response
+
+def event_stream(messages: queue.Queue, state: str, version: int, status: str):
+   """Yields a "state" event with the game, then a "delta" event per change until the game ends."""
+   yield f"event: state\ndata: {state}\n\n"
+   while status == "started":
+      try:
+         message = messages.get(timeout=app.config["EVENTS_KEEPALIVE_SECONDS"])
+      except queue.Empty:
+         yield ": keepalive\n\n"
+         continue
+      if message["version"] <= version:
+         continue
+      version = message["version"]
+      status = message["status"]
+      yield f"event: delta\ndata: {message['data']}\n\n"
+
+@app.cli.command("upgrade-db")
+def upgrade_db():
+   """Create missing tables and migrate stored data to the current format."""
+   for name, result in migrations.upgrade():
+      print(f"{name}: {result}")
+
+@app.cli.command("rebuild-game")
+@click.argument("game_id", type=int)
+@click.option("--sequence", type=int, help="Stop after this move instead of the last one.")
+def rebuild_game(game_id, sequence):
+   """Replay a game from its first snapshot and check it against the stored game."""
+   game = move_log.rebuild(db.session, game_id, sequence)
+   if game is None:
+      print(f"Game with ID {game_id} has no snapshots.")
+      return
+   print(f"Replayed up to move {game.sequence}: {game.status}, version {game.version}, {game.mines_left} mines left")
+   if sequence is None:
+      stored = find_game(game.user_id, game_id)
+      matches = game.board == stored.board and all(getattr(game, column) == getattr(stored, column)
+                                                   for column in move_log.SNAPSHOT_COLUMNS)
+      print("Matches the stored game." if matches else "Does NOT match the stored game.")
+
+def metrics_gauges():
+   """Samples read at scrape time from the parts of the app that keep their own counts."""
+   gauges = []
+   if board_pool is not None:
+      stats = board_pool.stats()
+      for setting, counts in stats["settings"].items():
+         for name, value in counts.items():
+            gauges.append((f"board_pool_{name}", {"setting": setting}, value))
+   if game_cache is not None:
+      gauges.append(("game_cache_games", {}, len(game_cache)))
+   return gauges
+
+@app.route("/metrics")
+def metrics_endpoint():
+   """Stage timings and counters in the Prometheus text format, when METRICS_ENABLED is set."""
+   if not metrics.enabled:
+      return {"message": "Metrics are disabled."}, 404
+   return metrics.render(metrics_gauges()), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
 
 @app.route("/spec")
 def spec():
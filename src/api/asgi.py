@@ -0,0 +1,526 @@
+"""ASGI serving mode: the game API on Starlette with an async database driver.
+
+Run it from src/api with ``uvicorn asgi:app``. It serves the same routes, settings and
+responses as the Flask app and shares its helpers, but a worker keeps serving other
+requests while one waits for the database. Moves on one game are applied one at a time
+inside a worker, and the version check of update_game keeps workers from overwriting
+each other. The write-behind game cache and the request profiler are Flask only features.
+"""
+import asyncio
+import datetime
+import time
+from contextlib import asynccontextmanager
+from functools import wraps
+
+import jwt
+from flask import json
+from flask_swagger import swagger
+from marshmallow import ValidationError
+from sqlalchemy import and_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.security import generate_password_hash, check_password_hash
+
+import app as flask_app
+from models import User, Game
+from schemas.user_registration import UserRegistration
+from schemas.authentication import Authentication
+from schemas.cell_action import CellAction
+from schemas.game_settings import GameSettings
+from schemas.move_batch import MoveBatch
+from schemas.game_list_query import GameListQuery
+from services.game_service import GameService
+from services import move_log
+from services.metrics import metrics
+from services import encoding
+from services.token_cache import CurrentUser
+from storage import create_async_database
+from exceptions import InvalidClearException, GameNotFoundException, InvalidGameSettingsException, ConcurrentUpdateException
+
+config = flask_app.app.config
+token_cache = flask_app.token_cache
+
+
+class FlaskJSONResponse(JSONResponse):
+    """Encodes like jsonify does, e.g. datetimes as HTTP dates."""
+
+    def render(self, content):
+        return encoding.dumps(content)
+
+
+class CompressResponses:
+    """ASGI middleware compressing JSON responses like the Flask app's compress_response.
+    Streamed responses and responses that are already compressed go out as they are."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is not None:
+                if message["type"] == "http.response.body" and not message.get("more_body"):
+                    message = self.compress(start, message, request_headers)
+                await send(start)
+                start = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    def compress(self, start, message, request_headers):
+        headers = MutableHeaders(scope=start)
+        if "content-encoding" in headers or not headers.get("content-type", "").startswith("application/json"):
+            return message
+        headers.add_vary_header("Accept-Encoding")
+        body = message.get("body", b"")
+        content_encoding = flask_app.response_encoding(len(body), request_headers)
+        if content_encoding is None:
+            return message
+        with metrics.stage("compress"):
+            body = encoding.compress(body, content_encoding, config["COMPRESS_LEVEL"])
+        set_content_encoding(headers, content_encoding)
+        headers["content-length"] = str(len(body))
+        return dict(message, body=body)
+
+
+def set_content_encoding(headers, content_encoding):
+    headers["content-encoding"] = content_encoding
+    headers.add_vary_header("Accept-Encoding")
+    etag = headers.get("etag")
+    if etag is not None and not etag.startswith("W/"):
+        headers["etag"] = f"W/{etag}"
+
+
+class RequestMetrics:
+    """ASGI middleware observing request_seconds like the Flask app's request hooks do."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = []
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            route = scope.get("route")
+            metrics.observe("request_seconds", time.perf_counter() - start,
+                            route=route.path if route is not None else "unmatched", method=scope["method"],
+                            status=status[0] if status else 500)
+
+
+class GameLocks:
+    """One asyncio lock per game, dropped once nobody holds or waits for it."""
+
+    def __init__(self):
+        self._locks = {}
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key):
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+
+engine = create_async_database(config)
+Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+game_locks = GameLocks()
+
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def jwt_required(endpoint):
+    @wraps(endpoint)
+    async def decorator(request):
+        token = request.headers.get("x-access-tokens")
+        if not token:
+            return FlaskJSONResponse({"message": "Missing token."})
+
+        current_user = await user_for_token(token)
+        if current_user is None:
+            return FlaskJSONResponse({"message": "Invalid token."}, 401)
+
+        return await endpoint(request, current_user)
+    return decorator
+
+
+async def user_for_token(token: str):
+    current_user = token_cache.get(token)
+    if current_user is None:
+        try:
+            with metrics.stage("jwt_decode"):
+                data = jwt.decode(token, key=config["SECRET_KEY"], algorithms=flask_app.JWT_ALGORITHMS)
+            with metrics.stage("user_lookup"):
+                async with Session() as session:
+                    user = (await session.execute(select(User.id, User.email).where(User.email==data["email"]))).first()
+        except Exception:
+            return None
+        if not user:
+            return None
+        current_user = CurrentUser(user.id, user.email)
+        token_cache.put(token, current_user, data.get("exp"))
+    return current_user
+
+
+async def find_game(session, user_id: int, game_id: int):
+    with metrics.stage("find_game"):
+        game = (await session.execute(select(Game).where(and_(Game.id==game_id, Game.user_id==user_id)))).scalar()
+    if not game:
+        raise GameNotFoundException(None, f"Game with ID {game_id} not found.")
+    with metrics.stage("catch_up"):
+        snapshot, moves = await session.run_sync(move_log.logged_since_snapshot, game)
+        # Detached so only update_game writes it.
+        session.expunge(game)
+        if snapshot is not None:
+            # Replaying can take a while on large boards, it must not stall the event loop.
+            await run_in_threadpool(move_log.replay_since, game, snapshot, moves)
+    return game
+
+
+async def update_game(session, user_id: int, game_id: int, game, expected_version: int):
+    """Async update_game of the Flask app."""
+    expected_sequence = game.sequence
+    moves, snapshot, counters = move_log.prepare_save(game, config["MOVE_SNAPSHOT_INTERVAL"], config["MOVE_SNAPSHOT_SECONDS"])
+    query = update(Game).where(and_(Game.id==game_id, Game.user_id==user_id, Game.version==expected_version,
+                                    Game.sequence==expected_sequence))\
+        .values(**dict(flask_app.game_values(game, snapshot is not None), **counters))\
+        .execution_options(synchronize_session=False)
+    with metrics.stage("update_game"):
+        updated = (await session.execute(query)).rowcount
+    if not updated:
+        await session.rollback()
+        if flask_app.encoded_games is not None:
+            flask_app.encoded_games.invalidate(game.id)
+        if flask_app.hints is not None:
+            flask_app.hints.invalidate(game.id)
+        raise ConcurrentUpdateException(game, f"Game with ID {game_id} was changed by another request.")
+    with metrics.stage("commit"):
+        await session.run_sync(move_log.write, moves, snapshot, game.mines_placed_at)
+        await session.commit()
+    move_log.saved(game, counters)
+
+
+async def play_move(user_id: int, game_id: int, move, expected_version: int = None):
+    """play_move of the Flask app. move(service) runs on a worker thread so a large flood
+    fill does not stall the event loop, while the game lock keeps moves on this game in order."""
+    attempts = 1 if expected_version is not None else config["GAME_UPDATE_RETRIES"] + 1
+    async with game_locks.hold((user_id, game_id)):
+        for attempt in range(attempts):
+            try:
+                async with Session() as session:
+                    service = GameService(await find_game(session, user_id, game_id), board_pool=flask_app.board_pool,
+                                          no_guess_generator=flask_app.no_guess_generator)
+                    if expected_version is not None and service.game.version != expected_version:
+                        raise ConcurrentUpdateException(service.game,
+                            f"Game with ID {game_id} is at version {service.game.version}, not {expected_version}.")
+                    with metrics.stage("move"), move_log.replay_cost(service.game):
+                        result = await run_in_threadpool(move, service)
+                    await update_game(session, user_id, game_id, service.game, service.base_version)
+            except ConcurrentUpdateException:
+                if attempt == attempts - 1:
+                    raise
+            else:
+                flask_app.publish_changes(service)
+                return result
+
+
+def encode_move_result(request, service, viewport=None, board_format="cells", **extra):
+    with metrics.stage("encode"):
+        if flask_app.wants_delta(request.query_params, request.headers):
+            result = service.encode_game_delta()
+        else:
+            result = service.encode_game_info(viewport, board_format)
+        result.update(extra)
+        return FlaskJSONResponse(result, headers={"ETag": f'"{service.game.version}"'})
+
+
+async def register(request):
+    data = await json_body(request)
+    try:
+        UserRegistration().load(data)
+    except ValidationError as err:
+        return FlaskJSONResponse(err.messages, 400)
+
+    hashed_password = await run_in_threadpool(generate_password_hash, data["password"], method="sha256")
+    async with Session() as session:
+        try:
+            user = User(email=data["email"], password=hashed_password)
+            session.add(user)
+            await session.commit()
+        except IntegrityError:
+            return FlaskJSONResponse({"email": "That email is already registered."}, 400)
+        user_data = {"id": user.id, "email": user.email}
+    return FlaskJSONResponse({"message": "Registered successfully", "user": user_data})
+
+
+async def authenticate(request):
+    data = await json_body(request)
+    try:
+        Authentication().load(data)
+    except ValidationError as err:
+        return FlaskJSONResponse(err.messages, 400)
+
+    async with Session() as session:
+        user = (await session.execute(select(User.email, User.password).where(User.email==data["email"]))).first()
+    if user and await run_in_threadpool(check_password_hash, user.password, data["password"]):
+        token = jwt.encode({"email": user.email, "exp": datetime.datetime.utcnow() + datetime.timedelta(days=30)},
+                           config["SECRET_KEY"], algorithm=flask_app.JWT_ALGORITHM)
+        return FlaskJSONResponse({"token": token.decode("UTF-8")})
+    return FlaskJSONResponse({"message": "Authentication failed."}, 401)
+
+
+@jwt_required
+async def new_game(request, current_user):
+    try:
+        settings = GameSettings().load(await json_body(request))
+        board_format = flask_app.requested_board_format(request.query_params)
+    except ValidationError as err:
+        return FlaskJSONResponse(err.messages, 400)
+
+    flask_app.ensure_board_pool()
+    service = GameService()
+    try:
+        service.start_game(current_user.id, settings["rows"], settings["columns"], settings["mines"],
+                           settings["no_guess"])
+    except InvalidGameSettingsException as exc:
+        return FlaskJSONResponse({"message": str(exc)}, 400)
+    async with Session() as session:
+        session.add(service.game)
+        await session.flush()
+        await session.run_sync(move_log.write, [], move_log.snapshot_values(service.game))
+        await session.commit()
+    return FlaskJSONResponse(service.encode_game_info(board_format=board_format))
+
+
+@jwt_required
+async def retrieve_game(request, current_user):
+    try:
+        viewport = flask_app.requested_viewport(request.query_params)
+        board_format = flask_app.requested_board_format(request.query_params)
+    except ValidationError as err:
+        return FlaskJSONResponse(err.messages, 400)
+
+    try:
+        async with Session() as session:
+            service = GameService(await find_game(session, current_user.id, request.path_params["id"]))
+    except GameNotFoundException as gnf:
+        return FlaskJSONResponse({"message": str(gnf)}, 404)
+
+    etag = f'"{service.game.version}"'
+    if etag in (tag.strip().removeprefix("W/") for tag in request.headers.get("If-None-Match", "").split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+    encoded = flask_app.cached_game_info(service.game, viewport, board_format, request.headers)
+    if encoded is None:
+        encoded = await run_in_threadpool(flask_app.encoded_game_info, service, viewport, board_format, request.headers)
+    body, content_encoding = encoded
+    response = Response(body, media_type="application/json", headers={"ETag": etag})
+    if content_encoding is not None:
+        set_content_encoding(response.headers, content_encoding)
+    return response
+
+
+@jwt_required
+async def game_hint(request, current_user):
+    try:
+        viewport = flask_app.requested_viewport(request.query_params)
+    except ValidationError as err:
+        return FlaskJSONResponse(err.messages, 400)
+
+    try:
+        async with Session() as session:
+            service = GameService(await find_game(session, current_user.id, request.path_params["id"]))
+    except GameNotFoundException as gnf:
+        return FlaskJSONResponse({"message": str(gnf)}, 404)
+
+    try:
+        # The solver is CPU bound, it must not hold up the event loop.
+        hint = await run_in_threadpool(flask_app.game_hint, service, viewport)
+    except InvalidClearException as exc:
+        return FlaskJSONResponse({"message": str(exc)}, 400)
+    return FlaskJSONResponse(hint, headers={"ETag": f'"{service.game.version}"'})
+
+
+@jwt_required
+async def list_games(request, current_user):
+    try:
+        params = GameListQuery().load(request.query_params)
+    except ValidationError as err:
+        return FlaskJSONResponse(err.messages, 400)
+
+    async with Session() as session:
+        games = (await session.execute(flask_app.game_list_query(current_user.id, params))).all()
+    return FlaskJSONResponse(flask_app.encode_game_list(games, params["limit"]))
+
+
+def move_endpoint(schema, apply):
+    """Builds a move route: loads the body with schema and runs apply(service, body) through
+    play_move. Whatever apply returns is added to the response."""
+    @jwt_required
+    async def endpoint(request, current_user):
+        try:
+            body = schema().load(await json_body(request))
+            viewport = flask_app.requested_viewport(request.query_params)
+            board_format = flask_app.requested_board_format(request.query_params)
+            expected_version = flask_app.requested_version(request.headers)
+        except ValidationError as err:
+            return FlaskJSONResponse(err.messages, 400)
+
+        def move(service):
+            extra = apply(service, body) or {}
+            return encode_move_result(request, service, viewport, board_format, **extra)
+
+        try:
+            return await play_move(current_user.id, request.path_params["id"], move, expected_version)
+        except GameNotFoundException as gnf:
+            return FlaskJSONResponse({"message": str(gnf)}, 404)
+        except InvalidClearException as exc:
+            return FlaskJSONResponse({"message": str(exc)}, 400)
+        except ConcurrentUpdateException as exc:
+            return FlaskJSONResponse({"message": str(exc)}, 409)
+    return endpoint
+
+
+async def game_events(request):
+    """game_events of the Flask app."""
+    token = request.headers.get("x-access-tokens") or request.query_params.get("token")
+    if not token:
+        return FlaskJSONResponse({"message": "Missing token."}, 401)
+    current_user = await user_for_token(token)
+    if current_user is None:
+        return FlaskJSONResponse({"message": "Invalid token."}, 401)
+
+    try:
+        viewport = flask_app.requested_viewport(request.query_params)
+    except ValidationError as err:
+        return FlaskJSONResponse(err.messages, 400)
+
+    game_id = request.path_params["id"]
+    async with Session() as session:
+        query = select(Game.id).where(and_(Game.id==game_id, Game.user_id==current_user.id))
+        found = (await session.execute(query)).scalar()
+    if found is None:
+        return FlaskJSONResponse({"message": f"Game with ID {game_id} not found."}, 404)
+
+    async def stream():
+        # Subscribed once the response is sent, so one that never is holds no subscription, and
+        # before loading the game so no move falls in between.
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue()
+        unsubscribe = flask_app.broker.subscribe(flask_app.game_channel(game_id),
+                                                 lambda message: loop.call_soon_threadsafe(messages.put_nowait, message))
+        try:
+            async with Session() as session:
+                service = GameService(await find_game(session, current_user.id, game_id))
+            version, status = service.game.version, service.game.status
+            yield f"event: state\ndata: {json.dumps(service.encode_game_info(viewport))}\n\n"
+            while status == "started":
+                try:
+                    message = await asyncio.wait_for(messages.get(), config["EVENTS_KEEPALIVE_SECONDS"])
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if message["version"] <= version:
+                    continue
+                version = message["version"]
+                status = message["status"]
+                yield f"event: delta\ndata: {message['data']}\n\n"
+        finally:
+            unsubscribe()
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+async def metrics_endpoint(request):
+    if not metrics.enabled:
+        return FlaskJSONResponse({"message": "Metrics are disabled."}, 404)
+    return PlainTextResponse(metrics.render(flask_app.metrics_gauges()),
+                             headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def spec(request):
+    swag = swagger(flask_app.app, from_file_keyword="swagger_from_file")
+    swag["info"]["version"] = "1.0"
+    swag["info"]["title"] = "Mine Sweeper API"
+    return FlaskJSONResponse(swag)
+
+
+def clear_cell(service, cell):
+    service.clear(cell["row"], cell["column"])
+
+def toggle_cell(service, cell):
+    service.toggle(cell["row"], cell["column"])
+
+def chord_cell(service, cell):
+    service.chord(cell["row"], cell["column"])
+
+def apply_moves(service, batch):
+    return {"applied": service.apply_moves(batch["moves"])}
+
+
+routes = [
+    Route("/register", register, methods=["POST"]),
+    Route("/authenticate", authenticate, methods=["POST"]),
+    Route("/games", new_game, methods=["POST"]),
+    Route("/games", list_games, methods=["GET"]),
+    Route("/games/{id:int}", retrieve_game, methods=["GET"]),
+    Route("/games/{id:int}/clear", move_endpoint(CellAction, clear_cell), methods=["POST"]),
+    Route("/games/{id:int}/toggle", move_endpoint(CellAction, toggle_cell), methods=["POST"]),
+    Route("/games/{id:int}/chord", move_endpoint(CellAction, chord_cell), methods=["POST"]),
+    Route("/games/{id:int}/moves", move_endpoint(MoveBatch, apply_moves), methods=["POST"]),
+    Route("/games/{id:int}/hint", game_hint, methods=["GET"]),
+    Route("/games/{id:int}/events", game_events),
+    Route("/metrics", metrics_endpoint),
+    Route("/spec", spec),
+]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.dispose()
+
+
+app = Starlette(routes=routes, lifespan=lifespan, middleware=[Middleware(RequestMetrics), Middleware(CompressResponses)])
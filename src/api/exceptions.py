@@ -10,4 +10,7 @@ class GameNotFoundException(GameException):
     pass
 
 class InvalidGameSettingsException(GameException):
-    pass
\ No newline at end of file
+    pass
+
+class ConcurrentUpdateException(GameException):
+    pass
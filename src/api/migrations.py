@@ -0,0 +1,142 @@
+"""Idempotent schema and data migrations, applied in order by ``flask upgrade-db``."""
+import datetime
+
+from sqlalchemy import and_, exists, insert, inspect, select, text, update
+
+from models import db, Game, Snapshot
+from services import move_log
+from services.board import load_board, FLAGGED
+
+
+def add_column(connection, table: str, column: str, ddl: str):
+    """Adds a column unless it already exists. Returns True when the table was altered."""
+    if column in {c["name"] for c in inspect(connection).get_columns(table)}:
+        return False
+    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def pack_legacy_boards(connection):
+    """Rewrites boards stored in the old JSON format into the packed binary format."""
+    if connection.dialect.name == "postgresql":
+        column_type = connection.execute(text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = 'games' AND column_name = 'board'")).scalar()
+        if column_type in ("json", "jsonb"):
+            connection.execute(text(
+                "ALTER TABLE games ALTER COLUMN board TYPE bytea USING convert_to(board::text, 'UTF8')"))
+
+    converted = 0
+    for game_id, board in connection.execute(text("SELECT id, board FROM games")).fetchall():
+        if isinstance(board, str) or bytes(board)[:1] == b"[":
+            connection.execute(text("UPDATE games SET board = :board WHERE id = :id"),
+                               {"board": load_board(board).to_bytes(), "id": game_id})
+            converted += 1
+    return converted
+
+
+def add_game_counters(connection):
+    """Adds the incrementally maintained mines/flags/covered_safe_cells counters and backfills them."""
+    for column in ("mines", "flags", "covered_safe_cells"):
+        add_column(connection, "games", column, "INTEGER")
+
+    backfilled = 0
+    rows = connection.execute(text("SELECT id, board FROM games WHERE covered_safe_cells IS NULL")).fetchall()
+    for game_id, board in rows:
+        board = load_board(board)
+        connection.execute(text("UPDATE games SET mines = :mines, flags = :flags, "
+                                "covered_safe_cells = :covered WHERE id = :id"),
+                           {"mines": board.count_mines(), "flags": board.count_status(FLAGGED),
+                            "covered": board.covered_safe_cells(), "id": game_id})
+        backfilled += 1
+    return backfilled
+
+
+def add_board_version(connection):
+    return add_column(connection, "games", "version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def add_game_list_indexes(connection):
+    existing = {index["name"] for index in inspect(connection).get_indexes("games")}
+    created = 0
+    for index in Game.__table__.indexes:
+        if index.name not in existing:
+            index.create(connection)
+            created += 1
+    return created
+
+
+def add_move_log(connection):
+    """Adds the move log counters to games and a first snapshot for games that have none,
+    so every game can be rebuilt from its snapshots and moves."""
+    for column in ("sequence", "snapshot_sequence"):
+        add_column(connection, "games", column, "INTEGER NOT NULL DEFAULT 0")
+
+    columns = [Game.__table__.c[column] for column in ("id", "board") + move_log.SNAPSHOT_COLUMNS]
+    games = connection.execute(select(*columns).where(~exists().where(Snapshot.game_id==Game.id))).fetchall()
+    for game in games:
+        values = {column: game[column] for column in move_log.SNAPSHOT_COLUMNS}
+        connection.execute(insert(Snapshot), [dict(values, game_id=game.id, sequence=0, board=game.board,
+                                                   created_at=datetime.datetime.utcnow())])
+    return len(games)
+
+
+def add_lazy_mine_placement(connection):
+    """Adds mines_placed_at. Existing games had their mines placed when they were created."""
+    if not add_column(connection, "games", "mines_placed_at", "INTEGER"):
+        return 0
+    return connection.execute(text("UPDATE games SET mines_placed_at = 0")).rowcount
+
+
+def add_no_guess(connection):
+    return add_column(connection, "games", "no_guess", "BOOLEAN NOT NULL DEFAULT FALSE")
+
+
+def slim_snapshots(connection):
+    """Lets snapshots go without a board, then prunes every game's snapshots to the ones
+    move_log keeps and drops the latest one's board where the games row has it. Returns how
+    many snapshots were deleted."""
+    board = next(column for column in inspect(connection).get_columns("snapshots") if column["name"] == "board")
+    if board["nullable"]:
+        return 0
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("ALTER TABLE snapshots ALTER COLUMN board DROP NOT NULL"))
+    else:
+        # SQLite cannot drop a constraint, the table is copied into a new one.
+        connection.execute(text("ALTER TABLE snapshots RENAME TO snapshots_old"))
+        Snapshot.__table__.create(connection)
+        columns = ", ".join(column.name for column in Snapshot.__table__.columns)
+        connection.execute(text(f"INSERT INTO snapshots ({columns}) SELECT {columns} FROM snapshots_old"))
+        connection.execute(text("DROP TABLE snapshots_old"))
+
+    pruned = 0
+    for game_id, placed_at, latest in connection.execute(select(Game.id, Game.mines_placed_at, Game.snapshot_sequence)).fetchall():
+        pruned += move_log.prune(connection, game_id, latest, placed_at)
+        earlier = connection.execute(select(Snapshot.sequence).where(and_(Snapshot.game_id==game_id,
+                                                                          Snapshot.sequence<latest))).scalars().all()
+        placement = placed_at is not None and latest >= placed_at and all(sequence < placed_at for sequence in earlier)
+        if earlier and not placement:
+            connection.execute(update(Snapshot).where(and_(Snapshot.game_id==game_id, Snapshot.sequence==latest))
+                               .values(board=None))
+    return pruned
+
+
+MIGRATIONS = [
+    pack_legacy_boards,
+    add_game_counters,
+    add_board_version,
+    add_game_list_indexes,
+    add_move_log,
+    add_lazy_mine_placement,
+    add_no_guess,
+    slim_snapshots,
+]
+
+
+def upgrade():
+    db.create_all()
+    results = []
+    with db.engine.begin() as connection:
+        for migration in MIGRATIONS:
+            results.append((migration.__name__, migration(connection)))
+    return results
@@ -1,7 +1,38 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import BYTEA
+from sqlalchemy.orm import reconstructor
+from services.board import load_board
+from services.metrics import metrics
 
 db = SQLAlchemy()
 
+GAME_STATUS = db.Enum("started", "won", "lost", name="game_status")
+
+class PackedBoard(db.TypeDecorator):
+    """Stores a Board as a compact binary blob, reading legacy JSON boards transparently."""
+    impl = db.LargeBinary
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        # Postgres gets bytea rather than jsonb: the packed format is several times smaller
+        # and skips JSON parsing on every load.
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(BYTEA())
+        return dialect.type_descriptor(db.LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        data = load_board(value).to_bytes()
+        metrics.increment("board_bytes_serialized_total", len(data))
+        return data
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            metrics.increment("board_bytes_deserialized_total", len(value))
+        with metrics.stage("board_decode"):
+            return load_board(value)
+
 class User(db.Model):
     __tablename__ = "users"
 
@@ -11,13 +42,69 @@ class User(db.Model):
 
 class Game(db.Model):
     __tablename__ = "games"
+    __table_args__ = (
+        # Keyset pagination of a user's games, with and without a status filter.
+        db.Index("ix_games_user_id_id", "user_id", "id"),
+        db.Index("ix_games_user_id_status_id", "user_id", "status", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)
     rows = db.Column(db.Integer, nullable=False)
     columns = db.Column(db.Integer, nullable=False)
     mines_left = db.Column(db.Integer, nullable=False)
+    mines = db.Column(db.Integer)
+    flags = db.Column(db.Integer)
+    covered_safe_cells = db.Column(db.Integer)
     start_time = db.Column(db.DateTime)
     end_time = db.Column(db.DateTime)
-    status = db.Column(db.Enum("started", "won", "lost"), nullable=False, default="started")
-    board = db.Column(db.JSON, nullable=False)
\ No newline at end of file
+    status = db.Column(GAME_STATUS, nullable=False, default="started")
+    # The board as of move snapshot_sequence, later moves are replayed from the moves table on load.
+    board = db.Column(PackedBoard, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    sequence = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    snapshot_sequence = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Sequence of the move that placed the mines, None while the game waits for its first clear.
+    mines_placed_at = db.Column(db.Integer)
+    # Whether the first clear places a board solvable without guessing.
+    no_guess = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("mines_placed_at", 0)
+        super().__init__(**kwargs)
+        self.unsaved_moves = []
+        self.replay_seconds = 0.0
+
+    @reconstructor
+    def _init_on_load(self):
+        # Moves applied since the game was loaded, written to the move log on the next save.
+        self.unsaved_moves = []
+        # Time that replaying the moves since the snapshot takes, see move_log.replay_cost.
+        self.replay_seconds = 0.0
+
+class Move(db.Model):
+    """Append-only log of every move applied to a game, numbered from 1 per game."""
+    __tablename__ = "moves"
+
+    game_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    sequence = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    action = db.Column(db.Enum("clear", "toggle", "chord", name="move_action"), nullable=False)
+    row = db.Column(db.Integer, nullable=False)
+    column = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+class Snapshot(db.Model):
+    """A game as it was after its first ``sequence`` moves."""
+    __tablename__ = "snapshots"
+
+    game_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    sequence = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # None when the games row holds the same board, see move_log.
+    board = db.Column(PackedBoard)
+    status = db.Column(GAME_STATUS, nullable=False)
+    mines_left = db.Column(db.Integer, nullable=False)
+    mines = db.Column(db.Integer)
+    flags = db.Column(db.Integer)
+    covered_safe_cells = db.Column(db.Integer)
+    version = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
\ No newline at end of file
@@ -0,0 +1,8 @@
+from marshmallow import Schema, fields, validate
+
+MAX_PAGE_SIZE = 100
+
+class GameListQuery(Schema):
+    limit = fields.Int(load_default=50, validate=validate.Range(min=1, max=MAX_PAGE_SIZE))
+    after = fields.Int(validate=validate.Range(min=0))
+    status = fields.Str(validate=validate.OneOf(["started", "won", "lost"]))
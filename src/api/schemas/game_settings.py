@@ -4,3 +4,4 @@ class GameSettings(Schema):
     rows = fields.Int(required=True)
     columns = fields.Int(required=True)
     mines = fields.Int(required=True)
+    no_guess = fields.Bool(load_default=False)
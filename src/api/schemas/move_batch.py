@@ -0,0 +1,10 @@
+from marshmallow import Schema, fields, validate
+from schemas.cell_action import CellAction
+
+MAX_MOVES = 500
+
+class Move(CellAction):
+    action = fields.Str(required=True, validate=validate.OneOf(["clear", "toggle", "chord"]))
+
+class MoveBatch(Schema):
+    moves = fields.List(fields.Nested(Move), required=True, validate=validate.Length(min=1, max=MAX_MOVES))
@@ -0,0 +1,9 @@
+from marshmallow import Schema, fields, validate
+
+MAX_VIEWPORT = 200
+
+class Viewport(Schema):
+    row = fields.Int(load_default=0, validate=validate.Range(min=0))
+    column = fields.Int(load_default=0, validate=validate.Range(min=0))
+    height = fields.Int(load_default=50, validate=validate.Range(min=1, max=MAX_VIEWPORT))
+    width = fields.Int(load_default=50, validate=validate.Range(min=1, max=MAX_VIEWPORT))
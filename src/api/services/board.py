@@ -0,0 +1,595 @@
+import bisect
+import json
+import random
+import struct
+import sys
+from array import array
+from collections import deque
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MINE = -1
+
+COVERED = "C"
+UNCOVERED = "U"
+FLAGGED = "F"
+MARKED = "?"
+
+DENSE = 1
+SPARSE = 2
+
+# Boards with a side longer than this are stored as a SparseBoard.
+DENSE_MAX_SIDE = 50
+# Side of the square status chunks of a SparseBoard.
+CHUNK = 64
+# Cells a sparse board's flood fill walks one by one before it switches to the whole-board
+# arrays of the vectorized pass, whose cost does not depend on the size of the cascade.
+FLOOD_WALK_LIMIT = 10000
+
+_HEADER = struct.Struct(">BHH")
+_SPARSE_COUNTS = struct.Struct(">II")
+_CHUNK_KEY = struct.Struct(">I")
+_COVERED = ord(COVERED)
+_UNCOVERED = ord(UNCOVERED)
+_FLAGGED = ord(FLAGGED)
+# Masked cells as characters: uncovered values as digits and uncovered mines as *.
+_TEXT_CELLS = {value: str(value) for value in range(9)}
+_TEXT_CELLS[MINE] = "*"
+_VALUE_CHARS = bytes(ord(_TEXT_CELLS.get(value if value < 128 else value - 256, "0")) for value in range(256))
+
+
+class BaseBoard:
+    """Geometry and the operations shared by every board representation."""
+
+    def __init__(self, rows: int, columns: int):
+        self.rows = rows
+        self.columns = columns
+        self.size = rows * columns
+
+    def index(self, row: int, column: int):
+        return row * self.columns + column
+
+    def position(self, index: int):
+        return divmod(index, self.columns)
+
+    def in_bounds(self, row: int, column: int):
+        return 0 <= row < self.rows and 0 <= column < self.columns
+
+    def neighbors(self, row: int, column: int):
+        for r in range(max(row-1, 0), min(row+2, self.rows)):
+            for c in range(max(column-1, 0), min(column+2, self.columns)):
+                if not (r==row and c==column):
+                    yield r, c
+
+    def masked_cell(self, row: int, column: int):
+        status = self.status(row, column)
+        return self.value(row, column) if status == UNCOVERED else status
+
+    def masked_window(self, row: int, column: int, height: int, width: int):
+        """Masked rows of the height x width window whose top left cell is (row, column),
+        clipped to the board."""
+        return [[self.masked_cell(r, c) for c in range(column, min(column + width, self.columns))]
+                for r in range(row, min(row + height, self.rows))]
+
+    def masked_rows(self):
+        return self.masked_window(0, 0, self.rows, self.columns)
+
+    def masked_text_window(self, row: int, column: int, height: int, width: int):
+        """Like masked_window, but each row is a string with one character per cell: the
+        digit of an uncovered value, * for an uncovered mine, or the C, F or ? status."""
+        return ["".join(_TEXT_CELLS.get(cell, cell) for cell in cells)
+                for cells in self.masked_window(row, column, height, width)]
+
+    def to_json(self):
+        return [[{"value": self.value(r, c), "status": self.status(r, c)} for c in range(self.columns)]
+                for r in range(self.rows)]
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.rows}x{self.columns}>"
+
+
+class Board(BaseBoard):
+    """Packed minesweeper board.
+
+    Cell values (-1 for a mine, 0-8 for the adjacent mine count) live in a flat
+    ``array('b')`` and cell statuses (C, U, F or ?) in a flat ``bytearray``, both
+    indexed row by row.
+    """
+
+    def __init__(self, rows: int, columns: int, values: array = None, statuses: bytearray = None):
+        super().__init__(rows, columns)
+        self.values = values if values is not None else array("b", bytes(self.size))
+        self.statuses = statuses if statuses is not None else bytearray([_COVERED]) * self.size
+
+    def value(self, row: int, column: int):
+        return self.values[row * self.columns + column]
+
+    def set_value(self, row: int, column: int, value: int):
+        self.values[row * self.columns + column] = value
+
+    def status(self, row: int, column: int):
+        return chr(self.statuses[row * self.columns + column])
+
+    def set_status(self, row: int, column: int, status: str):
+        self.statuses[row * self.columns + column] = ord(status)
+
+    def is_mine(self, row: int, column: int):
+        return self.values[row * self.columns + column] == MINE
+
+    def flood_reveal(self, row: int, column: int):
+        """Uncovers a safe cell and, breadth first, every cell reachable through
+        cells with no adjacent mines. Flagged cells are left alone.
+
+        Returns the set of (row, column) positions that were newly uncovered.
+        """
+        values = self.values
+        statuses = self.statuses
+        rows = self.rows
+        columns = self.columns
+        start = row * columns + column
+        if statuses[start] in (_UNCOVERED, _FLAGGED) or values[start] == MINE:
+            return set()
+
+        statuses[start] = _UNCOVERED
+        revealed = set()
+        queue = deque([start])
+        while queue:
+            index = queue.popleft()
+            r, c = divmod(index, columns)
+            revealed.add((r, c))
+            if values[index] != 0:
+                continue
+            for nr in range(max(r-1, 0), min(r+2, rows)):
+                base = nr * columns
+                for nc in range(max(c-1, 0), min(c+2, columns)):
+                    neighbor = base + nc
+                    if statuses[neighbor] != _UNCOVERED and statuses[neighbor] != _FLAGGED:
+                        statuses[neighbor] = _UNCOVERED
+                        queue.append(neighbor)
+        return revealed
+
+    def place_mines(self, indices):
+        """Puts a mine on each of the given flat cell indices."""
+        values = self.values
+        for index in indices:
+            values[index] = MINE
+
+    def calculate_values(self):
+        """Sets every safe cell's value to its number of adjacent mines."""
+        if numpy is not None:
+            self._calculate_values_vectorized()
+            return
+
+        # Shifted-row sums: add up each row's 3-wide horizontal window, then the
+        # windows of the rows above and below.
+        rows, columns = self.rows, self.columns
+        mines = [1 if value == MINE else 0 for value in self.values]
+        windows = []
+        for r in range(rows):
+            padded = [0] + mines[r * columns:(r + 1) * columns] + [0]
+            windows.append([a + b + c for a, b, c in zip(padded, padded[1:], padded[2:])])
+        empty = [0] * columns
+        counts = []
+        for r in range(rows):
+            above = windows[r - 1] if r > 0 else empty
+            below = windows[r + 1] if r + 1 < rows else empty
+            counts.extend(MINE if mine else a + b + c for mine, a, b, c in
+                          zip(mines[r * columns:(r + 1) * columns], above, windows[r], below))
+        self.values = array("b", counts)
+
+    def _calculate_values_vectorized(self):
+        rows, columns = self.rows, self.columns
+        values = numpy.frombuffer(self.values, dtype=numpy.int8).reshape(rows, columns)
+        mines = values == MINE
+        padded = numpy.zeros((rows + 2, columns + 2), dtype=numpy.int8)
+        padded[1:-1, 1:-1] = mines
+        counts = numpy.zeros((rows, columns), dtype=numpy.int8)
+        for dr in (0, 1, 2):
+            for dc in (0, 1, 2):
+                if not (dr == 1 and dc == 1):
+                    counts += padded[dr:dr + rows, dc:dc + columns]
+        counts[mines] = MINE
+        values[:] = counts
+
+    def covered_safe_cells(self):
+        return sum(1 for value, status in zip(self.values, self.statuses)
+                   if value != MINE and status != _UNCOVERED)
+
+    def count_mines(self):
+        return sum(1 for value in self.values if value == MINE)
+
+    def count_status(self, status: str):
+        return self.statuses.count(ord(status))
+
+    def masked_window(self, row: int, column: int, height: int, width: int):
+        values = self.values
+        statuses = self.statuses
+        end_column = min(column + width, self.columns)
+        rows = []
+        for r in range(row, min(row + height, self.rows)):
+            start = r * self.columns
+            rows.append([values[i] if statuses[i] == _UNCOVERED else chr(statuses[i])
+                         for i in range(start + column, start + end_column)])
+        return rows
+
+    def masked_text_window(self, row: int, column: int, height: int, width: int):
+        statuses = self.statuses
+        end_column = min(column + width, self.columns)
+        rows = []
+        for r in range(row, min(row + height, self.rows)):
+            start = r * self.columns + column
+            end = r * self.columns + end_column
+            cells = statuses[start:end]
+            if _UNCOVERED in cells:
+                value_chars = self.values[start:end].tobytes().translate(_VALUE_CHARS)
+                cells = bytes(value if status == _UNCOVERED else status
+                              for value, status in zip(value_chars, cells))
+            rows.append(cells.decode("ascii"))
+        return rows
+
+    def to_bytes(self):
+        return _HEADER.pack(DENSE, self.rows, self.columns) + self.values.tobytes() + bytes(self.statuses)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        kind, rows, columns = _HEADER.unpack_from(data)
+        if kind != DENSE:
+            raise ValueError(f"Unknown board kind {kind}")
+        size = rows * columns
+        offset = _HEADER.size
+        values = array("b")
+        values.frombytes(data[offset:offset + size])
+        statuses = bytearray(data[offset + size:offset + 2 * size])
+        return cls(rows, columns, values, statuses)
+
+    @classmethod
+    def from_json(cls, board: list):
+        """Builds a board from the legacy list-of-dicts representation."""
+        rows = len(board)
+        columns = len(board[0]) if rows else 0
+        values = array("b", (cell["value"] for row in board for cell in row))
+        statuses = bytearray(ord(cell["status"]) for row in board for cell in row)
+        return cls(rows, columns, values, statuses)
+
+    def __eq__(self, other):
+        return (isinstance(other, Board) and self.rows == other.rows and self.columns == other.columns
+                and self.values == other.values and self.statuses == other.statuses)
+
+
+
+class SparseBoard(BaseBoard):
+    """Board for games too large to keep every cell in memory.
+
+    Mines are a set of flat cell indices and values are computed from it on demand.
+    Statuses live in CHUNK x CHUNK byte chunks that are only allocated once one of
+    their cells stops being covered.
+    """
+
+    def __init__(self, rows: int, columns: int, mines: set = None, chunks: dict = None):
+        super().__init__(rows, columns)
+        self.mines = mines if mines is not None else set()
+        self.chunks = chunks if chunks is not None else {}
+        self._chunk_columns = (columns + CHUNK - 1) // CHUNK
+
+    def _locate(self, row: int, column: int):
+        return ((row // CHUNK) * self._chunk_columns + column // CHUNK,
+                (row % CHUNK) * CHUNK + column % CHUNK)
+
+    def value(self, row: int, column: int):
+        mines = self.mines
+        columns = self.columns
+        if row * columns + column in mines:
+            return MINE
+        return sum(1 for (r, c) in self.neighbors(row, column) if r * columns + c in mines)
+
+    def set_value(self, row: int, column: int, value: int):
+        # Only mines are stored, every other value follows from them.
+        if value == MINE:
+            self.mines.add(row * self.columns + column)
+        else:
+            self.mines.discard(row * self.columns + column)
+
+    def status(self, row: int, column: int):
+        key, offset = self._locate(row, column)
+        chunk = self.chunks.get(key)
+        return COVERED if chunk is None else chr(chunk[offset])
+
+    def set_status(self, row: int, column: int, status: str):
+        key, offset = self._locate(row, column)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            if status == COVERED:
+                return
+            chunk = self.chunks[key] = bytearray([_COVERED]) * (CHUNK * CHUNK)
+        chunk[offset] = ord(status)
+        if status == COVERED and chunk.count(_COVERED) == len(chunk):
+            del self.chunks[key]
+
+    def is_mine(self, row: int, column: int):
+        return row * self.columns + column in self.mines
+
+    def flood_reveal(self, row: int, column: int):
+        """Same contract as Board.flood_reveal.
+
+        A cell with adjacent mines is uncovered on its own. Otherwise the cascade is
+        walked breadth first on flat indices and the chunk bytearrays (see _flood_walk).
+        Most cascades are small, but one can cover most of the board, so with NumPy a
+        walk that passes FLOOD_WALK_LIMIT cells is abandoned for _flood_reveal_vectorized.
+        """
+        if self.status(row, column) in (UNCOVERED, FLAGGED) or self.is_mine(row, column):
+            return set()
+        if self.value(row, column) != 0:
+            self.set_status(row, column, UNCOVERED)
+            return {(row, column)}
+        reached = self._flood_walk(row, column, FLOOD_WALK_LIMIT if numpy is not None else None)
+        if reached is None:
+            return self._flood_reveal_vectorized(row, column)
+
+        columns = self.columns
+        chunks = self.chunks
+        chunk_columns = self._chunk_columns
+        blank = bytearray([_COVERED]) * (CHUNK * CHUNK)
+        revealed = set()
+        for index in reached:
+            r, c = divmod(index, columns)
+            key = (r // CHUNK) * chunk_columns + c // CHUNK
+            chunk = chunks.get(key)
+            if chunk is None:
+                chunk = chunks[key] = blank[:]
+            chunk[(r % CHUNK) * CHUNK + c % CHUNK] = _UNCOVERED
+            revealed.add((r, c))
+        return revealed
+
+    def _flood_walk(self, row: int, column: int, limit: int = None):
+        """Flat indices of the cells a cascade from (row, column) reveals, without changing
+        the board. Returns None as soon as more than ``limit`` cells were reached."""
+        rows, columns = self.rows, self.columns
+        mines = self.mines
+        chunks = self.chunks
+        chunk_columns = self._chunk_columns
+
+        start = row * columns + column
+        reached = {start}
+        queue = deque([start])
+        while queue:
+            index = queue.popleft()
+            r, c = divmod(index, columns)
+            row_range = range(max(r-1, 0), min(r+2, rows))
+            column_range = range(max(c-1, 0), min(c+2, columns))
+            if any(nr * columns + nc in mines for nr in row_range for nc in column_range):
+                continue
+            for nr in row_range:
+                chunk_row = (nr // CHUNK) * chunk_columns
+                offset_row = (nr % CHUNK) * CHUNK
+                for nc in column_range:
+                    neighbor = nr * columns + nc
+                    if neighbor in reached:
+                        continue
+                    chunk = chunks.get(chunk_row + nc // CHUNK)
+                    if chunk is not None:
+                        status = chunk[offset_row + nc % CHUNK]
+                        if status == _UNCOVERED or status == _FLAGGED:
+                            continue
+                    reached.add(neighbor)
+                    queue.append(neighbor)
+            if limit is not None and len(reached) > limit:
+                return None
+        return reached
+
+    def _dense_statuses(self):
+        """All statuses as a uint8 array padded to whole chunks."""
+        chunk_rows = (self.rows + CHUNK - 1) // CHUNK
+        statuses = numpy.full((chunk_rows * CHUNK, self._chunk_columns * CHUNK), _COVERED, dtype=numpy.uint8)
+        for key, chunk in self.chunks.items():
+            r, c = divmod(key, self._chunk_columns)
+            statuses[r * CHUNK:(r + 1) * CHUNK, c * CHUNK:(c + 1) * CHUNK] = \
+                numpy.frombuffer(chunk, dtype=numpy.uint8).reshape(CHUNK, CHUNK)
+        return statuses
+
+    def _flood_reveal_vectorized(self, row: int, column: int):
+        """Flood fill over row runs.
+
+        The cells the cascade passes through are the covered (or marked) cells with no
+        mine in their 3x3 block that are 8-connected to the start. They are found as a
+        breadth first walk over horizontal runs of such cells rather than cell by cell,
+        and everything they touch that is neither uncovered nor flagged is revealed.
+        """
+        rows, columns = self.rows, self.columns
+        mines = numpy.zeros(self.size, dtype=bool)
+        if self.mines:
+            mines[numpy.fromiter(self.mines, dtype=numpy.int64, count=len(self.mines))] = True
+        padded = numpy.zeros((rows + 2, columns + 2), dtype=bool)
+        padded[1:-1, 1:-1] = mines.reshape(rows, columns)
+        near_mine = numpy.zeros((rows, columns), dtype=bool)
+        for dr in (0, 1, 2):
+            for dc in (0, 1, 2):
+                near_mine |= padded[dr:dr + rows, dc:dc + columns]
+
+        all_statuses = self._dense_statuses()
+        statuses = all_statuses[:rows, :columns]
+        revealable = (statuses != _UNCOVERED) & (statuses != _FLAGGED)
+        passable = revealable & ~near_mine
+
+        row_runs = {}
+
+        def runs(r):
+            if r not in row_runs:
+                edges = numpy.diff(numpy.concatenate(([0], passable[r].view(numpy.int8), [0])))
+                row_runs[r] = (numpy.flatnonzero(edges == 1).tolist(), (numpy.flatnonzero(edges == -1) - 1).tolist())
+            return row_runs[r]
+
+        starts, ends = runs(row)
+        first = bisect.bisect_right(starts, column) - 1
+        queue = deque([(row, starts[first], ends[first])])
+        visited = {(row, starts[first])}
+        component = numpy.zeros((rows + 2, columns + 2), dtype=bool)
+        while queue:
+            r, start, end = queue.popleft()
+            component[r + 1, start + 1:end + 2] = True
+            for nr in (r - 1, r + 1):
+                if not 0 <= nr < rows:
+                    continue
+                starts, ends = runs(nr)
+                # Runs in the next row touch this one when they overlap [start - 1, end + 1].
+                i = max(bisect.bisect_right(ends, start - 2), 0)
+                while i < len(starts) and starts[i] <= end + 1:
+                    if (nr, starts[i]) not in visited:
+                        visited.add((nr, starts[i]))
+                        queue.append((nr, starts[i], ends[i]))
+                    i += 1
+
+        reached = numpy.zeros((rows, columns), dtype=bool)
+        for dr in (0, 1, 2):
+            for dc in (0, 1, 2):
+                reached |= component[dr:dr + rows, dc:dc + columns]
+        revealed = reached & revealable
+        statuses[revealed] = _UNCOVERED
+
+        hit_rows, hit_columns = numpy.nonzero(revealed)
+        for r in range(hit_rows.min() // CHUNK, hit_rows.max() // CHUNK + 1):
+            for c in range(hit_columns.min() // CHUNK, hit_columns.max() // CHUNK + 1):
+                block = all_statuses[r * CHUNK:(r + 1) * CHUNK, c * CHUNK:(c + 1) * CHUNK]
+                if (block != _COVERED).any():
+                    self.chunks[r * self._chunk_columns + c] = bytearray(block.tobytes())
+        return set(zip(hit_rows.tolist(), hit_columns.tolist()))
+
+    def place_mines(self, indices):
+        self.mines.update(indices)
+
+    def calculate_values(self):
+        # Values are derived from the mine set whenever they are read.
+        pass
+
+    def covered_safe_cells(self):
+        uncovered = sum(chunk.count(_UNCOVERED) for chunk in self.chunks.values())
+        uncovered_mines = sum(1 for index in self.mines if self.status(*self.position(index)) == UNCOVERED)
+        return self.size - len(self.mines) - (uncovered - uncovered_mines)
+
+    def count_mines(self):
+        return len(self.mines)
+
+    def count_status(self, status: str):
+        # Chunk cells outside the board are always covered, so they cancel out below.
+        if status == COVERED:
+            return self.size - sum(len(chunk) - chunk.count(_COVERED) for chunk in self.chunks.values())
+        return sum(chunk.count(ord(status)) for chunk in self.chunks.values())
+
+    def to_bytes(self):
+        mines = array("I", sorted(self.mines))
+        if sys.byteorder != "big":
+            mines.byteswap()
+        parts = [_HEADER.pack(SPARSE, self.rows, self.columns),
+                 _SPARSE_COUNTS.pack(len(mines), len(self.chunks)),
+                 mines.tobytes()]
+        for key in sorted(self.chunks):
+            parts.append(_CHUNK_KEY.pack(key))
+            parts.append(bytes(self.chunks[key]))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        kind, rows, columns = _HEADER.unpack_from(data)
+        if kind != SPARSE:
+            raise ValueError(f"Unknown board kind {kind}")
+        offset = _HEADER.size
+        mine_count, chunk_count = _SPARSE_COUNTS.unpack_from(data, offset)
+        offset += _SPARSE_COUNTS.size
+        mines = array("I")
+        mines.frombytes(data[offset:offset + mine_count * mines.itemsize])
+        if sys.byteorder != "big":
+            mines.byteswap()
+        offset += mine_count * mines.itemsize
+        chunks = {}
+        for _ in range(chunk_count):
+            (key,) = _CHUNK_KEY.unpack_from(data, offset)
+            offset += _CHUNK_KEY.size
+            chunks[key] = bytearray(data[offset:offset + CHUNK * CHUNK])
+            offset += CHUNK * CHUNK
+        return cls(rows, columns, set(mines), chunks)
+
+    def __eq__(self, other):
+        return (isinstance(other, SparseBoard) and self.rows == other.rows and self.columns == other.columns
+                and self.mines == other.mines and self.chunks == other.chunks)
+
+
+def new_board(rows: int, columns: int):
+    """Returns an empty board of the representation suited to its size."""
+    if rows > DENSE_MAX_SIDE or columns > DENSE_MAX_SIDE:
+        return SparseBoard(rows, columns)
+    return Board(rows, columns)
+
+
+def generate_board(rows: int, columns: int, mines: int, rng):
+    """Returns a board with ``mines`` mines placed at random and its values calculated."""
+    board = new_board(rows, columns)
+    board.place_mines(sample_cells(rng, rows * columns, mines))
+    board.calculate_values()
+    return board
+
+
+def make_rng(seed: int = None):
+    """Returns the random generator used for mine placement, seeded for reproducible boards."""
+    if numpy is not None:
+        return numpy.random.default_rng(seed)
+    return random.Random(seed)
+
+
+def sample_cells(rng, size: int, count: int, exclude=()):
+    """Picks ``count`` distinct flat cell indices out of ``size`` in a single draw, none of
+    them in ``exclude``."""
+    exclude = sorted(set(exclude))
+    if numpy is not None and isinstance(rng, numpy.random.Generator):
+        cells = rng.choice(size - len(exclude), count, replace=False).tolist()
+    else:
+        cells = rng.sample(range(size - len(exclude)), count)
+    if not exclude:
+        return cells
+    # Draw among the cells that remain, then shift each index past the excluded ones below it.
+    for position, cell in enumerate(cells):
+        for excluded in exclude:
+            if cell < excluded:
+                break
+            cell += 1
+        cells[position] = cell
+    return cells
+
+
+def move_mines(board: BaseBoard, cells, rng):
+    """Moves any mine on the given flat cell indices to a random safe cell outside them and
+    updates the values around both ends. Used to fit a pre-generated board to a first click."""
+    cells = set(cells)
+    moved = [index for index in cells if board.is_mine(*board.position(index))]
+    touched = set()
+    for index in moved:
+        while True:
+            target = sample_cells(rng, board.size, 1)[0]
+            if target not in cells and not board.is_mine(*board.position(target)):
+                break
+        board.set_value(*board.position(index), 0)
+        board.set_value(*board.position(target), MINE)
+        touched.update((index, target))
+    for index in touched:
+        position = board.position(index)
+        for (row, column) in list(board.neighbors(*position)) + [position]:
+            if not board.is_mine(row, column):
+                board.set_value(row, column, sum(1 for (r, c) in board.neighbors(row, column) if board.is_mine(r, c)))
+    return len(moved)
+
+
+def load_board(data):
+    """Decodes a stored board, accepting both packed bytes and legacy JSON."""
+    if data is None or isinstance(data, BaseBoard):
+        return data
+    if isinstance(data, list):
+        return Board.from_json(data)
+    if isinstance(data, str):
+        return Board.from_json(json.loads(data))
+    data = bytes(data)
+    if data[:1] == b"[":
+        return Board.from_json(json.loads(data.decode("utf-8")))
+    if data[0] == SPARSE:
+        return SparseBoard.from_bytes(data)
+    return Board.from_bytes(data)
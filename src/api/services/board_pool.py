@@ -0,0 +1,86 @@
+import threading
+from collections import deque
+
+from services.board import generate_board, make_rng
+
+
+class BoardPool:
+    """Ready-made boards for popular (rows, columns, mines) settings, so starting a game
+    with one of them skips board generation.
+
+    Each setting keeps up to ``size`` boards. A daemon thread tops a setting back up once
+    it drops below ``refill_below`` boards. ``take`` never waits: when the pool is empty
+    the caller generates the board itself. Hits and misses are counted per setting.
+    """
+
+    def __init__(self, settings, size: int = 20, refill_below: int = None, seed: int = None):
+        self.size = size
+        self.refill_below = size // 2 if refill_below is None else refill_below
+        self.rng = make_rng(seed)
+        self._boards = {tuple(setting): deque() for setting in settings}
+        self._hits = dict.fromkeys(self._boards, 0)
+        self._misses = dict.fromkeys(self._boards, 0)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def take(self, rows: int, columns: int, mines: int):
+        """Returns a pooled board for the setting, or None if there is none ready."""
+        setting = (rows, columns, mines)
+        boards = self._boards.get(setting)
+        if boards is None:
+            return None
+        try:
+            board = boards.popleft()
+        except IndexError:
+            board = None
+        with self._lock:
+            if board is None:
+                self._misses[setting] += 1
+            else:
+                self._hits[setting] += 1
+        if len(boards) < self.refill_below:
+            self._wake.set()
+        return board
+
+    def refill(self):
+        """Fills every setting up to size. Returns how many boards were generated."""
+        generated = 0
+        for (rows, columns, mines), boards in self._boards.items():
+            while len(boards) < self.size and not self._stop.is_set():
+                boards.append(generate_board(rows, columns, mines, self.rng))
+                generated += 1
+        return generated
+
+    def stats(self):
+        """Returns {"rows x columns x mines": {"ready", "hits", "misses"}} and the overall hit rate."""
+        with self._lock:
+            settings = {f"{rows}x{columns}x{mines}": {"ready": len(boards),
+                                                     "hits": self._hits[(rows, columns, mines)],
+                                                     "misses": self._misses[(rows, columns, mines)]}
+                        for (rows, columns, mines), boards in self._boards.items()}
+            hits, misses = sum(self._hits.values()), sum(self._misses.values())
+        return {"settings": settings, "hit_rate": hits / (hits + misses) if hits + misses else None}
+
+    def start(self):
+        """Fills the pool from a daemon thread, and refills it whenever a setting runs low.
+        Does nothing once started or stopped, so callers may call it on every use."""
+        def run():
+            while not self._stop.is_set():
+                self.refill()
+                self._wake.wait()
+                self._wake.clear()
+
+        with self._lock:
+            if self._thread is not None or self._stop.is_set():
+                return
+            self._thread = threading.Thread(target=run, name="board-pool-refill", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
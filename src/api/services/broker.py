@@ -0,0 +1,40 @@
+import threading
+
+
+class LocalBroker:
+    """In-process publish/subscribe of messages on named channels.
+
+    Subscribers are callbacks, called synchronously from whichever thread publishes, so
+    they should only hand the message over (e.g. put it on a queue). Only subscribers in
+    the same process see a message; a broker backed by an external pub/sub service can
+    replace this one by offering the same three methods.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, callback):
+        """Calls callback(message) for every message published on channel until the
+        returned function is called."""
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                callbacks = self._subscribers.get(channel, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+                if not callbacks:
+                    self._subscribers.pop(channel, None)
+        return unsubscribe
+
+    def has_subscribers(self, channel):
+        return channel in self._subscribers
+
+    def publish(self, channel, message):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, ()))
+        for callback in callbacks:
+            callback(message)
+        return len(callbacks)
@@ -0,0 +1,49 @@
+import threading
+from collections import OrderedDict
+
+
+class EncodedGameCache:
+    """LRU cache of encoded game responses keyed by (game id, version, variant).
+
+    A new version never hits an old entry, so moves need no invalidation. ``invalidate``
+    is for changes that keep the version, such as a save that lost to another request.
+    ``variant`` tells apart different encodings of the same version, e.g. viewports.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, game_id: int, version: int, variant=None):
+        key = (game_id, version, variant)
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, game_id: int, version: int, variant, body: bytes):
+        key = (game_id, version, variant)
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            self._versions.setdefault(game_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._forget(next(iter(self._entries)))
+
+    def invalidate(self, game_id: int):
+        with self._lock:
+            for key in list(self._versions.get(game_id, ())):
+                self._forget(key)
+
+    def _forget(self, key):
+        del self._entries[key]
+        keys = self._versions[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._versions[key[0]]
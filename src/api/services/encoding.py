@@ -0,0 +1,74 @@
+"""Response encoding: JSON with orjson when it is installed, gzip or brotli compression
+negotiated from Accept-Encoding, and the compact board formats.
+
+orjson and brotli are optional. Without them the standard library encoder and gzip are
+used, and the responses are the same apart from whitespace.
+"""
+import datetime
+import gzip
+import json
+import re
+
+from werkzeug.http import http_date, parse_accept_header
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# "cells" is the default board of nested lists, "rows" a string per row and "rle" a list
+# per row of cell strings and covered run lengths.
+BOARD_FORMATS = ("cells", "rows", "rle")
+
+_COVERED_RUNS = re.compile(r"C+|[^C]+")
+
+
+def _default(value):
+    # Dates go out as HTTP dates, like Flask's jsonify sends them.
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return http_date(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data) -> bytes:
+    """Encodes data as compact JSON bytes."""
+    if orjson is not None:
+        # Validation errors are keyed by list index, which the standard encoder also turns into strings.
+        return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, separators=(",", ":")).encode()
+
+
+def supported_encodings(preferred):
+    """The encodings out of preferred, e.g. ["br", "gzip"], this process can produce."""
+    return [encoding for encoding in preferred if encoding == "gzip" or (encoding == "br" and brotli is not None)]
+
+
+def choose_encoding(accept_encoding: str, encodings):
+    """Returns the first of encodings the Accept-Encoding header accepts, or None."""
+    if not accept_encoding or not encodings:
+        return None
+    accepted = parse_accept_header(accept_encoding)
+    for encoding in encodings:
+        # The quality of an encoding not listed is the one of "*", if that is there.
+        if accepted[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str, level: int = 6) -> bytes:
+    """Compresses body with gzip or br. level is gzip's 1 to 9, and brotli's quality is
+    picked to cost about the same."""
+    if encoding == "br":
+        return brotli.compress(body, quality=min(level, 11))
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def row_runs(row: str):
+    """Run-length encodes the covered cells of a row string: runs of covered cells become
+    their length and everything in between stays a string, e.g. "CCC12F" -> [3, "12F"]."""
+    return [len(run) if run[0] == "C" else run for run in _COVERED_RUNS.findall(row)]
@@ -0,0 +1,192 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from exceptions import ConcurrentUpdateException
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    def __init__(self, key, game, now: float):
+        self.key = key
+        self.game = game
+        self.lock = threading.RLock()
+        self.last_access = now
+        self.dirty_since = None
+        self.persisted_version = game.version
+
+
+class GameCache:
+    """Process-local write-behind cache of active games keyed by (user_id, game_id).
+
+    Moves are applied to the cached Game and only marked dirty; dirty games are
+    written through ``persist(game, expected_version)`` once they have been dirty for ``flush_seconds``
+    (the durability window), when they are evicted, when the game ends and on
+    ``flush_all``. Games are evicted least recently used first once there are more
+    than ``max_size`` of them, and after ``idle_seconds`` without moves.
+
+    ``expected_version`` is the version the game had when it was last loaded or written.
+    If ``persist`` raises ConcurrentUpdateException the game was saved from elsewhere:
+    the cached copy is dropped and the exception reaches whoever triggered the flush.
+    """
+
+    def __init__(self, persist, max_size: int = 256, idle_seconds: float = 300, flush_seconds: float = 5,
+                 clock=time.monotonic):
+        self.persist = persist
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _entry(self, key, load):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry.last_access = self.clock()
+                return entry
+
+        game = load()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry(key, game, self.clock())
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+        self._evict_overflow()
+        return entry
+
+    @contextmanager
+    def checkout(self, key, load, modify: bool = True):
+        """Yields the cached game for ``key``, loading it with ``load()`` on a miss.
+
+        The game is locked for the duration of the block so concurrent moves on the
+        same game are applied one at a time. When ``modify`` is set and the block
+        exits cleanly the game is marked dirty, and flushed straight away if it ended.
+        """
+        entry = self._locked_entry(key, load)
+        try:
+            yield entry.game
+            if modify:
+                if entry.dirty_since is None:
+                    entry.dirty_since = self.clock()
+                if entry.game.status != "started":
+                    self._flush_entry(entry)
+        finally:
+            entry.lock.release()
+        self.flush_due()
+
+    def _locked_entry(self, key, load):
+        # Until its lock is taken an entry can be flushed and evicted by another thread, and a
+        # move applied to it would never be written. Such an entry is replaced by a fresh load.
+        while True:
+            entry = self._entry(key, load)
+            entry.lock.acquire()
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    return entry
+            entry.lock.release()
+
+    def _flush_entry(self, entry: _Entry):
+        with entry.lock:
+            if entry.dirty_since is not None:
+                try:
+                    self.persist(entry.game, entry.persisted_version)
+                except ConcurrentUpdateException:
+                    self._drop(entry)
+                    raise
+                entry.persisted_version = entry.game.version
+                entry.dirty_since = None
+
+    def _drop(self, entry: _Entry):
+        with self._lock:
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+
+    def _evict(self, key, entry: _Entry):
+        # A game that is being played right now stays, it is flushed once the move is done.
+        if not entry.lock.acquire(blocking=False):
+            return False
+        try:
+            self._flush_entry(entry)
+            self._drop(entry)
+        except ConcurrentUpdateException:
+            pass
+        finally:
+            entry.lock.release()
+        return True
+
+    def _evict_overflow(self):
+        with self._lock:
+            overflow = list(self._entries.items())[:max(len(self._entries) - self.max_size, 0)]
+        for key, entry in overflow:
+            self._evict(key, entry)
+
+    def flush_due(self):
+        """Flushes games whose durability window has passed and evicts idle ones."""
+        now = self.clock()
+        with self._lock:
+            entries = list(self._entries.items())
+        for key, entry in entries:
+            if now - entry.last_access >= self.idle_seconds:
+                self._evict(key, entry)
+            elif entry.dirty_since is not None and now - entry.dirty_since >= self.flush_seconds:
+                if entry.lock.acquire(blocking=False):
+                    try:
+                        self._flush_entry(entry)
+                    except ConcurrentUpdateException:
+                        pass
+                    finally:
+                        entry.lock.release()
+
+    def flush_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+        for entry in entries:
+            try:
+                self._flush_entry(entry)
+            except ConcurrentUpdateException:
+                pass
+
+    def invalidate(self, key):
+        """Drops a game without flushing it, e.g. after it was changed elsewhere."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def start(self, interval: float = None):
+        """Starts a daemon thread that runs flush_due every ``interval`` seconds."""
+        if self._thread is not None:
+            return
+        interval = interval or max(min(self.flush_seconds, self.idle_seconds) / 2, 0.1)
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.flush_due()
+                except Exception:
+                    # E.g. the database is unreachable: the games stay dirty and are retried.
+                    logger.exception("Flushing cached games failed")
+
+        self._thread = threading.Thread(target=run, name="game-cache-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the flush thread and writes every dirty game."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush_all()
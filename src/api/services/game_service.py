@@ -1,19 +1,47 @@
-import random
 import datetime
 from models import db, Game
+from services.metrics import metrics
+from services.encoding import row_runs
+from services import solver, no_guess
+from services.board import new_board, move_mines, MINE, COVERED, UNCOVERED, FLAGGED, MARKED, make_rng, sample_cells
 from exceptions import InvalidClearException, InvalidGameSettingsException
 
+MAX_SIDE = 2000
+# Boards larger than this are only ever sent as a window of this size unless a viewport is requested.
+DEFAULT_VIEWPORT = 50
+
 class GameService:
 
-    def __init__(self, game: Game = None):
+    def __init__(self, game: Game = None, seed: int = None, board_pool=None, no_guess_generator=None):
+        self.seed = seed
+        self._rng = None
+        self.board_pool = board_pool
+        self.no_guess_generator = no_guess_generator
+        self.changes = set()
+        self.base_version = 0
         if game:
             self.game = game
+            self.base_version = game.version or 0
+            if game.board is not None and game.covered_safe_cells is None:
+                self.repair_counters()
     
-    def start_game(self, user_id: int, rows: int = 10, columns: int = 10, mines: int = 20):
+    @property
+    def rng(self):
+        # Only placing mines samples, most services never need a generator.
+        if self._rng is None:
+            self._rng = make_rng(self.seed)
+        return self._rng
+
+    def start_game(self, user_id: int, rows: int = 10, columns: int = 10, mines: int = 20, no_guess: bool = False):
+        """Starts a game on an empty board. Its mines are only placed by the first clear,
+        away from the clicked cell, so starting a game does no board generation. With
+        no_guess the first clear places a board that can be solved without guessing."""
         self.game = Game()
         self.game.status = "started"
         self.game.user_id = user_id
-        self._generate_board(rows, columns, mines)
+        self.game.version = 0
+        self.game.no_guess = no_guess
+        self._prepare_board(rows, columns, mines)
 
 
     def _is_cell_valid(self, row: int, column: int):
@@ -25,122 +53,328 @@ class GameService:
 
     def clear(self, row: int, column: int):
         self._is_cell_valid(row, column)
+        self._log_move("clear", row, column)
         
+        # A flagged cell is not revealed, so clearing it must neither start the game nor place
+        # the mines: the game would change without a new version.
+        if self.game.board.status(row, column) == FLAGGED:
+            return set()
         if not self.game.start_time:
             self.game.start_time = datetime.datetime.utcnow()
+        if self.game.mines_placed_at is None:
+            self._place_mines_around(row, column)
         
-        if self.game.board[row][column]["status"] in  ("U","F"):
-            return
+        revealed = self._reveal(row, column)
+        self._record_changes(revealed)
+        metrics.increment("cells_revealed_total", len(revealed))
+        return revealed
+
+
+    def chord(self, row: int, column: int):
+        """Clears every unflagged neighbor of an uncovered number once as many flags as
+        the number surround it. Does nothing otherwise. Hitting a mine loses the game
+        just like clear does."""
+        self._is_cell_valid(row, column)
+        self._log_move("chord", row, column)
+        board = self.game.board
+        if board.status(row, column) != UNCOVERED or board.value(row, column) <= 0:
+            return set()
+        neighbors = list(board.neighbors(row, column))
+        flags = sum(1 for (r, c) in neighbors if board.status(r, c) == FLAGGED)
+        if flags != board.value(row, column):
+            return set()
+
+        revealed = set()
+        for (r, c) in neighbors:
+            revealed |= self._reveal(r, c)
+            if self.game.status != "started":
+                break
+        self._record_changes(revealed)
+        metrics.increment("cells_revealed_total", len(revealed))
+        return revealed
+
+
+    def _reveal(self, row: int, column: int):
+        board = self.game.board
+        if board.status(row, column) in (UNCOVERED, FLAGGED):
+            return set()
         
-        if self.game.board[row][column]["value"]==-1:
-            self.game.board[row][column]["status"] = "U"
+        if board.is_mine(row, column):
+            board.set_status(row, column, UNCOVERED)
             self.game.status = "lost"
             self.game.end_time = datetime.datetime.utcnow()
-        else:
-            self._clear_adjacents(row, column)
-            if self.is_complete():
-                self.game.status = "won"
-                self.game.end_time = datetime.datetime.utcnow()
+            return {(row, column)}
+
+        revealed = self._clear_adjacents(row, column)
+        self.game.covered_safe_cells -= len(revealed)
+        if self.is_complete():
+            self.game.status = "won"
+            self.game.end_time = datetime.datetime.utcnow()
+        return revealed
 
 
     def _clear_adjacents(self, row: int, column: int):
-        if row<0 or column<0 or row>=self.game.rows or column>=self.game.columns:
-            return
-        if self.game.board[row][column]["status"] in ("U","F"):
-            return
-        cell_value = self.game.board[row][column]["value"]
-        if cell_value != -1:
-            self.game.board[row][column]["status"] = "U"
-            if cell_value == 0:
-                for r in range(row-1, row+2):
-                    for c in range(column-1,column+2):
-                        if not (r==row and c==column):
-                            self._clear_adjacents(r, c)
+        return self.game.board.flood_reveal(row, column)
 
 
     def toggle(self, row: int, column: int):
         self._is_cell_valid(row, column)
-        values = ["C", "F", "?"]
-        status = self.game.board[row][column]["status"]
-        if status != "U":
+        self._log_move("toggle", row, column)
+        values = [COVERED, FLAGGED, MARKED]
+        status = self.game.board.status(row, column)
+        if status != UNCOVERED:
             new_status = values[(values.index(status)+1) % len(values)]
-            if status == "F":
+            if status == FLAGGED:
                 self.game.mines_left += 1
-            if new_status=="F":
+                self.game.flags -= 1
+            if new_status==FLAGGED:
                 if self.game.mines_left>0:
                     self.game.mines_left -= 1
+                    self.game.flags += 1
                 else:
-                    new_status = "?"
-            self.game.board[row][column]["status"] = new_status
+                    new_status = MARKED
+            self.game.board.set_status(row, column, new_status)
+            self._record_changes({(row, column)})
+
+
+    def apply_moves(self, moves: list):
+        """Applies {"action", "row", "column"} moves in order, stopping once the game ends.
+
+        Every move is validated before the first one is applied, so an invalid batch
+        leaves the game untouched. Returns how many moves were applied.
+        """
+        if self.game.status != "started":
+            raise InvalidClearException(self.game, "Cannot clear cells on an inactive game")
+        for move in moves:
+            if not self.game.board.in_bounds(move["row"], move["column"]):
+                raise InvalidClearException(self.game, "Cannot clear cells outside of minefield")
+
+        actions = {"clear": self.clear, "toggle": self.toggle, "chord": self.chord}
+        applied = 0
+        for move in moves:
+            actions[move["action"]](move["row"], move["column"])
+            applied += 1
+            if self.game.status != "started":
+                break
+        return applied
+
+
+    def _log_move(self, action: str, row: int, column: int):
+        self.game.unsaved_moves.append((action, row, column, datetime.datetime.utcnow()))
+
+
+    def _record_changes(self, cells: set):
+        """Remembers which cells this service changed and bumps the board version."""
+        if cells:
+            self.changes |= cells
+            self.game.version = (self.game.version or 0) + 1
 
 
     def is_complete(self):
-        for row in self.game.board:
-            for column in row:
-                if column["value"] !=-1 and column["status"] != "U":
-                    return False
-        return True
+        return self.game.covered_safe_cells == 0
+
+
+    def _actual_counters(self):
+        board = self.game.board
+        flags = board.count_status(FLAGGED)
+        if self.game.mines_placed_at is None:
+            # Nothing can be uncovered before the first clear places the mines.
+            mines = self.game.mines
+            covered_safe_cells = board.size - mines
+        else:
+            mines = board.count_mines()
+            covered_safe_cells = board.covered_safe_cells()
+        return {
+            "mines": mines,
+            "flags": flags,
+            "mines_left": mines - flags,
+            "covered_safe_cells": covered_safe_cells,
+        }
+
+    def check_counters(self):
+        """Recomputes the counters from the board and returns the ones that disagree
+        as {name: (stored, actual)}."""
+        return {name: (getattr(self.game, name), actual)
+                for name, actual in self._actual_counters().items()
+                if getattr(self.game, name) != actual}
+
+    def repair_counters(self):
+        mismatches = self.check_counters()
+        for name, (stored, actual) in mismatches.items():
+            setattr(self.game, name, actual)
+        return mismatches
         
 
-    def _generate_board(self, rows: int, columns: int, mines: int):
-        if rows>50 or columns>50:
-            raise InvalidGameSettingsException(self.game, "Sides cannot be greater thatn 50")
+    def _prepare_board(self, rows: int, columns: int, mines: int):
+        """Validates the settings and sets the game up on a board with no mines yet."""
+        if rows>MAX_SIDE or columns>MAX_SIDE:
+            raise InvalidGameSettingsException(self.game, f"Sides cannot be greater than {MAX_SIDE}")
         if rows*columns <= mines:
             raise InvalidGameSettingsException(self.game, "Number of mines must be less than the total board size")
         if rows <= 0 or columns <= 0 or mines <= 0:
             raise InvalidGameSettingsException(self.game, "All values must be greater than zero")
+        if self.game.no_guess:
+            if rows * columns > no_guess.MAX_CELLS:
+                raise InvalidGameSettingsException(self.game, f"No-guess boards cannot have more than {no_guess.MAX_CELLS} cells")
+            if mines > rows * columns * no_guess.MAX_DENSITY:
+                raise InvalidGameSettingsException(self.game, f"No-guess boards cannot have more than {no_guess.MAX_DENSITY:.0%} mines")
         self.game.rows = rows
         self.game.columns = columns
+        self.game.mines = mines
         self.game.mines_left = mines
-        self.game.board = [[{"value": 0, "status": "C"} for y in range(columns)] for x in range(rows)]
+        self.game.flags = 0
+        self.game.covered_safe_cells = rows * columns - mines
+        self.game.board = new_board(rows, columns)
+        self.game.mines_placed_at = None
+
+    def _generate_board(self, rows: int, columns: int, mines: int):
+        """Sets the game up with its mines placed right away."""
+        self._prepare_board(rows, columns, mines)
         self._place_mines(rows, columns, mines)
         self._calculate_values(rows, columns)
+        self.game.mines_placed_at = self.game.sequence or 0
 
-    def _place_mines(self, rows: int, columns: int, mines: int):
-        row_count = len(self.game.board)
-        column_count = len(self.game.board[0])
+    def _place_mines_around(self, row: int, column: int):
+        """Places the mines of a game started without them, keeping the clicked cell and,
+        when the board has room, its neighbors safe. Takes a ready-made board from the pool
+        when one is there and the board was not touched yet, moving any mine off those cells.
 
-        while mines>0:
-            #TODO: Account for retries to avoid bogosort kind of problems
-            target_row = random.randint(0,row_count-1)
-            target_column = random.randint(0,column_count-1)
-            if self.game.board[target_row][target_column]["value"] == 0:
-                self.game.board[target_row][target_column]["value"] = -1
-                mines -= 1
+        Records the sequence number of the clear, so the save snapshots the placed board:
+        placement is random and cannot be replayed from the move log."""
+        board = self.game.board
+        rows, columns, mines = self.game.rows, self.game.columns, self.game.mines
+        safe = [board.index(r, c) for (r, c) in list(board.neighbors(row, column)) + [(row, column)]]
+        if board.size - len(safe) < mines:
+            safe = [board.index(row, column)]
+
+        if self.game.no_guess and self._place_no_guess_mines(row, column):
+            return
+        pooled = None
+        if self.board_pool is not None and board.count_status(COVERED) == board.size:
+            pooled = self.board_pool.take(rows, columns, mines)
+        if pooled is not None:
+            move_mines(pooled, safe, self.rng)
+            self.game.board = pooled
+        else:
+            self._place_mines(rows, columns, mines, safe)
+            self._calculate_values(rows, columns)
+        self.game.mines_placed_at = (self.game.sequence or 0) + len(self.game.unsaved_moves)
+
+    def _place_no_guess_mines(self, row: int, column: int):
+        """Places a no-guess board for a first clear of (row, column). Returns False, leaving
+        the board alone, when the search runs out of time; the game then gets an ordinary
+        board."""
+        rows, columns, mines = self.game.rows, self.game.columns, self.game.mines
+        if self.no_guess_generator is not None:
+            cells = self.no_guess_generator.generate(rows, columns, mines, row, column, self.rng)
+        else:
+            cells = no_guess.find_mines(rows, columns, mines, row, column, no_guess.seed_from(self.rng),
+                                        budget=no_guess.DEFAULT_BUDGET)
+        if cells is None:
+            metrics.increment("no_guess_fallbacks_total")
+            return False
+        self.game.board.place_mines(cells)
+        self._calculate_values(rows, columns)
+        self.game.mines_placed_at = (self.game.sequence or 0) + len(self.game.unsaved_moves)
+        return True
+
+    def _place_mines(self, rows: int, columns: int, mines: int, safe=()):
+        self.game.board.place_mines(sample_cells(self.rng, rows * columns, mines, safe))
 
     def _calculate_values(self, rows: int, columns: int):
-        for (i,row) in enumerate(self.game.board):
-            for (j,col) in enumerate(row):
-                if(col["value"]==-1):
-                    continue
-
-                count = 0
-                for r in range(i-1,i+2):
-                    for c in range(j-1,j+2):
-                        if r>=0 and r<rows and c>=0 and c<columns and not (r==i and c==j):
-                            if(self.game.board[r][c]["value"]==-1):
-                                count += 1
-                col["value"] = count
-
-    def _mask_board(self):
-        rows = []
-        for row in self.game.board:
-            columns = []
-            for column in row:
-                if column["status"] == "U":
-                    columns.append(column["value"])
-                else:
-                    columns.append(column["status"])
-            rows.append(columns)
+        self.game.board.calculate_values()
 
+    def _mask_board(self, viewport: tuple = None, board_format: str = "cells"):
+        board = self.game.board
+        window = viewport if viewport is not None else (0, 0, self.game.rows, self.game.columns)
+        if board_format == "cells":
+            return board.masked_window(*window)
+        rows = board.masked_text_window(*window)
+        if board_format == "rle":
+            return [row_runs(row) for row in rows]
         return rows
 
-    def encode_game_info(self):
+    def _clip_viewport(self, viewport: tuple = None):
+        """Returns the (row, column, height, width) window to send, None meaning the whole board."""
+        if viewport is None:
+            if self.game.rows <= DEFAULT_VIEWPORT and self.game.columns <= DEFAULT_VIEWPORT:
+                return None
+            viewport = (0, 0, DEFAULT_VIEWPORT, DEFAULT_VIEWPORT)
+        row, column, height, width = viewport
+        row = min(row, self.game.rows - 1)
+        column = min(column, self.game.columns - 1)
+        return (row, column, min(height, self.game.rows - row), min(width, self.game.columns - column))
+
+    def encode_game_info(self, viewport: tuple = None, board_format: str = "cells"):
+        """Encodes the game with its masked board. Large boards, or any board when a
+        (row, column, height, width) viewport is given, only include that window.
+        board_format is one of encoding.BOARD_FORMATS."""
+        viewport = self._clip_viewport(viewport)
+        info = {
+            "id": self.game.id,
+            "start_time": self.game.start_time,
+            "end_time": self.game.end_time,
+            "mines_left": self.game.mines_left,
+            "status": self.game.status,
+            "version": self.game.version,
+            "rows": self.game.rows,
+            "columns": self.game.columns,
+            "board": self._mask_board(viewport, board_format)
+        }
+        if self.game.no_guess:
+            info["no_guess"] = True
+        if board_format != "cells":
+            info["board_format"] = board_format
+        if viewport is not None:
+            info["viewport"] = dict(zip(("row", "column", "height", "width"), viewport))
+        return info
+
+    def hint(self, viewport: tuple = None, budget: float = 0.2):
+        """Solves the masked board for cells that are certainly safe or mines and the mine
+        probability of the others, see solver.solve. Large boards, or any board when a
+        viewport is given, are solved within that window only, which loses the total mine
+        count and the numbers just outside of it."""
+        if self.game.status != "started":
+            raise InvalidClearException(self.game, "Cannot get hints on an inactive game")
+        viewport = self._clip_viewport(viewport)
+        if self.game.mines_placed_at is None:
+            # The mines are placed away from the first clear, any cell is safe.
+            result = {"safe": [], "mines": [], "probabilities": [], "unconstrained_probability": 0.0,
+                      "complete": True}
+        elif viewport is None:
+            result = solver.solve(self._mask_board(), mines=self.game.mines, budget=budget)
+        else:
+            row, column, height, width = viewport
+            # One more cell on each side completes the constraints of the numbers on the edge.
+            top, left = max(row - 1, 0), max(column - 1, 0)
+            window = (top, left, min(row + height + 1, self.game.rows) - top,
+                      min(column + width + 1, self.game.columns) - left)
+            result = solver.solve(self._mask_board(window), window[:2], (self.game.rows, self.game.columns),
+                                  budget=budget)
+
+            def inside(cell):
+                return row <= cell[0] < row + height and column <= cell[1] < column + width
+            for key in ("safe", "mines", "probabilities"):
+                result[key] = [cell for cell in result[key] if inside(cell)]
+        info = {"id": self.game.id, "version": self.game.version}
+        info.update(result)
+        if viewport is not None:
+            info["viewport"] = dict(zip(("row", "column", "height", "width"), viewport))
+        return info
+
+    def encode_game_delta(self):
+        """Like encode_game_info, but only with the cells changed through this service
+        as [row, column, masked value] triples. base_version is the version the changes
+        apply on top of, so clients holding another version know to refetch the game."""
+        board = self.game.board
+        cells = [[row, column, board.masked_cell(row, column)] for (row, column) in sorted(self.changes)]
         return {
             "id": self.game.id,
             "start_time": self.game.start_time,
             "end_time": self.game.end_time,
             "mines_left": self.game.mines_left,
             "status": self.game.status,
-            "board": self._mask_board()
+            "base_version": self.base_version,
+            "version": self.game.version,
+            "cells": cells
         }
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""Request stage timings and hot path counters, exported in the Prometheus text format, and
+an optional profiler that dumps the profile of a sample of requests to disk.
+
+Instrumented code uses the module level ``metrics``, which the app enables with
+METRICS_ENABLED. While it is disabled every call returns straight away.
+"""
+import bisect
+import cProfile
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Histogram upper bounds in seconds, from half a millisecond to five seconds.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_NOT_TIMED = nullcontext()
+
+HELP = {
+    "request_seconds": "Time spent serving a request, by route.",
+    "stage_seconds": "Time spent in one stage of a request.",
+    "cells_revealed_total": "Cells uncovered by clears and chords.",
+    "board_bytes_serialized_total": "Bytes of packed boards written to the database.",
+    "board_bytes_deserialized_total": "Bytes of packed boards read from the database.",
+    "no_guess_fallbacks_total": "No-guess games that got an ordinary board because none was found in time.",
+}
+
+
+class _Histogram:
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """Histograms and counters keyed by metric name and labels.
+
+    Names are prefixed with ``prefix`` when rendered. Gauges that are read from somewhere
+    else at scrape time, like the board pool, are passed to ``render``.
+    """
+
+    def __init__(self, enabled: bool = False, prefix: str = "minesweeper_", buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels):
+        """Records one value, in seconds for timings, in the histogram."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.counts[bisect.bisect_left(self.buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def timer(self, name: str, **labels):
+        """Returns a context manager observing how long its block took."""
+        if not self.enabled:
+            return _NOT_TIMED
+        return self._timed(name, labels)
+
+    @contextmanager
+    def _timed(self, name: str, labels: dict):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stage(self, stage: str):
+        return self.timer("stage_seconds", stage=stage)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self, gauges=()):
+        """Returns every metric in the Prometheus text exposition format. gauges are extra
+        (name, labels, value) samples."""
+        with self._lock:
+            histograms = sorted((key, list(h.counts), h.sum, h.count) for key, h in self._histograms.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {self.prefix}{name} {HELP[name]}")
+                lines.append(f"# TYPE {self.prefix}{name} {kind}")
+
+        for (name, labels), counts, total, count in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.prefix}{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.prefix}{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{self.prefix}{name}_count{_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{self.prefix}{name}{_labels(labels)} {value}")
+        for name, labels, value in gauges:
+            describe(name, "gauge")
+            lines.append(f"{self.prefix}{name}{_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class RequestProfiler:
+    """Profiles a random ``sample_rate`` share of requests with cProfile and writes each
+    profile to ``directory/<route>/``, where ``python -m pstats`` or snakeviz can open it.
+
+    cProfile only sees the thread it was started on, so a profile covers one request even
+    when the server runs requests on several threads.
+    """
+
+    def __init__(self, directory: str, sample_rate: float = 0.01, seed: int = None):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self._random = random.Random(seed)
+        self._numbers = itertools.count(1)
+
+    def start(self):
+        """Returns a running profile if this request is sampled, otherwise None."""
+        if self._random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(self, profile, route: str):
+        """Stops the profile and writes it out. Returns the file path."""
+        profile.disable()
+        directory = os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", route or "unknown"))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(self._numbers)}.prof")
+        profile.dump_stats(path)
+        return path
+
+
+metrics = Metrics()
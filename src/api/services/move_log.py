@@ -0,0 +1,176 @@
+"""Event sourcing of games: every move is appended to the moves table and the board is
+only written every few moves as a snapshot.
+
+A stored game is its ``games`` row, whose counters and times are always current but whose
+board is the snapshot taken after move ``snapshot_sequence``, plus the moves logged after
+it. Functions that touch the database take a synchronous Session, so the async app can
+run them through ``AsyncSession.run_sync``.
+
+Only three snapshots of a game are kept: the first, the one taken when the mines were placed
+(which rebuild starts from) and the latest (whose counters catch_up rewinds to). The latest
+one only keeps its board when it is one of the other two, the games row has it otherwise.
+"""
+import datetime
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import and_, delete, insert, select
+
+from models import Game, Move, Snapshot
+from services.board import load_board
+from services.game_service import GameService
+
+# Game columns stored with every snapshot besides the board.
+SNAPSHOT_COLUMNS = ("status", "mines_left", "mines", "flags", "covered_safe_cells", "version")
+
+
+def snapshot_values(game: Game, board: bool = True, sequence: int = None):
+    values = {column: getattr(game, column) for column in SNAPSHOT_COLUMNS}
+    values.update(game_id=game.id, sequence=game.sequence if sequence is None else sequence,
+                  board=game.board if board else None, created_at=datetime.datetime.utcnow())
+    return values
+
+
+def prepare_save(game: Game, snapshot_interval: int, snapshot_seconds: float = None):
+    """Numbers the game's unsaved moves and decides whether this save takes a snapshot,
+    which it does every ``snapshot_interval`` moves, once replaying the moves since the last
+    one takes ``snapshot_seconds`` (see replay_cost), when the game ends and when one of the
+    moves placed the mines, since random placement cannot be replayed.
+
+    Returns the move rows to insert, the snapshot row (or None) and the game's new
+    ``sequence`` and ``snapshot_sequence``. The game itself is left alone, so a save that
+    fails can be retried with it; apply the counters with ``saved`` once the save commits.
+    """
+    moves = [{"game_id": game.id, "sequence": game.sequence + number, "action": action,
+              "row": row, "column": column, "created_at": created_at}
+             for number, (action, row, column, created_at) in enumerate(game.unsaved_moves, 1)]
+    sequence = game.sequence + len(moves)
+    counters = {"sequence": sequence, "snapshot_sequence": game.snapshot_sequence}
+    placed_mines = game.mines_placed_at is not None and game.mines_placed_at > game.snapshot_sequence
+    slow_replay = snapshot_seconds is not None and game.replay_seconds >= snapshot_seconds
+    if not moves or (sequence - game.snapshot_sequence < snapshot_interval and game.status == "started"
+                     and not placed_mines and not slow_replay):
+        return moves, None, counters
+    counters["snapshot_sequence"] = sequence
+    return moves, snapshot_values(game, board=placed_mines, sequence=sequence), counters
+
+
+def saved(game: Game, counters: dict):
+    """Applies the counters prepare_save returned once the save committed, and forgets the saved moves."""
+    if counters["snapshot_sequence"] != game.snapshot_sequence:
+        game.replay_seconds = 0.0
+    game.sequence = counters["sequence"]
+    game.snapshot_sequence = counters["snapshot_sequence"]
+    game.unsaved_moves.clear()
+
+
+def write(session, moves: list, snapshot: dict = None, mines_placed_at: int = None):
+    """Inserts what prepare_save returned, in the transaction that updated the games row,
+    and prunes the snapshots the new one replaces."""
+    if moves:
+        session.execute(insert(Move), moves)
+    if snapshot is not None:
+        session.execute(insert(Snapshot), [snapshot])
+        prune(session, snapshot["game_id"], snapshot["sequence"], mines_placed_at)
+
+
+def prune(session, game_id: int, latest: int, mines_placed_at: int = None):
+    """Deletes the game's snapshots from before ``latest`` except the first and the one taken
+    when the mines were placed. Returns how many were deleted."""
+    sequences = session.execute(select(Snapshot.sequence).where(and_(Snapshot.game_id==game_id, Snapshot.sequence<latest))
+                                .order_by(Snapshot.sequence)).scalars().all()
+    keep = set(sequences[:1])
+    if mines_placed_at is not None:
+        keep.update([sequence for sequence in sequences if sequence >= mines_placed_at][:1])
+    stale = [sequence for sequence in sequences if sequence not in keep]
+    if stale:
+        session.execute(delete(Snapshot).where(and_(Snapshot.game_id==game_id, Snapshot.sequence.in_(stale))))
+    return len(stale)
+
+
+@contextmanager
+def replay_cost(game: Game):
+    """Adds the time spent in the block to game.replay_seconds, the time that loading the game
+    takes to replay the moves since its snapshot. Wraps both that replay and new moves, which
+    the next load replays."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        game.replay_seconds += time.perf_counter() - start
+
+
+def replay(game: Game, moves):
+    """Applies logged moves to the game, e.g. on top of a snapshot. The moves are not logged again."""
+    service = GameService(game)
+    for move in moves:
+        getattr(service, move.action)(move.row, move.column)
+    game.unsaved_moves.clear()
+    return game
+
+
+def catch_up(session, game: Game):
+    """Brings a game loaded from the games row up to date with the moves logged after its
+    snapshot. The counters are rewound to the snapshot's and replayed with the board."""
+    return replay_since(game, *logged_since_snapshot(session, game))
+
+
+def logged_since_snapshot(session, game: Game):
+    """The latest snapshot's counters and the moves logged after it, or (None, []) when the
+    games row is up to date. Only reads, so the replay can run elsewhere (see replay_since)."""
+    if game.sequence == game.snapshot_sequence:
+        return None, []
+    # The rewound counters must never be flushed to the games row.
+    with session.no_autoflush:
+        snapshot = session.execute(select(*[getattr(Snapshot, column) for column in SNAPSHOT_COLUMNS])
+                                   .where(and_(Snapshot.game_id==game.id, Snapshot.sequence==game.snapshot_sequence))).one()
+        moves = moves_after(session, game.id, game.snapshot_sequence, game.sequence)
+    return snapshot, moves
+
+
+def replay_since(game: Game, snapshot, moves):
+    """Rewinds the game's counters to the snapshot's and replays the moves on its board."""
+    if snapshot is None:
+        return game
+    start_time, end_time = game.start_time, game.end_time
+    for column in SNAPSHOT_COLUMNS:
+        setattr(game, column, getattr(snapshot, column))
+    with replay_cost(game):
+        replay(game, moves)
+    game.start_time, game.end_time = start_time, end_time
+    return game
+
+
+def moves_after(session, game_id: int, sequence: int, until: int = None):
+    query = select(Move).where(and_(Move.game_id==game_id, Move.sequence>sequence))
+    if until is not None:
+        query = query.where(Move.sequence<=until)
+    return session.execute(query.order_by(Move.sequence)).scalars().all()
+
+
+def rebuild(session, game_id: int, sequence: int = None):
+    """Rebuilds a game from its first snapshot and its move log, as it was after move
+    ``sequence`` (the latest by default). Returns a detached Game.
+
+    Games whose mines were placed by their first clear are rebuilt from the snapshot
+    taken with that clear, unless ``sequence`` is from before it."""
+    stored = session.get(Game, game_id)
+    if stored is None:
+        return None
+    query = select(Snapshot).where(and_(Snapshot.game_id==game_id, Snapshot.board.isnot(None)))
+    placed_at = stored.mines_placed_at
+    if placed_at is not None and (sequence is None or sequence >= placed_at):
+        query = query.where(Snapshot.sequence>=placed_at)
+    snapshot = session.execute(query.order_by(Snapshot.sequence).limit(1)).scalar()
+    if snapshot is None:
+        return None
+    game = Game(id=game_id, user_id=stored.user_id, rows=stored.rows, columns=stored.columns, no_guess=stored.no_guess,
+                sequence=snapshot.sequence, snapshot_sequence=snapshot.sequence,
+                mines_placed_at=placed_at if placed_at is not None and snapshot.sequence >= placed_at else None,
+                board=load_board(snapshot.board.to_bytes()))
+    for column in SNAPSHOT_COLUMNS:
+        setattr(game, column, getattr(snapshot, column))
+    moves = moves_after(session, game_id, snapshot.sequence, sequence)
+    replay(game, moves)
+    game.sequence = moves[-1].sequence if moves else snapshot.sequence
+    return game
@@ -0,0 +1,109 @@
+"""No-guess boards: mine placements that can be solved from the first clear by deduction alone.
+
+Random placements are generated and played through with ``solver.solvable`` until one is
+solved. Most rejections happen early, at the first point where the solver finds nothing
+certain, so a rejected board costs far less than a solved one.
+"""
+import multiprocessing
+import os
+import threading
+import time
+
+from services.board import new_board, make_rng, sample_cells
+from services.solver import solvable
+
+# Largest boards and mine densities no-guess games may use. Above them solvable boards get
+# too rare to find within a request.
+MAX_CELLS = 2500
+MAX_DENSITY = 0.25
+# Seconds spent searching before the game falls back to an ordinary board.
+DEFAULT_BUDGET = 2.0
+
+
+def first_clear_cells(rows: int, columns: int, row: int, column: int):
+    """Flat indices of the clicked cell and its neighbors, which a no-guess board keeps
+    free of mines so the first clear opens an area."""
+    return [r * columns + c for r in range(max(row - 1, 0), min(row + 2, rows))
+            for c in range(max(column - 1, 0), min(column + 2, columns))]
+
+
+def find_mines(rows: int, columns: int, mines: int, row: int, column: int, seed: int = None,
+               attempts: int = 100, budget: float = None, deadline: float = None):
+    """Tries up to attempts random placements and returns the mine indices of the first board
+    solvable from a clear of (row, column), or None if none is found within budget seconds or
+    before deadline, a time.monotonic() value. The monotonic clock is shared by every process
+    on the machine, so a deadline set by the caller holds in pool workers too."""
+    if budget is not None:
+        deadline = min(time.monotonic() + budget, deadline) if deadline is not None else time.monotonic() + budget
+    rng = make_rng(seed)
+    safe = first_clear_cells(rows, columns, row, column)
+    if rows * columns - len(safe) < mines:
+        return None
+    for _ in range(attempts):
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        cells = sample_cells(rng, rows * columns, mines, safe)
+        board = new_board(rows, columns)
+        board.place_mines(cells)
+        board.calculate_values()
+        if solvable(board, row, column, deadline):
+            return cells
+    return None
+
+
+def _find_mines(args):
+    return find_mines(*args)
+
+
+class NoGuessGenerator:
+    """Searches for no-guess placements on a pool of ``processes`` worker processes.
+
+    Each round gives every worker ``batch`` attempts with its own seed, and the first
+    placement found wins. Rounds repeat until ``budget`` seconds have passed, and every task
+    stops at that same deadline, so tasks left running after a win or queued behind a busy
+    worker don't hold the pool past the budget of the call that submitted them. With a single
+    process the search runs in the calling thread. The pool is started on first use and
+    uses spawned processes, which are safe to start from a threaded server.
+    """
+
+    def __init__(self, processes: int = None, budget: float = DEFAULT_BUDGET, batch: int = 10):
+        self.processes = processes if processes is not None else os.cpu_count() or 1
+        self.budget = budget
+        self.batch = batch
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def generate(self, rows: int, columns: int, mines: int, row: int, column: int, rng):
+        """Returns the mine indices of a no-guess board for a first clear of (row, column),
+        or None if none was found in time. Worker seeds are drawn from rng."""
+        deadline = time.monotonic() + self.budget
+        if rows * columns - len(first_clear_cells(rows, columns, row, column)) < mines:
+            return None
+        if self.processes <= 1:
+            return find_mines(rows, columns, mines, row, column, seed_from(rng), attempts=2 ** 31, deadline=deadline)
+        pool = self._start()
+        while time.monotonic() < deadline:
+            tasks = [(rows, columns, mines, row, column, seed_from(rng), self.batch, None, deadline)
+                     for _ in range(self.processes)]
+            for cells in pool.imap_unordered(_find_mines, tasks):
+                if cells is not None:
+                    return cells
+        return None
+
+    def _start(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.get_context("spawn").Pool(self.processes)
+            return self._pool
+
+    def stop(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+
+
+def seed_from(rng):
+    """Draws a seed for make_rng from either kind of random generator."""
+    return int(rng.random() * 2 ** 62)
@@ -0,0 +1,382 @@
+"""Minesweeper solver behind game hints.
+
+It works on a masked board, the way a player sees it: ints for uncovered cells and C, F or ?
+for covered ones. Flags are the player's guesses, so flagged and marked cells count as covered.
+Each uncovered number gives a constraint: its covered neighbors hold exactly that many mines.
+
+The solver first propagates the constraints. A constraint whose mines are all accounted for
+makes its other cells safe, and one needing every cell makes them all mines. A constraint
+whose cells are a subset of another's leaves the difference with the difference of their
+counts. Cells still unknown after that are split into independent groups of cells sharing
+constraints. Groups of up to ``max_enumerated`` cells have every consistent arrangement of
+their mines enumerated, which gives each cell its mine probability. When the board's total
+mine count is known, each arrangement is weighted by how many ways the remaining mines fit
+in the unconstrained cells.
+
+Everything runs against a deadline. Once it passes the solver returns what it found so far
+and marks the result as incomplete.
+
+``solvable`` uses the same rules to play a whole board from its first clear, which is how
+no-guess boards are validated.
+"""
+import time
+from collections import deque
+from functools import lru_cache
+from math import comb
+
+MAX_ENUMERATED_CELLS = 40
+
+COVERED_CELLS = ("C", "F", "?")
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+def solve(board, origin=(0, 0), board_size=None, mines: int = None, budget: float = 0.2,
+          max_enumerated: int = MAX_ENUMERATED_CELLS):
+    """Solves the masked rows of board, a window whose top left cell is origin on a board of
+    board_size (rows, columns), by default the window itself. Numbers next to cells outside
+    the window but inside the board are ignored, their constraints being incomplete. mines
+    is the total number of mines when board is the whole board, otherwise None.
+
+    Returns a dict with the certainly "safe" and certain "mines" cells as [row, column]
+    pairs, the "probabilities" of the other constrained cells as [row, column, probability]
+    sorted safest first, the "unconstrained_probability" of any other covered cell, which is
+    only known with mines, and whether the solver finished ("complete") within budget seconds.
+    """
+    deadline = time.monotonic() + budget
+    height = len(board)
+    width = len(board[0]) if height else 0
+    rows, columns = board_size if board_size is not None else (height, width)
+    top, left = origin
+
+    covered = {(r, c) for r in range(height) for c in range(width) if board[r][c] in COVERED_CELLS}
+    constraints = {}
+    for r in range(height):
+        for c in range(width):
+            value = board[r][c]
+            if value in COVERED_CELLS or value < 0:
+                continue
+            neighbors = [(r + dr, c + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)
+                         if (dr or dc) and 0 <= top + r + dr < rows and 0 <= left + c + dc < columns]
+            if any(not (0 <= nr < height and 0 <= nc < width) for nr, nc in neighbors):
+                continue
+            cells = frozenset(cell for cell in neighbors if cell in covered)
+            if cells:
+                constraints[cells] = value
+
+    safe, found_mines = set(), set()
+    complete = _propagate(constraints, safe, found_mines, deadline)
+    probabilities, unconstrained = {}, None
+    if complete:
+        complete, probabilities, unconstrained = _enumerate(
+            constraints, covered - safe - found_mines, mines, len(found_mines), max_enumerated, deadline)
+        for cell, probability in list(probabilities.items()):
+            if probability == 0:
+                safe.add(cell)
+            elif probability == 1:
+                found_mines.add(cell)
+            else:
+                continue
+            del probabilities[cell]
+
+    def position(cell):
+        return [top + cell[0], left + cell[1]]
+
+    return {
+        "safe": sorted(position(cell) for cell in safe),
+        "mines": sorted(position(cell) for cell in found_mines),
+        "probabilities": [position(cell) + [round(probability, 4)] for cell, probability in
+                          sorted(probabilities.items(), key=lambda item: (item[1], item[0]))],
+        "unconstrained_probability": round(unconstrained, 4) if unconstrained is not None else None,
+        "complete": complete,
+    }
+
+
+def solvable(board, row: int, column: int, deadline: float = None, max_enumerated: int = MAX_ENUMERATED_CELLS):
+    """Whether a player clearing (row, column) first can uncover every safe cell of board
+    without guessing. Returns False as soon as no cell is certain, or once the deadline, a
+    time.monotonic() value, passes.
+
+    Play is incremental: only the numbers next to cells that changed are rechecked with the
+    single cell rule. The subset rule and the enumeration of solve, with the total mine
+    count, are only run over the whole frontier when that gets stuck.
+    """
+    deadline = float("inf") if deadline is None else deadline
+    rows, columns = board.rows, board.columns
+    size = rows * columns
+    if hasattr(board, "values"):
+        values = board.values.tolist()
+    else:
+        values = [board.value(r, c) for r in range(rows) for c in range(columns)]
+    if values[row * columns + column] < 0:
+        return False
+    mines = values.count(-1)
+    revealed = bytearray(size)
+    flagged = bytearray(size)
+    safe_left = size - mines
+    # Revealed numbers that may still have unknown neighbors.
+    frontier = set()
+
+    neighbors = _adjacency(rows, columns).__getitem__
+
+    def reveal(index: int):
+        nonlocal safe_left
+        queue = deque([index])
+        while queue:
+            cell = queue.popleft()
+            if revealed[cell]:
+                continue
+            revealed[cell] = 1
+            safe_left -= 1
+            if values[cell] == 0:
+                queue.extend(neighbor for neighbor in neighbors(cell) if not revealed[neighbor])
+            else:
+                frontier.add(cell)
+                dirty.append(cell)
+            dirty.extend(neighbor for neighbor in neighbors(cell) if revealed[neighbor] and values[neighbor] > 0)
+
+    def unknown_of(number: int):
+        cells = [cell for cell in neighbors(number) if not revealed[cell] and not flagged[cell]]
+        return cells, values[number] - sum(flagged[cell] for cell in neighbors(number))
+
+    dirty = deque()
+    reveal(row * columns + column)
+    flags = 0
+    while safe_left:
+        if time.monotonic() > deadline:
+            return False
+        while dirty:
+            number = dirty.popleft()
+            if number not in frontier:
+                continue
+            cells, remaining = unknown_of(number)
+            if not cells:
+                frontier.discard(number)
+            elif remaining == 0:
+                for cell in cells:
+                    reveal(cell)
+            elif remaining == len(cells):
+                for cell in cells:
+                    flagged[cell] = 1
+                    dirty.extend(neighbor for neighbor in neighbors(cell) if revealed[neighbor])
+                flags += len(cells)
+        if not safe_left:
+            break
+
+        constraints = {}
+        for number in frontier:
+            cells, remaining = unknown_of(number)
+            if cells:
+                constraints[frozenset(cells)] = remaining
+        safe, found = set(), set()
+        if not _propagate(constraints, safe, found, deadline):
+            return False
+        if not safe and not found:
+            unknown = {cell for cell in range(size) if not revealed[cell] and not flagged[cell]}
+            _, probabilities, unconstrained = _enumerate(constraints, unknown, mines, flags, max_enumerated, deadline)
+            safe = {cell for cell, probability in probabilities.items() if probability == 0}
+            found = {cell for cell, probability in probabilities.items() if probability == 1}
+            if unconstrained == 0:
+                constrained = {cell for cells in constraints for cell in cells}
+                safe.update(unknown - constrained)
+        if not safe and not found:
+            return False
+        for cell in found:
+            flagged[cell] = 1
+            dirty.extend(neighbor for neighbor in neighbors(cell) if revealed[neighbor])
+        flags += len(found)
+        for cell in safe:
+            reveal(cell)
+    return True
+
+
+@lru_cache(maxsize=16)
+def _adjacency(rows: int, columns: int):
+    """The flat indices of each cell's neighbors, shared by every board of that size."""
+    return tuple([nr * columns + nc for nr in range(max(r - 1, 0), min(r + 2, rows))
+                  for nc in range(max(c - 1, 0), min(c + 2, columns)) if nr != r or nc != c]
+                 for r in range(rows) for c in range(columns))
+
+
+def _propagate(constraints: dict, safe: set, mines: set, deadline: float):
+    """Applies the single cell and subset rules until they find nothing new, updating
+    constraints, safe and mines in place. Returns False if the deadline passed first."""
+    changed = True
+    while changed:
+        if time.monotonic() > deadline:
+            return False
+        changed = False
+        reduced = {}
+        for cells, count in constraints.items():
+            count -= len(cells & mines)
+            cells = cells - mines - safe
+            if not cells:
+                continue
+            if count == 0:
+                safe.update(cells)
+                changed = True
+            elif count == len(cells):
+                mines.update(cells)
+                changed = True
+            else:
+                reduced[cells] = count
+        constraints.clear()
+        constraints.update(reduced)
+        if changed:
+            continue
+
+        by_cell = {}
+        for cells in constraints:
+            for cell in cells:
+                by_cell.setdefault(cell, []).append(cells)
+        derived = {}
+        for cells, count in constraints.items():
+            others = {other for cell in cells for other in by_cell[cell] if len(other) > len(cells)}
+            for other in others:
+                if cells < other:
+                    difference = other - cells
+                    if difference not in constraints and difference not in derived:
+                        derived[difference] = constraints[other] - count
+        if derived:
+            constraints.update(derived)
+            changed = True
+    return True
+
+
+def _enumerate(constraints: dict, unknown: set, mines: int, found_mines: int, max_enumerated: int,
+               deadline: float):
+    """Returns (complete, probabilities of the constrained cells, probability of the other
+    unknown cells or None) by enumerating the mine arrangements of each group of cells."""
+    groups = _groups(constraints)
+    complete = True
+    enumerated = []
+    for cells, group_constraints in groups:
+        if len(cells) > max_enumerated:
+            complete = False
+            continue
+        try:
+            enumerated.append((cells, _arrangements(cells, group_constraints, deadline)))
+        except _OutOfTime:
+            return False, {}, None
+
+    constrained = {cell for cells, _ in groups for cell in cells}
+    free = len(unknown - constrained)
+    probabilities = {}
+    if mines is None or not complete:
+        # Without the total each group's arrangements are taken as equally likely.
+        for cells, (ways, hits) in enumerated:
+            total = sum(ways.values())
+            for index, cell in enumerate(cells):
+                probabilities[cell] = sum(counts[index] for counts in hits.values()) / total
+        return complete, probabilities, None
+
+    remaining = mines - found_mines
+    weight = lambda placed: comb(free, remaining - placed) if 0 <= remaining - placed <= free else 0
+    # others[i] is how many ways the groups other than i place each number of mines.
+    distributions = [ways for _, (ways, _) in enumerated]
+    prefix = [{0: 1}]
+    for ways in distributions:
+        prefix.append(_convolve(prefix[-1], ways))
+    suffix = [{0: 1}]
+    for ways in reversed(distributions):
+        suffix.append(_convolve(suffix[-1], ways))
+    suffix.reverse()
+    others = [_convolve(prefix[i], suffix[i + 1]) for i in range(len(distributions))]
+
+    every = prefix[-1]
+    total = sum(count * weight(placed) for placed, count in every.items())
+    if total == 0:
+        return False, {}, None
+    for (cells, (ways, hits)), rest in zip(enumerated, others):
+        for index, cell in enumerate(cells):
+            hits_of_cell = sum(counts[index] * sum(count * weight(placed + other) for other, count in rest.items())
+                               for placed, counts in hits.items())
+            probabilities[cell] = 1 if hits_of_cell == total else hits_of_cell / total
+    unconstrained = None
+    if free:
+        unconstrained = sum(count * weight(placed) * (remaining - placed) for placed, count in every.items()) / (total * free)
+    return True, probabilities, unconstrained
+
+
+def _groups(constraints: dict):
+    """Splits the constrained cells into groups that share no constraint, returning
+    (cells, constraints) pairs with the cells in an order that fills constraints early."""
+    parent = {}
+
+    def find(cell):
+        while parent[cell] != cell:
+            parent[cell] = parent[parent[cell]]
+            cell = parent[cell]
+        return cell
+
+    for cells in constraints:
+        for cell in cells:
+            parent.setdefault(cell, cell)
+        first = find(next(iter(cells)))
+        for cell in cells:
+            parent[find(cell)] = first
+
+    grouped = {}
+    for cells, count in sorted(constraints.items(), key=lambda item: sorted(item[0])):
+        grouped.setdefault(find(next(iter(cells))), []).append((cells, count))
+    groups = []
+    for group_constraints in grouped.values():
+        ordered, seen = [], set()
+        for cells, _ in group_constraints:
+            for cell in sorted(cells - seen):
+                seen.add(cell)
+                ordered.append(cell)
+        groups.append((ordered, group_constraints))
+    return groups
+
+
+def _arrangements(cells: list, constraints: list, deadline: float):
+    """Backtracks over the mine arrangements of cells satisfying constraints. Returns
+    (ways, hits): ways[k] counts the arrangements with k mines and hits[k][i] how many of
+    those have a mine on cells[i]."""
+    index = {cell: i for i, cell in enumerate(cells)}
+    needed = [count for _, count in constraints]
+    unassigned = [len(group_cells) for group_cells, _ in constraints]
+    of_cell = [[] for _ in cells]
+    for number, (group_cells, _) in enumerate(constraints):
+        for cell in group_cells:
+            of_cell[index[cell]].append(number)
+    assignment = [0] * len(cells)
+    ways, hits = {}, {}
+    steps = 0
+
+    def place(i: int, placed: int):
+        nonlocal steps
+        if i == len(cells):
+            ways[placed] = ways.get(placed, 0) + 1
+            counts = hits.setdefault(placed, [0] * len(cells))
+            for j, mine in enumerate(assignment):
+                counts[j] += mine
+            return
+        steps += 1
+        if steps % 1024 == 0 and time.monotonic() > deadline:
+            raise _OutOfTime()
+        for mine in (0, 1):
+            for number in of_cell[i]:
+                needed[number] -= mine
+                unassigned[number] -= 1
+            if all(0 <= needed[number] <= unassigned[number] for number in of_cell[i]):
+                assignment[i] = mine
+                place(i + 1, placed + mine)
+            for number in of_cell[i]:
+                needed[number] += mine
+                unassigned[number] += 1
+        assignment[i] = 0
+
+    place(0, 0)
+    return ways, hits
+
+
+def _convolve(first: dict, second: dict):
+    result = {}
+    for a, ways_a in first.items():
+        for b, ways_b in second.items():
+            result[a + b] = result.get(a + b, 0) + ways_a * ways_b
+    return result
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# What handlers get as current_user: enough to own games without loading the users row.
+CurrentUser = namedtuple("CurrentUser", ["id", "email"])
+
+
+class TokenCache:
+    """Bounded cache of already verified JWTs mapped to the CurrentUser they belong to.
+
+    Entries live for ``ttl_seconds`` and never past the token's own ``exp`` claim. The
+    least recently used token is dropped once ``max_size`` is reached; a size of 0
+    disables the cache.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 300, clock=time.time):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if self.clock() >= expires_at:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return user
+
+    def put(self, token: str, user: CurrentUser, token_expiry: float = None):
+        if self.max_size <= 0:
+            return
+        expires_at = self.clock() + self.ttl_seconds
+        if token_expiry is not None:
+            expires_at = min(expires_at, token_expiry)
+        with self._lock:
+            self._entries[token] = (user, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, email: str):
+        """Forgets every token of a user, e.g. once the user is removed."""
+        with self._lock:
+            for token in [token for token, (user, _) in self._entries.items() if user.email == email]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,132 @@
+"""Per-backend database tuning.
+
+``configure_storage`` picks the StorageEngine matching ``SQLALCHEMY_DATABASE_URI`` and
+turns its settings into ``SQLALCHEMY_ENGINE_OPTIONS`` plus a per-connection hook, so
+the rest of the app stays backend agnostic.
+"""
+import sqlite3
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+
+DEFAULT_URI = "sqlite:///:memory:"
+# Drivers used by the ASGI serving mode.
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+class StorageEngine:
+    """Base engine: no extra options and nothing to run on new connections."""
+    name = None
+
+    def __init__(self, url, config: dict):
+        self.url = url
+        self.config = config
+
+    def engine_options(self):
+        return {}
+
+    def on_connect(self, dbapi_connection):
+        pass
+
+
+class SQLiteEngine(StorageEngine):
+    """SQLite allows a single writer, so readers should not block it (WAL) and writers
+    should wait for each other instead of failing straight away (busy timeout)."""
+    name = "sqlite"
+
+    @property
+    def in_memory(self):
+        return self.url.database in (None, "", ":memory:")
+
+    def engine_options(self):
+        busy_timeout = self.config.get("SQLITE_BUSY_TIMEOUT_MS", 5000)
+        return {"connect_args": {"timeout": busy_timeout / 1000}}
+
+    def on_connect(self, dbapi_connection):
+        cursor = dbapi_connection.cursor()
+        if not self.in_memory:
+            cursor.execute(f"PRAGMA journal_mode={self.config.get('SQLITE_JOURNAL_MODE', 'WAL')}")
+        cursor.execute(f"PRAGMA synchronous={self.config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+        cursor.execute(f"PRAGMA busy_timeout={int(self.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+        cursor.close()
+
+
+class PostgresEngine(StorageEngine):
+    """Sized connection pool shared by a worker's threads, with connections checked
+    before use so a restarted server does not surface as request errors."""
+    name = "postgresql"
+
+    def engine_options(self):
+        options = {
+            "pool_size": self.config.get("DB_POOL_SIZE", 10),
+            "max_overflow": self.config.get("DB_MAX_OVERFLOW", 20),
+            "pool_timeout": self.config.get("DB_POOL_TIMEOUT", 30),
+            "pool_recycle": self.config.get("DB_POOL_RECYCLE", 1800),
+            "pool_pre_ping": True,
+            "query_cache_size": self.config.get("DB_STATEMENT_CACHE_SIZE", 500),
+        }
+        if self.url.get_driver_name() == "psycopg":
+            # Server-side prepared statements after a statement has run this many times.
+            options["connect_args"] = {"prepare_threshold": self.config.get("DB_PREPARE_THRESHOLD", 5)}
+        return options
+
+
+ENGINES = {engine.name: engine for engine in (SQLiteEngine, PostgresEngine)}
+
+
+def storage_for(uri: str, config: dict):
+    url = make_url(uri or DEFAULT_URI)
+    return ENGINES.get(url.get_backend_name(), StorageEngine)(url, config)
+
+
+@event.listens_for(Engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    # Flask-SQLAlchemy only opens connections inside an app context, which tells us whose settings apply.
+    if not has_app_context():
+        return
+    storage = current_app.extensions.get("storage")
+    if storage is None or isinstance(dbapi_connection, sqlite3.Connection) != isinstance(storage, SQLiteEngine):
+        return
+    storage.on_connect(dbapi_connection)
+
+
+def configure_storage(app):
+    """Applies the tuning for the app's database. Must run before db.init_app."""
+    storage = storage_for(app.config.get("SQLALCHEMY_DATABASE_URI"), app.config)
+    options = storage.engine_options()
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+    app.extensions["storage"] = storage
+    return storage
+
+
+def async_database_uri(uri: str):
+    """Points a database URI at the async driver of its backend."""
+    url = make_url(uri or DEFAULT_URI)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for {backend} databases")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def create_async_database(config: dict):
+    """Creates an AsyncEngine for SQLALCHEMY_DATABASE_URI with the same tuning as the Flask app."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = async_database_uri(config.get("SQLALCHEMY_DATABASE_URI"))
+    storage = storage_for(url, config)
+    options = storage.engine_options()
+    if isinstance(storage, SQLiteEngine) and storage.in_memory:
+        # Every connection would otherwise get its own empty database.
+        options["poolclass"] = StaticPool
+    elif isinstance(storage, SQLiteEngine):
+        # SQLite files are not pooled by default, and each aiosqlite connection is a new thread.
+        options["poolclass"] = AsyncAdaptedQueuePool
+        options["pool_size"] = config.get("DB_POOL_SIZE", 10)
+    engine = create_async_engine(url, **options)
+    event.listen(engine.sync_engine, "connect",
+                 lambda dbapi_connection, connection_record: storage.on_connect(dbapi_connection))
+    return engine
+
@@ -1,6 +1,20 @@
+import gzip
+import json
 import pytest
 
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import migrations
+import app as app_module
 from app import app, db
+from models import Game, User, Move, Snapshot
+from services import move_log
+from services.board_pool import BoardPool
+from services.game_cache import GameCache
+from services.encoded_game_cache import EncodedGameCache
+from services.no_guess import NoGuessGenerator
+from services.solver import solvable
 
 @pytest.fixture
 def client():
@@ -144,3 +158,503 @@ def test_toggle_cell(client):
 
     assert new_board[0][0] == "F"
     
+
+def test_upgrade_db_packs_legacy_boards(client):
+    legacy = [[{"value": 0, "status": "C"}, {"value": -1, "status": "C"}]]
+    with app.app_context():
+        db.session.execute(text("INSERT INTO games (user_id, rows, columns, mines_left, status, board) "
+                                "VALUES (1, 1, 2, 1, 'started', :board)"), {"board": json.dumps(legacy)})
+        db.session.commit()
+
+        results = dict(migrations.upgrade())
+        assert results["pack_legacy_boards"] == 1
+        assert results["add_game_counters"] == 1
+        assert results["add_move_log"] == 1
+        assert all(result == 0 for result in dict(migrations.upgrade()).values())
+
+def test_clear_cell_delta_mode(client):
+    response = start_game(client)
+    game_id = response.json["id"]
+    assert response.json["version"] == 0
+
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+    toggle = client.post(f'/games/{game_id}/toggle', json={"row": 0, "column": 0},
+                         headers={"x-access-tokens": token, "X-Response-Mode": "delta"}).json
+    assert "board" not in toggle
+    assert toggle["cells"] == [[0, 0, "F"]]
+    assert toggle["base_version"] == 0 and toggle["version"] == 1
+
+    delta = client.post(f'/games/{game_id}/clear?mode=delta', json={"row": 0, "column": 1},
+                        headers={"x-access-tokens": token}).json
+    assert delta["base_version"] == 1 and delta["version"] == 2
+    assert [0, 1] in [cell[:2] for cell in delta["cells"]]
+
+    full = retrieve_game(client, game_id).json
+    assert full["version"] == 2
+    for row, column, value in delta["cells"]:
+        assert full["board"][row][column] == value
+
+def test_moves_go_through_the_game_cache(client, monkeypatch):
+    cache = GameCache(app_module.persist_game, flush_seconds=3600)
+    monkeypatch.setattr(app_module, "game_cache", cache)
+
+    game_id = start_game(client).json["id"]
+    toggle_cell(client, game_id, 0, 0)
+
+    assert retrieve_game(client, game_id).json["board"][0][0] == "F"
+    with app.app_context():
+        assert Game.query.get(game_id).board.status(0, 0) == "C"
+
+    cache.flush_all()
+    with app.app_context():
+        stored = Game.query.get(game_id)
+        assert app_module.find_game(stored.user_id, game_id).board.status(0, 0) == "F"
+
+def test_cached_moves_survive_a_failed_flush(client, monkeypatch):
+    cache = GameCache(app_module.persist_game, flush_seconds=3600)
+    monkeypatch.setattr(app_module, "game_cache", cache)
+    game_id = start_game(client).json["id"]
+    toggle_cell(client, game_id, 0, 0)
+
+    write = move_log.write
+    def unreachable(*args):
+        raise OperationalError("INSERT INTO moves", {}, Exception("database is locked"))
+    monkeypatch.setattr(move_log, "write", unreachable)
+    with pytest.raises(OperationalError):
+        cache.flush_all()
+    monkeypatch.setattr(move_log, "write", write)
+
+    cache.flush_all()
+    with app.app_context():
+        stored = Game.query.get(game_id)
+        assert (stored.version, stored.flags, stored.sequence) == (1, 1, 1)
+        assert app_module.find_game(stored.user_id, game_id).board.status(0, 0) == "F"
+
+def test_retrieve_game_viewport(client):
+    game_id = start_game(client).json["id"]
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+
+    response = client.get(f'/games/{game_id}?row=8&column=2&height=5&width=3', headers={"x-access-tokens": token})
+    assert response.json["viewport"] == {"row": 8, "column": 2, "height": 2, "width": 3}
+    assert len(response.json["board"]) == 2 and len(response.json["board"][0]) == 3
+
+    response = client.get(f'/games/{game_id}?height=0', headers={"x-access-tokens": token})
+    assert response.status_code == 400
+
+def test_retrieve_game_board_formats(client):
+    game_id = start_game(client).json["id"]
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+    toggle_cell(client, game_id, 0, 2)
+
+    response = client.get(f'/games/{game_id}?board_format=rows', headers={"x-access-tokens": token})
+    assert response.json["board_format"] == "rows"
+    assert response.json["board"][0] == "CCFCCCCCCC"
+
+    response = client.get(f'/games/{game_id}?board_format=rle&row=0&height=2', headers={"x-access-tokens": token})
+    assert response.json["board"] == [[2, "F", 7], [10]]
+
+    response = client.post(f'/games/{game_id}/toggle?board_format=rows', json={"row": 0, "column": 2},
+                           headers={"x-access-tokens": token})
+    assert response.json["board"][0] == "CC?CCCCCCC"
+
+    response = client.get(f'/games/{game_id}?board_format=png', headers={"x-access-tokens": token})
+    assert response.status_code == 400
+    assert "board_format" in response.json
+
+def test_large_responses_are_compressed(client):
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+    game_id = client.post('/games', headers={"x-access-tokens": token},
+                          json={"rows": 50, "columns": 50, "mines": 100}).json["id"]
+
+    plain = client.get(f'/games/{game_id}', headers={"x-access-tokens": token})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["Vary"] == "Accept-Encoding"
+
+    headers = {"x-access-tokens": token, "Accept-Encoding": "gzip"}
+    response = client.get(f'/games/{game_id}', headers=headers)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == f'W/{plain.headers["ETag"]}'
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+    assert client.get(f'/games/{game_id}', headers=dict(headers, **{"If-None-Match": response.headers["ETag"]})).status_code == 304
+
+    response = client.post(f'/games/{game_id}/toggle', json={"row": 0, "column": 0}, headers=headers)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.get_data()))["board"][0][0] == "F"
+
+    # Small bodies are not worth compressing.
+    response = client.post(f'/games/{game_id}/toggle?mode=delta', json={"row": 0, "column": 0}, headers=headers)
+    assert "Content-Encoding" not in response.headers
+
+def test_game_hint(client, monkeypatch):
+    monkeypatch.setattr(app_module, "hints", EncodedGameCache())
+    game_id = start_game(client).json["id"]
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+
+    response = client.get(f'/games/{game_id}/hint', headers={"x-access-tokens": token})
+    assert response.status_code == 200
+    assert response.json["unconstrained_probability"] == 0.0
+
+    clear_cell(client, game_id, 5, 5)
+    response = client.get(f'/games/{game_id}/hint', headers={"x-access-tokens": token})
+    hint = response.json
+    assert hint["version"] == 1 and hint["complete"]
+    assert response.headers["ETag"] == '"1"'
+    assert app_module.hints.get(game_id, 1, None) == hint
+    board = retrieve_game(client, game_id).json["board"]
+    assert all(board[r][c] == "C" for r, c in hint["safe"] + hint["mines"])
+
+    response = client.get(f'/games/{game_id}/hint?height=0', headers={"x-access-tokens": token})
+    assert response.status_code == 400
+    response = client.get('/games/999/hint', headers={"x-access-tokens": token})
+    assert response.status_code == 404
+
+def test_apply_moves(client):
+    game_id = start_game(client).json["id"]
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+    moves = [{"action": "toggle", "row": 0, "column": 0},
+             {"action": "toggle", "row": 0, "column": 0},
+             {"action": "toggle", "row": 1, "column": 1}]
+
+    response = client.post(f'/games/{game_id}/moves?mode=delta', json={"moves": moves}, headers={"x-access-tokens": token})
+    assert response.json["applied"] == 3
+    assert response.json["version"] == 3
+    assert response.json["cells"] == [[0, 0, "?"], [1, 1, "F"]]
+
+    board = retrieve_game(client, game_id).json["board"]
+    assert board[0][0] == "?" and board[1][1] == "F"
+
+def test_apply_moves_rejects_invalid_batches(client):
+    game_id = start_game(client).json["id"]
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+
+    response = client.post(f'/games/{game_id}/moves', json={"moves": [{"action": "dig", "row": 0, "column": 0}]},
+                           headers={"x-access-tokens": token})
+    assert response.status_code == 400
+
+    moves = [{"action": "toggle", "row": 0, "column": 0}, {"action": "toggle", "row": 99, "column": 0}]
+    response = client.post(f'/games/{game_id}/moves', json={"moves": moves}, headers={"x-access-tokens": token})
+    assert response.status_code == 400
+    assert retrieve_game(client, game_id).json["board"][0][0] == "C"
+
+def test_deleting_a_user_invalidates_cached_tokens(client):
+    register(client, "gone@gmail.com", "bananasurf123")
+    token = authenticate(client, "gone@gmail.com", "bananasurf123").json["token"]
+    assert client.get('/games', headers={"x-access-tokens": token}).status_code == 200
+    assert app_module.token_cache.get(token) is not None
+
+    with app.app_context():
+        db.session.delete(User.query.filter_by(email="gone@gmail.com").first())
+        db.session.commit()
+
+    assert app_module.token_cache.get(token) is None
+    assert client.get('/games', headers={"x-access-tokens": token}).status_code == 401
+
+def test_chord_cell(client):
+    game_id = start_game(client).json["id"]
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+
+    response = client.post(f'/games/{game_id}/chord', json={"row": 0, "column": 0}, headers={"x-access-tokens": token})
+    assert response.status_code == 200
+    assert response.json["version"] == 0
+
+    response = client.post(f'/games/{game_id}/chord', json={"row": 0}, headers={"x-access-tokens": token})
+    assert response.status_code == 400
+
+def test_list_games_pagination_and_status_filter(client):
+    register(client, "pages@gmail.com", "bananasurf123")
+    token = authenticate(client, "pages@gmail.com", "bananasurf123").json["token"]
+    headers = {"x-access-tokens": token}
+    # Crowded enough that the first clear, which never hits a mine, cannot win either.
+    game_ids = [client.post('/games', headers=headers, json={"rows": 5, "columns": 5, "mines": 20}).json["id"]
+                for _ in range(5)]
+    client.post(f'/games/{game_ids[1]}/clear', headers=headers, json={"row": 0, "column": 0})
+    with app.app_context():
+        board = Game.query.get(game_ids[1]).board
+        mine = next((r, c) for r in range(5) for c in range(5) if board.is_mine(r, c))
+    moves = client.post(f'/games/{game_ids[1]}/clear', headers=headers, json={"row": mine[0], "column": mine[1]})
+    assert moves.json["status"] == "lost"
+
+    first = client.get('/games?limit=2', headers=headers).json
+    assert [game["id"] for game in first["games"]] == game_ids[:2]
+    assert first["games"][0]["rows"] == 5 and "board" not in first["games"][0]
+    assert first["next"] == game_ids[1]
+
+    rest = client.get(f'/games?limit=10&after={first["next"]}', headers=headers).json
+    assert [game["id"] for game in rest["games"]] == game_ids[2:]
+    assert rest["next"] is None
+
+    lost = client.get('/games?status=lost', headers=headers).json
+    assert [game["id"] for game in lost["games"]] == [game_ids[1]]
+
+    assert client.get('/games?limit=0', headers=headers).status_code == 400
+    assert client.get('/games?status=paused', headers=headers).status_code == 400
+
+def test_conditional_moves(client):
+    game_id = start_game(client).json["id"]
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+    version = retrieve_game(client, game_id).json["version"]
+
+    response = client.post(f'/games/{game_id}/toggle', json={"row": 0, "column": 0},
+                           headers={"x-access-tokens": token, "If-Match": f'"{version}"'})
+    assert response.status_code == 200
+    assert response.json["version"] == version + 1
+
+    # A second tab still holding the old version.
+    response = client.post(f'/games/{game_id}/toggle', json={"row": 0, "column": 1},
+                           headers={"x-access-tokens": token, "If-Match": str(version)})
+    assert response.status_code == 409
+    assert retrieve_game(client, game_id).json["board"][0][1] == "C"
+
+    response = client.post(f'/games/{game_id}/toggle', json={"row": 0, "column": 1},
+                           headers={"x-access-tokens": token, "If-Match": "latest"})
+    assert response.status_code == 400
+
+def test_move_is_replayed_after_a_concurrent_save(client, monkeypatch):
+    game_id = start_game(client).json["id"]
+    update_game = app_module.update_game
+    saves = []
+
+    def racing_update_game(user_id, game_id, game, expected_version=None):
+        if not saves:
+            # Another request saves the game between this one loading and saving it.
+            db.session.execute(text("UPDATE games SET version = version + 1 WHERE id = :id"), {"id": game_id})
+            db.session.commit()
+        saves.append(expected_version)
+        return update_game(user_id, game_id, game, expected_version)
+
+    monkeypatch.setattr(app_module, "update_game", racing_update_game)
+    response = toggle_cell(client, game_id, 0, 0)
+    assert response.status_code == 200
+    assert saves == [0, 1]
+    assert response.json["version"] == 2
+
+    monkeypatch.setitem(app.config, "GAME_UPDATE_RETRIES", 0)
+    saves.clear()
+    assert toggle_cell(client, game_id, 0, 0).status_code == 409
+
+def test_retrieve_game_etag(client):
+    game_id = start_game(client).json["id"]
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+
+    response = retrieve_game(client, game_id)
+    etag = response.headers["ETag"]
+    assert etag == f'"{response.json["version"]}"'
+    assert app_module.encoded_games.get(game_id, response.json["version"], (None, "cells", None)) == (response.get_data(), None)
+
+    response = client.get(f'/games/{game_id}', headers={"x-access-tokens": token, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+
+    moved = toggle_cell(client, game_id, 0, 0)
+    assert moved.headers["ETag"] != etag
+    response = client.get(f'/games/{game_id}', headers={"x-access-tokens": token, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["board"][0][0] == "F"
+    assert response.headers["ETag"] == moved.headers["ETag"]
+
+    # Clearing the flagged cell changes nothing, the start time included, so the ETag still holds.
+    clear_cell(client, game_id, 0, 0)
+    response = client.get(f'/games/{game_id}', headers={"x-access-tokens": token, "If-None-Match": moved.headers["ETag"]})
+    assert response.status_code == 304
+    assert retrieve_game(client, game_id).json["start_time"] is None
+
+def read_event(stream):
+    event = next(stream).decode()
+    name, data = event.strip().split("\n")
+    return name[len("event: "):], json.loads(data[len("data: "):])
+
+def test_game_events(client):
+    game_id = start_game(client).json["id"]
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+
+    response = client.get(f'/games/{game_id}/events?token={token}', buffered=False)
+    assert response.mimetype == "text/event-stream"
+    stream = iter(response.response)
+    name, state = read_event(stream)
+    assert name == "state" and state["board"][0][0] == "C"
+
+    toggle_cell(client, game_id, 0, 0)
+    name, delta = read_event(stream)
+    assert name == "delta"
+    assert delta["base_version"] == state["version"]
+    assert delta["cells"] == [[0, 0, "F"]]
+
+    moves = client.post(f'/games/{game_id}/moves', headers={"x-access-tokens": token},
+                        json={"moves": [{"action": "clear", "row": r, "column": c} for r in range(10) for c in range(10)]})
+    name, delta = read_event(stream)
+    assert delta["status"] == moves.json["status"] != "started"
+    assert list(stream) == []
+    response.close()
+    assert not app_module.broker.has_subscribers(app_module.game_channel(game_id))
+
+    assert client.get(f'/games/{game_id}/events').status_code == 401
+    assert client.get(f'/games/{game_id}/events?token=nope').status_code == 401
+    assert client.get(f'/games/999/events?token={token}').status_code == 404
+    assert client.get(f'/games/abc/events?token={token}').status_code == 404
+
+def test_game_events_with_a_zero_padded_id(client):
+    game_id = start_game(client).json["id"]
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+
+    response = client.get(f'/games/0{game_id}/events?token={token}', buffered=False)
+    stream = iter(response.response)
+    assert read_event(stream)[0] == "state"
+    toggle_cell(client, game_id, 0, 0)
+    name, delta = read_event(stream)
+    assert name == "delta" and delta["cells"] == [[0, 0, "F"]]
+    response.close()
+
+def test_moves_are_logged_between_snapshots(client, monkeypatch):
+    monkeypatch.setitem(app.config, "MOVE_SNAPSHOT_INTERVAL", 3)
+    monkeypatch.setitem(app.config, "MOVE_SNAPSHOT_SECONDS", None)
+    game_id = start_game(client).json["id"]
+    for column in range(4):
+        toggle_cell(client, game_id, 0, column)
+    toggle_cell(client, game_id, 0, 3)
+
+    with app.app_context():
+        stored = Game.query.get(game_id)
+        assert (stored.sequence, stored.snapshot_sequence) == (5, 3)
+        # The stored board is the snapshot, the last two moves are replayed on load.
+        assert stored.board.status(0, 2) == "F" and stored.board.status(0, 3) == "C"
+        assert [(move.action, move.column) for move in Move.query.filter_by(game_id=game_id).order_by(Move.sequence)] == \
+            [("toggle", 0), ("toggle", 1), ("toggle", 2), ("toggle", 3), ("toggle", 3)]
+        assert [snapshot.sequence for snapshot in Snapshot.query.filter_by(game_id=game_id)] == [0, 3]
+
+    game = retrieve_game(client, game_id).json
+    assert game["board"][0][:4] == ["F", "F", "F", "?"]
+    assert game["mines_left"] == 17 and game["version"] == 5
+
+    with app.app_context():
+        rebuilt = move_log.rebuild(db.session, game_id)
+        assert rebuilt.board == app_module.find_game(stored.user_id, game_id).board
+        assert (rebuilt.sequence, rebuilt.version, rebuilt.mines_left) == (5, 5, 17)
+        assert move_log.rebuild(db.session, game_id, sequence=1).board.status(0, 1) == "C"
+
+def test_only_the_snapshots_rebuild_and_catch_up_read_are_kept(client, monkeypatch):
+    monkeypatch.setitem(app.config, "MOVE_SNAPSHOT_INTERVAL", 2)
+    monkeypatch.setitem(app.config, "MOVE_SNAPSHOT_SECONDS", None)
+    game_id = start_game(client).json["id"]
+    toggle_cell(client, game_id, 9, 9)
+    toggle_cell(client, game_id, 9, 9)
+    assert clear_cell(client, game_id, 0, 0).json["status"] == "started"
+    for _ in range(4):
+        toggle_cell(client, game_id, 9, 9)
+
+    with app.app_context():
+        stored = Game.query.get(game_id)
+        assert (stored.mines_placed_at, stored.snapshot_sequence) == (3, 7)
+        snapshots = Snapshot.query.filter_by(game_id=game_id).order_by(Snapshot.sequence).all()
+        assert [snapshot.sequence for snapshot in snapshots] == [0, 3, 7]
+        assert snapshots[1].board.count_mines() == 20 and snapshots[2].board is None
+        rebuilt = move_log.rebuild(db.session, game_id)
+        assert rebuilt.board == app_module.find_game(stored.user_id, game_id).board
+
+def test_upgrade_db_slims_snapshots(client, monkeypatch):
+    monkeypatch.setitem(app.config, "MOVE_SNAPSHOT_INTERVAL", 1)
+    monkeypatch.setattr(move_log, "prune", lambda *args: 0)
+    game_id = start_game(client).json["id"]
+    for _ in range(3):
+        toggle_cell(client, game_id, 9, 9)
+    with app.app_context():
+        columns = "game_id, sequence, board, status, mines_left, mines, flags, covered_safe_cells, version, created_at"
+        db.session.execute(text("ALTER TABLE snapshots RENAME TO snapshots_new"))
+        db.session.execute(text("CREATE TABLE snapshots (game_id INTEGER NOT NULL, sequence INTEGER NOT NULL, "
+                                "board BLOB NOT NULL, status VARCHAR(7) NOT NULL, mines_left INTEGER NOT NULL, "
+                                "mines INTEGER, flags INTEGER, covered_safe_cells INTEGER, version INTEGER NOT NULL, "
+                                "created_at DATETIME NOT NULL, PRIMARY KEY (game_id, sequence))"))
+        # Before, every snapshot had its board.
+        db.session.execute(text(f"INSERT INTO snapshots ({columns}) SELECT "
+                                + columns.replace("board", "(SELECT board FROM games WHERE games.id = game_id)")
+                                + " FROM snapshots_new"))
+        db.session.execute(text("DROP TABLE snapshots_new"))
+        db.session.commit()
+        monkeypatch.undo()
+
+        assert dict(migrations.upgrade())["slim_snapshots"] == 2
+        snapshots = Snapshot.query.filter_by(game_id=game_id).order_by(Snapshot.sequence).all()
+        assert [(snapshot.sequence, snapshot.board is None) for snapshot in snapshots] == [(0, False), (3, True)]
+        assert dict(migrations.upgrade())["slim_snapshots"] == 0
+
+def test_finished_games_are_snapshotted(client):
+    game_id = start_game(client).json["id"]
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+    client.post(f'/games/{game_id}/moves', headers={"x-access-tokens": token},
+                json={"moves": [{"action": "clear", "row": r, "column": c} for r in range(10) for c in range(10)]})
+    with app.app_context():
+        stored = Game.query.get(game_id)
+        assert stored.status != "started"
+        assert stored.snapshot_sequence == stored.sequence > 0
+
+def test_first_clear_places_mines_and_snapshots_them(client):
+    game_id = start_game(client).json["id"]
+    with app.app_context():
+        assert Game.query.get(game_id).board.count_mines() == 0
+    toggle_cell(client, game_id, 9, 9)
+    response = clear_cell(client, game_id, 0, 0)
+    assert response.json["status"] in ("started", "won")
+    assert response.json["board"][0][0] not in ("C", "M")
+    toggle_cell(client, game_id, 9, 9)
+
+    with app.app_context():
+        stored = Game.query.get(game_id)
+        assert (stored.mines_placed_at, stored.snapshot_sequence, stored.sequence) == (2, 2, 3)
+        assert [snapshot.sequence for snapshot in Snapshot.query.filter_by(game_id=game_id)] == [0, 2]
+        rebuilt = move_log.rebuild(db.session, game_id)
+        assert rebuilt.board == app_module.find_game(stored.user_id, game_id).board
+        before = move_log.rebuild(db.session, game_id, sequence=1)
+        assert before.mines_placed_at is None and before.board.count_mines() == 0
+
+def test_no_guess_game(client, monkeypatch):
+    monkeypatch.setattr(app_module, "no_guess_generator", NoGuessGenerator(processes=1))
+    token = get_token(client, "ale@gmail.com", "bananasurf123")
+    response = client.post('/games', headers={"x-access-tokens": token},
+                           json={"rows": 9, "columns": 9, "mines": 10, "no_guess": True})
+    assert response.json["no_guess"] is True
+    game_id = response.json["id"]
+
+    response = clear_cell(client, game_id, 4, 4)
+    assert response.json["board"][4][4] == 0
+    with app.app_context():
+        stored = Game.query.get(game_id)
+        assert stored.no_guess and solvable(stored.board, 4, 4)
+
+    response = client.post('/games', headers={"x-access-tokens": token},
+                           json={"rows": 9, "columns": 9, "mines": 40, "no_guess": True})
+    assert response.status_code == 400
+
+def test_metrics_endpoint(client, monkeypatch):
+    assert client.get('/metrics').status_code == 404
+
+    monkeypatch.setattr(app_module.metrics, "enabled", True)
+    app_module.metrics.reset()
+    game_id = start_game(client).json["id"]
+    clear_cell(client, game_id, 0, 0)
+
+    response = client.get('/metrics')
+    assert response.content_type.startswith("text/plain")
+    text = response.get_data(as_text=True)
+    assert 'minesweeper_request_seconds_count{method="POST",route="/games/<id>/clear",status="200"} 1' in text
+    for stage in ("find_game", "move", "update_game", "commit", "encode", "board_decode"):
+        assert f'minesweeper_stage_seconds_count{{stage="{stage}"}}' in text
+    assert "minesweeper_cells_revealed_total" in text
+    assert "minesweeper_board_bytes_serialized_total" in text
+    if app_module.board_pool is not None:
+        assert 'minesweeper_board_pool_ready{setting="10x10x20"}' in text
+    app_module.metrics.reset()
+
+def test_board_pool_starts_with_the_first_game(client, monkeypatch):
+    pool = BoardPool([(10, 10, 20)], size=1)
+    monkeypatch.setattr(app_module, "board_pool", pool)
+    try:
+        assert pool._thread is None
+        start_game(client)
+        assert pool._thread is not None
+    finally:
+        pool.stop()
+
+def test_requests_are_profiled(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, "profiler", app_module.RequestProfiler(str(tmp_path), sample_rate=1))
+    game_id = start_game(client).json["id"]
+    clear_cell(client, game_id, 0, 0)
+    assert len(list((tmp_path / "POST__games__id__clear").iterdir())) == 1
@@ -0,0 +1,182 @@
+import asyncio
+import pytest
+
+pytest.importorskip("starlette")
+pytest.importorskip("aiosqlite")
+httpx = pytest.importorskip("httpx")
+
+from starlette.requests import Request
+
+import app as flask_app
+import asgi
+from exceptions import ConcurrentUpdateException
+from models import db
+from services.encoded_game_cache import EncodedGameCache
+
+
+@pytest.fixture
+def run(monkeypatch):
+    monkeypatch.setattr(flask_app, "encoded_games", EncodedGameCache())
+    monkeypatch.setattr(flask_app, "hints", EncodedGameCache())
+
+    async def with_client(test):
+        async with asgi.engine.begin() as connection:
+            await connection.run_sync(db.metadata.create_all)
+        transport = httpx.ASGITransport(app=asgi.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                await client.post("/register", json={"email": "async@gmail.com", "password": "bananasurf123"})
+                token = (await client.post("/authenticate", json={"email": "async@gmail.com",
+                                                                  "password": "bananasurf123"})).json()["token"]
+                client.headers["x-access-tokens"] = token
+                return await test(client)
+        finally:
+            # Every test starts from an empty in-memory database.
+            await asgi.engine.dispose()
+
+    return lambda test: asyncio.run(with_client(test))
+
+
+def test_game_routes(run):
+    async def test(client):
+        game = (await client.post("/games", json={"rows": 10, "columns": 10, "mines": 20})).json()
+        assert game["status"] == "started" and len(game["board"]) == 10
+
+        response = await client.post(f"/games/{game['id']}/toggle", json={"row": 0, "column": 0})
+        assert response.json()["board"][0][0] == "F"
+        assert response.headers["ETag"] == '"1"'
+
+        response = await client.get(f"/games/{game['id']}")
+        assert response.json()["board"][0][0] == "F"
+        response = await client.get(f"/games/{game['id']}", headers={"If-None-Match": response.headers["ETag"]})
+        assert response.status_code == 304
+
+        response = await client.post(f"/games/{game['id']}/moves?mode=delta",
+                                     json={"moves": [{"action": "toggle", "row": 0, "column": 0}]})
+        assert response.json()["applied"] == 1
+        assert response.json()["cells"] == [[0, 0, "?"]]
+
+        response = await client.post(f"/games/{game['id']}/toggle", json={"row": 0, "column": 1},
+                                     headers={"If-Match": '"1"'})
+        assert response.status_code == 409
+
+        listing = (await client.get("/games")).json()
+        assert [summary["id"] for summary in listing["games"]] == [game["id"]]
+
+        assert (await client.get("/games/999")).status_code == 404
+        assert (await client.post(f"/games/{game['id']}/clear", json={"row": 10, "column": 0})).status_code == 400
+        assert (await client.get("/games", headers={"x-access-tokens": "nope"})).status_code == 401
+    run(test)
+
+
+def test_metrics(run, monkeypatch):
+    monkeypatch.setattr(flask_app.metrics, "enabled", True)
+    flask_app.metrics.reset()
+
+    async def test(client):
+        game = (await client.post("/games", json={"rows": 10, "columns": 10, "mines": 20})).json()
+        await client.post(f"/games/{game['id']}/clear", json={"row": 0, "column": 0})
+        text = (await client.get("/metrics")).text
+        assert 'minesweeper_request_seconds_count{method="POST",route="/games/{id:int}/clear",status="200"} 1' in text
+        assert 'minesweeper_stage_seconds_count{stage="commit"}' in text
+    run(test)
+    flask_app.metrics.reset()
+
+
+def test_board_formats_and_compression(run):
+    async def test(client):
+        game = (await client.post("/games?board_format=rows", json={"rows": 50, "columns": 50, "mines": 100})).json()
+        assert game["board_format"] == "rows" and game["board"][0] == "C" * 50
+
+        response = await client.get(f"/games/{game['id']}", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["ETag"] == 'W/"0"'
+        assert response.json()["board"][0] == ["C"] * 50
+
+        response = await client.post(f"/games/{game['id']}/toggle?board_format=rows", json={"row": 0, "column": 0},
+                                     headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.json()["board"][0] == "F" + "C" * 49
+
+        # Run-length encoded, the board is too small to be worth compressing.
+        response = await client.get(f"/games/{game['id']}?board_format=rle", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+        assert response.json()["board"][:2] == [["F", 49], [50]]
+
+        response = await client.get(f"/games/{game['id']}", headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["Vary"] == "Accept-Encoding"
+
+        response = await client.get(f"/games/{game['id']}?board_format=png")
+        assert response.status_code == 400
+    run(test)
+
+
+def test_game_hint(run):
+    async def test(client):
+        game = (await client.post("/games", json={"rows": 10, "columns": 10, "mines": 20})).json()
+        await client.post(f"/games/{game['id']}/clear", json={"row": 5, "column": 5})
+        hint = (await client.get(f"/games/{game['id']}/hint")).json()
+        assert hint["version"] == 1 and hint["complete"]
+        assert (await client.get("/games/999/hint")).status_code == 404
+    run(test)
+
+
+def test_conflicting_saves_forget_cached_hints(run):
+    async def test(client):
+        game = (await client.post("/games", json={"rows": 10, "columns": 10, "mines": 20})).json()
+        await client.post(f"/games/{game['id']}/clear", json={"row": 5, "column": 5})
+        await client.get(f"/games/{game['id']}/hint")
+        assert flask_app.hints.get(game["id"], 1, None) is not None
+
+        user = await asgi.user_for_token(client.headers["x-access-tokens"])
+        async with asgi.Session() as session:
+            stored = await asgi.find_game(session, user.id, game["id"])
+            with pytest.raises(ConcurrentUpdateException):
+                await asgi.update_game(session, user.id, game["id"], stored, stored.version - 1)
+        assert flask_app.hints.get(game["id"], 1, None) is None
+    run(test)
+
+
+def test_moves_on_one_game_are_serialized(run):
+    async def test(client):
+        game = (await client.post("/games", json={"rows": 10, "columns": 10, "mines": 20})).json()
+        responses = await asyncio.gather(*[client.post(f"/games/{game['id']}/toggle", json={"row": 0, "column": 0})
+                                           for _ in range(9)])
+        assert [response.status_code for response in responses] == [200] * 9
+        assert sorted(response.json()["version"] for response in responses) == list(range(1, 10))
+        assert len(asgi.game_locks) == 0
+    run(test)
+
+
+def test_game_events(run):
+    async def open_events(game_id: int, token: str):
+        # httpx's ASGI transport buffers whole responses, so the stream is read straight off the endpoint.
+        return await asgi.game_events(Request({"type": "http", "method": "GET", "headers": [],
+                                               "path": f"/games/{game_id}/events", "path_params": {"id": game_id},
+                                               "query_string": f"token={token}".encode()}))
+
+    async def test(client):
+        game = (await client.post("/games", json={"rows": 10, "columns": 10, "mines": 20})).json()
+        token = client.headers["x-access-tokens"]
+        channel = flask_app.game_channel(game["id"])
+
+        # A response that is never sent, e.g. after the client went away, holds no subscription.
+        await open_events(game["id"], token)
+        assert not flask_app.broker.has_subscribers(channel)
+
+        events = (await open_events(game["id"], token)).body_iterator
+        try:
+            assert (await events.__anext__()).startswith("event: state\n")
+            await client.post(f"/games/{game['id']}/toggle", json={"row": 0, "column": 0})
+            event = await events.__anext__()
+            assert event.startswith("event: delta\n")
+            assert '"cells": [[0, 0, "F"]]' in event
+        finally:
+            await events.aclose()
+        assert not flask_app.broker.has_subscribers(channel)
+
+        assert (await open_events(game["id"], "nope")).status_code == 401
+        assert (await open_events(999, token)).status_code == 404
+        assert not flask_app.broker.has_subscribers(flask_app.game_channel(999))
+    run(test)
@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks")
+sys.path.insert(0, BENCHMARKS)
+
+import run as benchmark_run
+
+
+def scaled(report, times: float, calibration: float = 1):
+    return dict(report, calibration_ms=report["calibration_ms"] * calibration,
+                results=[dict(result, min_ms=result["min_ms"] * times) for result in report["results"]])
+
+
+def test_runner_fails_on_regressions(tmp_path):
+    with open(os.path.join(BENCHMARKS, "baseline.json")) as baseline:
+        baseline = json.load(baseline)
+    # A baseline a thousand times faster than anything can run.
+    (tmp_path / "baseline.json").write_text(json.dumps(scaled(baseline, 0.001)))
+    process = subprocess.run([sys.executable, "run.py", "generation", "--repeat", "1", "--floor-ms", "0",
+                              "--baseline", str(tmp_path / "baseline.json"), "--output", str(tmp_path / "report.json")],
+                             cwd=BENCHMARKS, capture_output=True, text=True)
+    assert process.returncode == 1
+    assert "REGRESSION" in process.stdout
+
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert {result["suite"] for result in report["results"]} == {"generation"}
+    regressions, rows = benchmark_run.compare(report, scaled(report, 1000), floor_ms=0)
+    assert regressions == [] and len(rows) == len(report["results"])
+
+
+def test_compare_scales_the_baseline_by_calibration():
+    report = {"calibration_ms": 20.0, "results": [
+        {"name": "clear", "params": {"side": 50}, "min_ms": 10.0},
+        {"name": "toggle", "params": {"side": 50}, "min_ms": 0.05},
+        {"name": "new", "params": {}, "min_ms": 1.0},
+    ]}
+    baseline = {"calibration_ms": 20.0, "results": [
+        {"name": "clear", "params": {"side": 50}, "min_ms": 6.0},
+        {"name": "toggle", "params": {"side": 50}, "min_ms": 0.01},
+    ]}
+    regressions, rows = benchmark_run.compare(report, baseline)
+    # toggle got 5x slower, but by less than the 0.1 ms floor; new has no baseline.
+    assert regressions == ["clear[side=50]"]
+    assert [row[0] for row in rows] == ["clear[side=50]", "toggle[side=50]"]
+
+    # The machine ran the calibration workload twice as slow, so the baseline doubles.
+    regressions, rows = benchmark_run.compare(report, dict(baseline, calibration_ms=10.0))
+    assert regressions == []
+    assert rows[0][1:] == (12.0, 10.0, 10.0 / 12.0)
+
+
+def test_selfplay_plays_games_to_the_end():
+    import selfplay
+
+    for strategy in ("solver", "random"):
+        report = selfplay.simulate("service", games=6, strategy=strategy, rows=9, columns=9, mines=10, seed=3)
+        games, latency = report["games"], report["latency_ms"]
+        assert games["won"] + games["lost"] == 6 and games["unfinished"] == 0
+        assert latency["start"]["count"] == 6
+        # Every game opens with a clear, and every clear or chord has its flood fill size.
+        assert latency["clear"]["count"] >= 6
+        assert report["flood_fill"]["clears"] == latency["clear"]["count"] + latency.get("chord", {"count": 0})["count"]
+        assert report["moves_per_second"] > 0
+        # Only the solver asks for hints.
+        assert ("hint" in latency) == (strategy == "solver")
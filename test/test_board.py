@@ -0,0 +1,191 @@
+import json
+import random
+
+import services.board as board_module
+from services.board import BaseBoard, Board, SparseBoard, load_board, new_board, make_rng, sample_cells, move_mines
+
+
+def get_mock_board():
+    board = Board(3, 4)
+    board.set_value(0, 0, -1)
+    board.set_value(0, 1, 1)
+    board.set_value(1, 0, 1)
+    board.set_value(1, 1, 1)
+    board.set_status(1, 1, "U")
+    board.set_status(2, 3, "F")
+    return board
+
+
+def test_new_board_is_covered_and_empty():
+    board = Board(4, 5)
+    assert len(board.values) == 20
+    assert all(board.status(r, c) == "C" for r in range(4) for c in range(5))
+    assert all(board.value(r, c) == 0 for r in range(4) for c in range(5))
+
+def test_neighbors_stay_inside_the_board():
+    board = Board(3, 3)
+    assert sorted(board.neighbors(0, 0)) == [(0, 1), (1, 0), (1, 1)]
+    assert len(list(board.neighbors(1, 1))) == 8
+
+def test_masked_rows():
+    masked = get_mock_board().masked_rows()
+    assert masked[1][1] == 1
+    assert masked[0][0] == "C"
+    assert masked[2][3] == "F"
+
+def test_masked_text_window_matches_masked_window():
+    board = get_mock_board()
+    board.set_status(0, 0, "U")
+    board.set_status(0, 2, "?")
+    assert board.masked_text_window(0, 0, 3, 4) == ["*C?C", "C1CC", "CCCF"]
+    assert board.masked_text_window(1, 1, 5, 2) == ["1C", "CC"]
+    assert BaseBoard.masked_text_window(board, 0, 0, 3, 4) == board.masked_text_window(0, 0, 3, 4)
+
+def test_bytes_round_trip():
+    board = get_mock_board()
+    data = board.to_bytes()
+    assert len(data) < len(json.dumps(board.to_json()))
+    assert Board.from_bytes(data) == board
+
+def test_load_board_accepts_legacy_json():
+    board = get_mock_board()
+    legacy = board.to_json()
+    assert load_board(legacy) == board
+    assert load_board(json.dumps(legacy)) == board
+    assert load_board(json.dumps(legacy).encode("utf-8")) == board
+    assert load_board(board.to_bytes()) == board
+
+def test_flood_reveal_returns_newly_uncovered_cells():
+    board = get_mock_board()
+    revealed = board.flood_reveal(2, 0)
+    assert revealed == {(1, 0), (2, 0), (2, 1), (2, 2), (1, 2), (1, 3), (0, 1), (0, 2), (0, 3)}
+    assert board.status(2, 3) == "F"
+    assert board.status(0, 0) == "C"
+    assert board.flood_reveal(2, 0) == set()
+
+def test_flood_reveal_open_board_does_not_recurse():
+    board = Board(300, 300)
+    revealed = board.flood_reveal(150, 150)
+    assert len(revealed) == 300 * 300
+    assert board.covered_safe_cells() == 0
+
+def test_calculate_values_without_numpy_matches_vectorized(monkeypatch):
+    vectorized = Board(12, 9)
+    vectorized.place_mines(sample_cells(make_rng(3), 12 * 9, 30))
+    pure = Board.from_bytes(vectorized.to_bytes())
+
+    vectorized.calculate_values()
+    monkeypatch.setattr(board_module, "numpy", None)
+    pure.calculate_values()
+
+    assert pure.values == vectorized.values
+    assert pure.count_mines() == 30
+
+def test_sample_cells_is_reproducible_and_without_replacement(monkeypatch):
+    cells = sample_cells(make_rng(42), 100, 99)
+    assert len(set(cells)) == 99
+    assert cells == sample_cells(make_rng(42), 100, 99)
+
+    monkeypatch.setattr(board_module, "numpy", None)
+    cells = sample_cells(make_rng(42), 100, 99)
+    assert len(set(cells)) == 99
+    assert cells == sample_cells(make_rng(42), 100, 99)
+
+def test_sample_cells_skips_excluded_cells(monkeypatch):
+    for numpy in (board_module.numpy, None):
+        monkeypatch.setattr(board_module, "numpy", numpy)
+        cells = sample_cells(make_rng(5), 20, 15, exclude=[0, 7, 8, 19, 3])
+        assert len(set(cells)) == 15
+        assert set(cells) == set(range(20)) - {0, 3, 7, 8, 19}
+
+def test_move_mines_keeps_values_consistent():
+    for board in (Board(6, 6), SparseBoard(6, 6)):
+        board.place_mines(range(0, 36, 3))
+        board.calculate_values()
+        safe = [board.index(r, c) for r in range(3) for c in range(3)]
+        assert move_mines(board, safe, make_rng(1)) == 3
+        assert board.count_mines() == 12
+        assert not any(board.is_mine(*board.position(index)) for index in safe)
+        expected = Board(6, 6)
+        expected.place_mines(index for index in range(36) if board.is_mine(*board.position(index)))
+        expected.calculate_values()
+        assert [board.value(r, c) for r in range(6) for c in range(6)] == list(expected.values)
+
+def get_mock_sparse_board():
+    board = SparseBoard(200, 300)
+    board.place_mines([board.index(0, 0), board.index(100, 150), board.index(199, 299)])
+    return board
+
+def test_new_board_picks_the_representation_by_size():
+    assert isinstance(new_board(50, 50), Board)
+    assert isinstance(new_board(51, 10), SparseBoard)
+
+def test_sparse_board_values_are_derived_from_mines():
+    board = get_mock_sparse_board()
+    assert board.value(0, 0) == -1
+    assert board.value(1, 1) == 1
+    assert board.value(101, 151) == 1
+    assert board.value(50, 50) == 0
+    assert board.count_mines() == 3
+
+def test_sparse_board_only_allocates_touched_chunks():
+    board = get_mock_sparse_board()
+    assert board.status(120, 250) == "C"
+    board.set_status(120, 250, "F")
+    assert board.status(120, 250) == "F"
+    assert len(board.chunks) == 1
+    assert board.count_status("F") == 1
+    assert board.count_status("C") == 200 * 300 - 1
+
+    board.set_status(120, 250, "C")
+    assert board.chunks == {}
+
+def test_sparse_board_bytes_round_trip():
+    board = get_mock_sparse_board()
+    board.set_status(5, 5, "U")
+    board.set_status(150, 299, "?")
+    data = board.to_bytes()
+    assert load_board(data) == board
+    assert len(data) < board.size
+
+def test_sparse_flood_reveal_matches_dense():
+    sparse = get_mock_sparse_board()
+    dense = Board(200, 300)
+    dense.place_mines(sparse.mines)
+    dense.calculate_values()
+
+    assert sparse.flood_reveal(50, 50) == dense.flood_reveal(50, 50)
+    assert sparse.covered_safe_cells() == dense.covered_safe_cells() == 0
+    assert sparse.masked_window(0, 0, 3, 3) == dense.masked_window(0, 0, 3, 3)
+    assert sparse.masked_text_window(0, 0, 3, 3) == dense.masked_text_window(0, 0, 3, 3)
+
+def test_sparse_flood_reveal_with_and_without_numpy(monkeypatch):
+    rng = random.Random(11)
+    for _ in range(20):
+        rows, columns = rng.randint(1, 130), rng.randint(1, 130)
+        mines = rng.sample(range(rows * columns), rng.randint(0, rows * columns // 4))
+        boards = [SparseBoard(rows, columns), SparseBoard(rows, columns)]
+        for board in boards:
+            board.place_mines(mines)
+            board.set_status(rows // 2, columns // 2, "F")
+        row, column = rng.randrange(rows), rng.randrange(columns)
+
+        with monkeypatch.context() as patch:
+            patch.setattr(board_module, "FLOOD_WALK_LIMIT", 0)
+            vectorized = boards[0].flood_reveal(row, column)
+        with monkeypatch.context() as patch:
+            patch.setattr(board_module, "numpy", None)
+            walked = boards[1].flood_reveal(row, column)
+
+        assert vectorized == walked
+        assert boards[0] == boards[1]
+
+def test_sparse_flood_reveal_walks_small_cascades(monkeypatch):
+    board = SparseBoard(2000, 2000)
+    # A wall of mines closes the top left 4x5 corner.
+    board.place_mines([4 * 2000 + c for c in range(6)] + [r * 2000 + 5 for r in range(4)])
+    monkeypatch.setattr(SparseBoard, "_flood_reveal_vectorized", None)
+
+    assert board.flood_reveal(0, 0) == {(r, c) for r in range(4) for c in range(5)}
+    assert board.status(3, 4) == "U" and board.status(0, 5) == "C"
+    assert len(board.chunks) == 1
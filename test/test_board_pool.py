@@ -0,0 +1,67 @@
+from services.board import MINE
+from services.board_pool import BoardPool
+from services.game_service import GameService
+
+
+def test_take_counts_hits_and_misses():
+    pool = BoardPool([(9, 9, 10)], size=2, seed=1)
+    assert pool.take(9, 9, 10) is None
+    assert pool.take(5, 5, 3) is None
+
+    assert pool.refill() == 2
+    board = pool.take(9, 9, 10)
+    assert board.count_mines() == 10
+    assert pool.stats() == {"settings": {"9x9x10": {"ready": 1, "hits": 1, "misses": 1}}, "hit_rate": 0.5}
+
+
+def test_taking_below_the_threshold_wakes_the_refill_thread():
+    pool = BoardPool([(9, 9, 10)], size=3, refill_below=2, seed=1)
+    pool.refill()
+    pool.take(9, 9, 10)
+    assert not pool._wake.is_set()
+    pool.take(9, 9, 10)
+    assert pool._wake.is_set()
+
+
+def test_background_refill():
+    pool = BoardPool([(9, 9, 10), (16, 16, 40)], size=2, seed=1)
+    pool.start()
+    try:
+        for _ in range(100):
+            if all(setting["ready"] == 2 for setting in pool.stats()["settings"].values()):
+                break
+            pool._stop.wait(0.05)
+        assert pool.take(16, 16, 40) is not None
+    finally:
+        pool.stop()
+
+
+def test_first_clear_uses_pooled_boards():
+    pool = BoardPool([(9, 9, 10)], size=1, seed=1)
+    pool.refill()
+    pooled = pool._boards[(9, 9, 10)][0]
+
+    service = GameService(board_pool=pool)
+    service.start_game(1, 9, 9, 10)
+    assert pool.stats()["settings"]["9x9x10"]["hits"] == 0
+    service.clear(4, 4)
+    assert service.game.board is pooled
+    assert not any(pooled.is_mine(r, c) for r in range(3, 6) for c in range(3, 6))
+    assert sum(1 for r in range(9) for c in range(9) if pooled.value(r, c) == MINE) == 10
+    assert service.check_counters() == {}
+
+    service.start_game(1, 9, 9, 10)
+    service.clear(4, 4)
+    assert service.game.board is not pooled
+    assert pool.stats()["hit_rate"] == 0.5
+
+
+def test_boards_touched_before_the_first_clear_are_not_swapped():
+    pool = BoardPool([(9, 9, 10)], size=1, seed=1)
+    pool.refill()
+    service = GameService(board_pool=pool)
+    service.start_game(1, 9, 9, 10)
+    service.toggle(0, 0)
+    service.clear(4, 4)
+    assert service.game.board.status(0, 0) == "F"
+    assert pool.stats()["settings"]["9x9x10"] == {"ready": 1, "hits": 0, "misses": 0}
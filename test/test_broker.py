@@ -0,0 +1,27 @@
+from services.broker import LocalBroker
+
+
+def test_publish_reaches_the_channel_subscribers():
+    broker = LocalBroker()
+    first, second, other = [], [], []
+    broker.subscribe("games/1", first.append)
+    broker.subscribe("games/1", second.append)
+    broker.subscribe("games/2", other.append)
+
+    assert broker.publish("games/1", "delta") == 2
+    assert first == second == ["delta"]
+    assert other == []
+    assert broker.publish("games/3", "delta") == 0
+
+
+def test_unsubscribe():
+    broker = LocalBroker()
+    received = []
+    unsubscribe = broker.subscribe("games/1", received.append)
+    assert broker.has_subscribers("games/1")
+
+    unsubscribe()
+    unsubscribe()
+    broker.publish("games/1", "delta")
+    assert received == []
+    assert not broker.has_subscribers("games/1")
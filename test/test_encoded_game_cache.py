@@ -0,0 +1,38 @@
+from services.encoded_game_cache import EncodedGameCache
+
+
+def test_entries_are_per_version_and_variant():
+    cache = EncodedGameCache()
+    cache.put(1, 0, None, b"v0")
+    cache.put(1, 1, None, b"v1")
+    cache.put(1, 1, (0, 0, 5, 5), b"v1 window")
+
+    assert cache.get(1, 0) == b"v0"
+    assert cache.get(1, 1) == b"v1"
+    assert cache.get(1, 1, (0, 0, 5, 5)) == b"v1 window"
+    assert cache.get(1, 2) is None
+    assert cache.get(2, 1) is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = EncodedGameCache(max_size=2)
+    cache.put(1, 0, None, b"a")
+    cache.put(2, 0, None, b"b")
+    cache.get(1, 0)
+    cache.put(3, 0, None, b"c")
+
+    assert len(cache) == 2
+    assert cache.get(2, 0) is None
+    assert cache.get(1, 0) == b"a"
+
+
+def test_invalidate_drops_every_entry_of_a_game():
+    cache = EncodedGameCache()
+    cache.put(1, 0, None, b"a")
+    cache.put(1, 0, (0, 0, 5, 5), b"b")
+    cache.put(2, 0, None, b"c")
+    cache.invalidate(1)
+    cache.invalidate(3)
+
+    assert len(cache) == 1
+    assert cache.get(2, 0) == b"c"
@@ -0,0 +1,56 @@
+import datetime
+import gzip
+
+import pytest
+
+from services import encoding
+
+
+def test_dumps_is_compact_and_sends_dates_as_http_dates():
+    when = datetime.datetime(2020, 5, 17, 10, 30, tzinfo=datetime.timezone.utc)
+    body = encoding.dumps({"start_time": when, "board": [["C", 1]], "errors": {0: ["bad"]}})
+    assert body == b'{"start_time":"Sun, 17 May 2020 10:30:00 GMT","board":[["C",1]],"errors":{"0":["bad"]}}'
+
+
+def test_dumps_without_orjson_matches(monkeypatch):
+    data = {"id": 1, "board": ["C1F"], "end_time": None}
+    body = encoding.dumps(data)
+    monkeypatch.setattr(encoding, "orjson", None)
+    assert encoding.dumps(data) == body
+
+
+def test_choose_encoding():
+    assert encoding.choose_encoding("gzip, deflate", ["br", "gzip"]) == "gzip"
+    assert encoding.choose_encoding("br;q=0.9, gzip", ["br", "gzip"]) == "br"
+    assert encoding.choose_encoding("gzip;q=0", ["gzip"]) is None
+    assert encoding.choose_encoding("*", ["gzip"]) == "gzip"
+    assert encoding.choose_encoding("identity", ["gzip"]) is None
+    assert encoding.choose_encoding("", ["gzip"]) is None
+    assert encoding.choose_encoding("gzip", []) is None
+
+
+def test_supported_encodings_skip_brotli_when_missing(monkeypatch):
+    monkeypatch.setattr(encoding, "brotli", None)
+    assert encoding.supported_encodings(["br", "gzip", "zstd"]) == ["gzip"]
+
+
+def test_compress_round_trip():
+    body = encoding.dumps({"board": [["C"] * 50] * 50})
+    compressed = encoding.compress(body, "gzip")
+    assert len(compressed) < len(body) // 10
+    assert gzip.decompress(compressed) == body
+    # No timestamp in the header, the same body always compresses the same.
+    assert encoding.compress(body, "gzip") == compressed
+
+
+def test_compress_brotli():
+    brotli = pytest.importorskip("brotli")
+    body = encoding.dumps({"board": [["C"] * 50] * 50})
+    assert brotli.decompress(encoding.compress(body, "br")) == body
+
+
+def test_row_runs():
+    assert encoding.row_runs("CCC12F") == [3, "12F"]
+    assert encoding.row_runs("1CC*") == ["1", 2, "*"]
+    assert encoding.row_runs("CCCC") == [4]
+    assert encoding.row_runs("") == []
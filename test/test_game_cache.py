@@ -0,0 +1,185 @@
+import time
+
+import pytest
+
+from services.game_cache import GameCache
+from models import Game
+from exceptions import ConcurrentUpdateException
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def get_mock_game(game_id: int, status: str = "started", version: int = 0):
+    game = Game()
+    game.id = game_id
+    game.status = status
+    game.version = version
+    return game
+
+
+def get_cache(**kwargs):
+    persisted = []
+    clock = FakeClock()
+    cache = GameCache(lambda game, expected_version: persisted.append(game), clock=clock, **kwargs)
+    return cache, persisted, clock
+
+
+def test_checkout_loads_once_and_marks_dirty():
+    cache, persisted, clock = get_cache(flush_seconds=10)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return get_mock_game(1)
+
+    with cache.checkout((1, 1), load) as game:
+        pass
+    with cache.checkout((1, 1), load) as same_game:
+        assert same_game is game
+
+    assert len(loads) == 1
+    assert persisted == []
+
+def test_dirty_games_are_flushed_after_the_durability_window():
+    cache, persisted, clock = get_cache(flush_seconds=5)
+    with cache.checkout((1, 1), lambda: get_mock_game(1)):
+        pass
+
+    clock.now = 4
+    cache.flush_due()
+    assert persisted == []
+
+    clock.now = 5
+    cache.flush_due()
+    assert [game.id for game in persisted] == [1]
+
+    cache.flush_due()
+    assert len(persisted) == 1
+
+def test_read_only_checkout_is_not_flushed():
+    cache, persisted, clock = get_cache(flush_seconds=0)
+    with cache.checkout((1, 1), lambda: get_mock_game(1), modify=False):
+        pass
+    cache.flush_all()
+    assert persisted == []
+
+def test_ended_games_are_flushed_immediately():
+    cache, persisted, clock = get_cache(flush_seconds=60)
+    with cache.checkout((1, 1), lambda: get_mock_game(1)) as game:
+        game.status = "lost"
+    assert persisted == [game]
+
+def test_least_recently_used_game_is_evicted_and_flushed():
+    cache, persisted, clock = get_cache(max_size=2, flush_seconds=60)
+    for game_id in (1, 2):
+        with cache.checkout((1, game_id), lambda: get_mock_game(game_id)):
+            pass
+    with cache.checkout((1, 1), lambda: get_mock_game(1), modify=False):
+        pass
+    with cache.checkout((1, 3), lambda: get_mock_game(3), modify=False):
+        pass
+
+    assert (1, 2) not in cache
+    assert (1, 1) in cache and (1, 3) in cache
+    assert [game.id for game in persisted] == [2]
+
+def test_idle_games_are_evicted():
+    cache, persisted, clock = get_cache(idle_seconds=30, flush_seconds=60)
+    with cache.checkout((1, 1), lambda: get_mock_game(1)):
+        pass
+    clock.now = 30
+    cache.flush_due()
+    assert len(cache) == 0
+    assert len(persisted) == 1
+
+def test_failed_moves_do_not_mark_the_game_dirty():
+    cache, persisted, clock = get_cache(flush_seconds=0)
+    try:
+        with cache.checkout((1, 1), lambda: get_mock_game(1)):
+            raise ValueError()
+    except ValueError:
+        pass
+    cache.flush_all()
+    assert persisted == []
+
+
+def test_flush_passes_the_last_persisted_version():
+    writes = []
+    cache = GameCache(lambda game, expected_version: writes.append((game.version, expected_version)),
+                      flush_seconds=3600)
+    game = get_mock_game(1, version=4)
+    for _ in range(2):
+        with cache.checkout((1, 1), lambda: game) as cached:
+            cached.version += 1
+    cache.flush_all()
+    with cache.checkout((1, 1), lambda: game) as cached:
+        cached.version += 1
+    cache.flush_all()
+    assert writes == [(6, 4), (7, 6)]
+
+
+def test_conflicting_flush_drops_the_game():
+    def persist(game, expected_version):
+        raise ConcurrentUpdateException(game, "changed elsewhere")
+
+    cache = GameCache(persist, flush_seconds=3600)
+    with pytest.raises(ConcurrentUpdateException):
+        with cache.checkout((1, 1), lambda: get_mock_game(1)) as game:
+            game.status = "won"
+    assert (1, 1) not in cache
+
+    with cache.checkout((1, 2), lambda: get_mock_game(2)):
+        pass
+    cache.flush_all()
+    assert (1, 2) not in cache
+
+
+def test_checkout_reloads_a_game_evicted_before_it_was_locked():
+    cache, persisted, clock = get_cache(flush_seconds=60)
+    entry_of = cache._entry
+    evicted = []
+
+    def racing_entry(key, load):
+        entry = entry_of(key, load)
+        if not evicted:
+            # What another thread's flush_due could do before checkout takes the lock.
+            evicted.append(cache._evict(key, entry))
+        return entry
+
+    cache._entry = racing_entry
+    loads = []
+    with cache.checkout((1, 1), lambda: loads.append(1) or get_mock_game(1)) as game:
+        game.version += 1
+
+    assert evicted == [True] and len(loads) == 2
+    assert (1, 1) in cache
+    cache.flush_all()
+    assert persisted == [game]
+
+
+def test_flush_thread_survives_persist_errors():
+    persisted = []
+
+    def persist(game, expected_version):
+        if not persisted:
+            persisted.append(None)
+            raise RuntimeError("database is locked")
+        persisted.append(game)
+
+    clock = FakeClock()
+    cache = GameCache(persist, flush_seconds=5, clock=clock)
+    with cache.checkout((1, 1), lambda: get_mock_game(1)) as game:
+        pass
+    clock.now = 5
+    cache.start(interval=0.01)
+    deadline = time.monotonic() + 5
+    while len(persisted) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    cache.stop()
+    assert persisted[1] is game
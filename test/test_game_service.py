@@ -1,8 +1,10 @@
 import pytest
 
 from services.game_service import GameService
-from exceptions import InvalidGameSettingsException
+from exceptions import InvalidGameSettingsException, InvalidClearException
 from models import Game
+from services.board import Board
+from services.solver import solvable
 
 def get_mock_game():
     mock_game = Game()
@@ -28,13 +30,13 @@ def test_generate_board():
     service = GameService(mock_game)
     service._generate_board(20,20,10)
 
-    assert len(mock_game.board)==20
-    assert len(mock_game.board[0])==20
+    assert mock_game.board.rows==20
+    assert mock_game.board.columns==20
 
     covered_count = 0
-    for row in mock_game.board:
-        for column in row:
-            if column["status"] == "C":
+    for row in range(20):
+        for column in range(20):
+            if mock_game.board.status(row, column) == "C":
                 covered_count += 1
 
     assert covered_count == 20*20
@@ -61,15 +63,15 @@ def test_place_mines():
     service._generate_board(10,10,4)
 
     mine_count = 0
-    for row in mock_game.board:
-        for column in row:
-            if column["value"]==-1:
+    for row in range(10):
+        for column in range(10):
+            if mock_game.board.value(row, column)==-1:
                 mine_count += 1
     assert mine_count == 4
             
 
 def test_calculate_values():
-    mock_game = get_mock_game
+    mock_game = get_mock_game()
 
     service = GameService(mock_game)
     service._generate_board(5,5,4)
@@ -81,23 +83,21 @@ def test_calculate_values():
                         [0, 0, 0, 0, 0]
                         ]
     
-    mock_board = []
+    mock_board = Board(5, 5)
 
-    for row in mock_board_mines:
-        mock_row = []
-        for column in row:
-            mock_row.append({"value": column, "status": "C"})
-        mock_board.append(mock_row)
+    for (i, row) in enumerate(mock_board_mines):
+        for (j, column) in enumerate(row):
+            mock_board.set_value(i, j, column)
 
     mock_game.board = mock_board
 
     service._calculate_values(5, 5)
 
     values = []
-    for row in mock_board:
+    for i in range(5):
         row_values = []
-        for column in row:
-            row_values.append(column["value"])
+        for j in range(5):
+            row_values.append(mock_board.value(i, j))
         values.append(row_values)
 
     expected_values = [[-1, 3, 1, 1, 0], 
@@ -114,9 +114,9 @@ def test_mask_board():
     service = GameService(mock_game)
     service.start_game(1, 10, 10, 20)
     board = service.game.board
-    board[0][0]["status"] = "U"
-    board[1][1]["status"] = "F"
-    board[2][2]["status"] = "?"
+    board.set_status(0, 0, "U")
+    board.set_status(1, 1, "F")
+    board.set_status(2, 2, "?")
 
     masked = service._mask_board()
 
@@ -143,15 +143,15 @@ def test_toggle_covered_cell():
 
     board = service.game.board
 
-    assert board[0][0]["status"] == "C"
+    assert board.status(0, 0) == "C"
     service.toggle(0, 0)
-    assert board[0][0]["status"] == "F"
+    assert board.status(0, 0) == "F"
     service.toggle(0, 0)
-    assert board[0][0]["status"] == "?"
+    assert board.status(0, 0) == "?"
     service.toggle(0, 0)
-    assert board[0][0]["status"] == "C"
+    assert board.status(0, 0) == "C"
 
-    board[0][0]["value"] = 0
+    board.set_value(0, 0, 0)
     service.clear
 
 def test_toggle_uncovered_cell_should_do_nothing():
@@ -160,9 +160,257 @@ def test_toggle_uncovered_cell_should_do_nothing():
 
     board = service.game.board
 
-    board[0][0]["value"] = 0
+    board.set_value(0, 0, 0)
     service.clear(0, 0)
-    assert board[0][0]["status"] == "U"
+    assert board.status(0, 0) == "U"
+    service.toggle(0, 0)
+    assert board.status(0, 0) == "U"
+    
+def test_counters_track_clears_and_flags():
+    service = GameService(get_mock_game())
+    service._generate_board(5, 5, 3)
+    game = service.game
+    assert game.covered_safe_cells == 22
+
+    mine = next(divmod(i, 5) for i in range(25) if game.board.values[i] == -1)
+    service.toggle(*mine)
+    assert game.flags == 1 and game.mines_left == 2
+
+    safe = next(divmod(i, 5) for i in range(25) if game.board.values[i] != -1)
+    revealed = service.clear(*safe)
+    assert game.covered_safe_cells == 22 - len(revealed)
+    assert service.check_counters() == {}
+
+def test_clearing_every_safe_cell_wins_the_game():
+    service = GameService(get_mock_game())
+    service._generate_board(4, 4, 2)
+    for i in range(16):
+        if service.game.board.values[i] != -1 and service.game.status == "started":
+            service.clear(*divmod(i, 4))
+    assert service.game.covered_safe_cells == 0
+    assert service.game.status == "won"
+
+def test_repair_counters():
+    service = GameService(get_mock_game())
+    service._generate_board(5, 5, 3)
+    service.game.covered_safe_cells = 7
+    service.game.flags = 2
+
+    assert service.repair_counters() == {"covered_safe_cells": (7, 22), "flags": (2, 0)}
+    assert service.check_counters() == {}
+
+def test_encode_game_delta_only_has_changed_cells():
+    service = GameService(get_mock_game())
+    service.start_game(1, 10, 10, 20)
+    service.toggle(3, 4)
+    delta = service.encode_game_delta()
+
+    assert delta["cells"] == [[3, 4, "F"]]
+    assert delta["base_version"] == 0
+    assert delta["version"] == 1
+    assert "board" not in delta
+
+def test_seeded_games_are_reproducible():
+    first = GameService(seed=1234)
+    first.start_game(1, 30, 30, 200)
+    first.clear(15, 15)
+    second = GameService(seed=1234)
+    second.start_game(1, 30, 30, 200)
+    second.clear(15, 15)
+
+    assert first.game.board == second.game.board
+    assert first.game.board.count_mines() == 200
+
+def test_random_generator_is_only_made_to_place_mines():
+    service = GameService(seed=1234)
+    service.start_game(1, 10, 10, 10)
+    service.toggle(0, 0)
+    service.encode_game_info()
+    assert service._rng is None
+
+    service.clear(5, 5)
+    assert service._rng is not None
+
+def test_generate_board_with_almost_only_mines():
+    service = GameService(get_mock_game())
+    service._generate_board(50, 50, 50*50-1)
+    assert service.game.board.count_mines() == 50*50-1
+    assert service.game.covered_safe_cells == 1
+
+def test_large_games_are_sent_as_a_window():
+    service = GameService(get_mock_game(), seed=5)
+    service._generate_board(1000, 800, 5000)
+
+    encoded = service.encode_game_info()
+    assert (encoded["rows"], encoded["columns"]) == (1000, 800)
+    assert len(encoded["board"]) == 50 and len(encoded["board"][0]) == 50
+    assert encoded["viewport"] == {"row": 0, "column": 0, "height": 50, "width": 50}
+
+    encoded = service.encode_game_info((990, 700, 20, 20))
+    assert encoded["viewport"] == {"row": 990, "column": 700, "height": 10, "width": 20}
+    assert len(encoded["board"]) == 10
+
+def test_clear_on_a_large_game():
+    service = GameService(get_mock_game(), seed=5)
+    service._generate_board(1000, 1000, 1000)
+    board = service.game.board
+    safe = next((r, c) for r in range(1000) for c in range(1000)
+                if not board.is_mine(r, c) and board.value(r, c) == 0)
+
+    revealed = service.clear(*safe)
+    assert len(revealed) > 1
+    assert service.check_counters() == {}
+
+def test_apply_moves_stops_when_the_game_ends():
+    service = GameService(get_mock_game())
+    service._generate_board(10, 10, 20)
+    mine = divmod(next(i for i in range(100) if service.game.board.is_mine(*divmod(i, 10))), 10)
+    moves = [{"action": "toggle", "row": 9, "column": 9},
+             {"action": "clear", "row": mine[0], "column": mine[1]},
+             {"action": "toggle", "row": 9, "column": 9}]
+
+    assert service.apply_moves(moves) == 2
+    assert service.game.status == "lost"
+    assert service.game.board.status(9, 9) == "F"
+
+def get_chord_service():
+    # Mines at (0, 0) and (2, 2); the (1, 1) cell is a 2.
+    service = GameService(get_mock_game())
+    service._generate_board(4, 4, 2)
+    board = Board(4, 4)
+    board.place_mines([board.index(0, 0), board.index(2, 2)])
+    board.calculate_values()
+    service.game.board = board
+    service.repair_counters()
+    service.clear(1, 1)
+    return service
+
+def test_chord_clears_unflagged_neighbors():
+    service = get_chord_service()
     service.toggle(0, 0)
-    assert board[0][0]["status"] == "U"
-    
\ No newline at end of file
+    service.toggle(2, 2)
+    version = service.game.version
+
+    revealed = service.chord(1, 1)
+
+    # (0, 2) and (2, 0) have no adjacent mines, so the clear cascades from them.
+    assert revealed == {(0, 1), (0, 2), (1, 0), (1, 2), (2, 0), (2, 1), (0, 3), (1, 3), (3, 0), (3, 1)}
+    assert service.game.board.status(0, 0) == "F"
+    assert service.game.version == version + 1
+    assert service.check_counters() == {}
+
+def test_chord_needs_matching_flags():
+    service = get_chord_service()
+    service.toggle(0, 0)
+    assert service.chord(1, 1) == set()
+    assert service.chord(3, 3) == set()
+
+def test_chord_with_a_wrong_flag_loses():
+    service = get_chord_service()
+    service.toggle(0, 0)
+    service.toggle(0, 1)
+    service.chord(1, 1)
+    assert service.game.status == "lost"
+
+def test_mines_are_placed_by_the_first_clear():
+    service = GameService(seed=3)
+    service.start_game(1, 10, 10, 20)
+    assert service.game.board.count_mines() == 0
+    assert service.game.mines_placed_at is None
+    assert service.check_counters() == {}
+
+    service.toggle(0, 0)
+    service.clear(5, 5)
+    board = service.game.board
+    assert board.count_mines() == 20
+    assert not any(board.is_mine(r, c) for r in range(4, 7) for c in range(4, 7))
+    assert board.status(0, 0) == "F" and service.game.status == "started"
+    assert service.game.mines_placed_at == 2
+    assert service.check_counters() == {}
+
+def test_clearing_a_flagged_cell_does_not_place_the_mines():
+    service = GameService(seed=3)
+    service.start_game(1, 10, 10, 20)
+    service.toggle(0, 0)
+    version = service.game.version
+    assert service.clear(0, 0) == set()
+    assert service.game.mines_placed_at is None and service.game.version == version
+    assert service.game.start_time is None
+    assert service.hint()["unconstrained_probability"] == 0.0
+
+    service.clear(5, 5)
+    assert service.game.mines_placed_at == 3 and service.game.version == version + 1
+
+def test_first_clear_on_a_crowded_board_only_keeps_the_cell_safe():
+    service = GameService(seed=3)
+    service.start_game(1, 4, 4, 12)
+    service.clear(1, 1)
+    assert service.game.board.count_mines() == 12
+    assert service.game.status == "started"
+    assert service.game.covered_safe_cells == 3
+
+
+def test_hint_is_consistent_with_the_board():
+    service = GameService(seed=3)
+    service.start_game(1, 16, 16, 40)
+    assert service.hint()["unconstrained_probability"] == 0.0
+
+    service.clear(8, 8)
+    hint = service.hint()
+    board = service.game.board
+    assert hint["complete"] and hint["version"] == service.game.version
+    assert hint["safe"] or hint["probabilities"]
+    assert not any(board.is_mine(r, c) for r, c in hint["safe"])
+    assert all(board.is_mine(r, c) for r, c in hint["mines"])
+    for r, c in hint["safe"]:
+        service.clear(r, c)
+    assert service.game.status != "lost"
+
+def test_hint_on_a_large_game_only_covers_the_viewport():
+    service = GameService(get_mock_game(), seed=5)
+    service._generate_board(1000, 1000, 20000)
+    board = service.game.board
+    service.clear(*next((r, c) for r in range(100, 150) for c in range(100, 150)
+                        if not board.is_mine(r, c) and board.value(r, c) == 0))
+
+    hint = service.hint((100, 100, 50, 50))
+    assert hint["viewport"] == {"row": 100, "column": 100, "height": 50, "width": 50}
+    assert hint["unconstrained_probability"] is None
+    cells = hint["safe"] + hint["mines"] + [cell[:2] for cell in hint["probabilities"]]
+    assert cells and all(100 <= r < 150 and 100 <= c < 150 for r, c in cells)
+    assert not any(board.is_mine(r, c) for r, c in hint["safe"])
+    assert all(board.is_mine(r, c) for r, c in hint["mines"])
+
+def test_hint_needs_an_active_game():
+    service = GameService(get_mock_game())
+    service.game.status = "lost"
+    with pytest.raises(InvalidClearException):
+        service.hint()
+
+def test_no_guess_games_get_a_solvable_board():
+    service = GameService(seed=4)
+    service.start_game(1, 16, 16, 40, no_guess=True)
+    service.toggle(0, 0)
+    service.clear(8, 8)
+    board = service.game.board
+    assert board.count_mines() == 40
+    assert board.status(0, 0) == "F"
+    assert solvable(board, 8, 8)
+    assert service.encode_game_info()["no_guess"] is True
+    assert service.check_counters() == {}
+
+def test_no_guess_settings_are_limited():
+    for rows, columns, mines in ((60, 60, 100), (10, 10, 30)):
+        with pytest.raises(InvalidGameSettingsException):
+            GameService().start_game(1, rows, columns, mines, no_guess=True)
+
+def test_no_guess_falls_back_to_an_ordinary_board():
+    class Exhausted:
+        def generate(self, *args):
+            return None
+
+    service = GameService(seed=4, no_guess_generator=Exhausted())
+    service.start_game(1, 16, 30, 99, no_guess=True)
+    service.clear(8, 8)
+    assert service.game.board.count_mines() == 99
+    assert service.game.mines_placed_at == 1
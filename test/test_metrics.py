@@ -0,0 +1,49 @@
+import pstats
+
+from services.metrics import Metrics, RequestProfiler
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    metrics.observe("stage_seconds", 0.1, stage="move")
+    metrics.increment("cells_revealed_total", 3)
+    with metrics.stage("move"):
+        pass
+    assert metrics.render() == "\n"
+
+
+def test_histograms_are_cumulative():
+    metrics = Metrics(enabled=True, buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 2):
+        metrics.observe("stage_seconds", value, stage="move")
+    text = metrics.render()
+    assert "# TYPE minesweeper_stage_seconds histogram" in text
+    assert 'minesweeper_stage_seconds_bucket{stage="move",le="0.01"} 1' in text
+    assert 'minesweeper_stage_seconds_bucket{stage="move",le="0.1"} 3' in text
+    assert 'minesweeper_stage_seconds_bucket{stage="move",le="+Inf"} 4' in text
+    assert 'minesweeper_stage_seconds_count{stage="move"} 4' in text
+    assert 'minesweeper_stage_seconds_sum{stage="move"} 2.105' in text
+
+
+def test_counters_gauges_and_label_escaping():
+    metrics = Metrics(enabled=True)
+    metrics.increment("cells_revealed_total", 3)
+    metrics.increment("cells_revealed_total", 4)
+    text = metrics.render([("board_pool_ready", {"setting": 'a"b'}, 5)])
+    assert "# TYPE minesweeper_cells_revealed_total counter" in text
+    assert "minesweeper_cells_revealed_total 7" in text
+    assert 'minesweeper_board_pool_ready{setting="a\\"b"} 5' in text
+
+    metrics.reset()
+    assert "cells_revealed" not in metrics.render()
+
+
+def test_profiler_samples_requests(tmp_path):
+    assert RequestProfiler(str(tmp_path), sample_rate=0).start() is None
+
+    profiler = RequestProfiler(str(tmp_path), sample_rate=1)
+    profile = profiler.start()
+    sorted(range(1000))
+    path = profiler.finish(profile, "POST /games/<id>/clear")
+    assert path.startswith(str(tmp_path / "POST__games__id__clear"))
+    assert pstats.Stats(path).total_calls > 0
@@ -0,0 +1,115 @@
+from models import Game
+from services import move_log
+from services.board import load_board
+from services.game_service import GameService
+
+
+def get_game(**counters):
+    service = GameService(seed=7)
+    service.start_game(1, 5, 5, 3)
+    service._generate_board(5, 5, 3)
+    service.game.id = 1
+    service.game.sequence = 0
+    service.game.snapshot_sequence = 0
+    for name, value in counters.items():
+        setattr(service.game, name, value)
+    return service
+
+
+def test_moves_are_logged_in_order():
+    service = get_game()
+    service.toggle(0, 0)
+    service.chord(0, 0)
+    service.apply_moves([{"action": "toggle", "row": 1, "column": 1}])
+    assert [move[:3] for move in service.game.unsaved_moves] == [("toggle", 0, 0), ("chord", 0, 0), ("toggle", 1, 1)]
+
+
+def test_prepare_save_numbers_moves_and_snapshots_on_interval():
+    service = get_game(sequence=4, snapshot_sequence=2)
+    service.toggle(0, 0)
+    moves, snapshot, counters = move_log.prepare_save(service.game, snapshot_interval=4)
+    assert [move["sequence"] for move in moves] == [5]
+    assert snapshot is None
+    assert counters == {"sequence": 5, "snapshot_sequence": 2}
+    move_log.saved(service.game, counters)
+    assert service.game.sequence == 5 and service.game.unsaved_moves == []
+
+    service.toggle(0, 1)
+    moves, snapshot, counters = move_log.prepare_save(service.game, snapshot_interval=4)
+    assert [move["sequence"] for move in moves] == [6]
+    assert snapshot["sequence"] == counters["snapshot_sequence"] == 6
+    # The games row holds the board, the snapshot only rewinds the counters.
+    assert snapshot["board"] is None
+
+
+def test_prepare_save_leaves_the_game_alone_until_it_is_saved():
+    service = get_game(sequence=4, snapshot_sequence=2)
+    service.toggle(0, 0)
+    service.game.replay_seconds = 0.2
+    moves, snapshot, counters = move_log.prepare_save(service.game, snapshot_interval=50, snapshot_seconds=0.1)
+    assert snapshot is not None
+    # As if the write failed: the same game saves the same moves again.
+    assert (service.game.sequence, service.game.snapshot_sequence, service.game.replay_seconds) == (4, 2, 0.2)
+    assert len(service.game.unsaved_moves) == 1
+    assert move_log.prepare_save(service.game, snapshot_interval=50, snapshot_seconds=0.1)[::2] == (moves, counters)
+
+    move_log.saved(service.game, counters)
+    assert (service.game.sequence, service.game.snapshot_sequence, service.game.replay_seconds) == (5, 5, 0)
+
+
+def test_prepare_save_snapshots_when_replaying_gets_slow():
+    service = get_game()
+    service.toggle(0, 0)
+    with move_log.replay_cost(service.game):
+        service.toggle(0, 1)
+    assert service.game.replay_seconds > 0
+    moves, snapshot, counters = move_log.prepare_save(service.game, snapshot_interval=50, snapshot_seconds=3600)
+    assert snapshot is None
+    move_log.saved(service.game, counters)
+
+    service.toggle(0, 2)
+    service.game.replay_seconds = 0.2
+    moves, snapshot, counters = move_log.prepare_save(service.game, snapshot_interval=50, snapshot_seconds=0.1)
+    assert snapshot["sequence"] == 3
+    move_log.saved(service.game, counters)
+    assert service.game.replay_seconds == 0
+
+
+def test_prepare_save_snapshots_finished_games():
+    service = get_game()
+    board = service.game.board
+    mine = next((r, c) for r in range(5) for c in range(5) if board.is_mine(r, c))
+    service.clear(*mine)
+    moves, snapshot, counters = move_log.prepare_save(service.game, snapshot_interval=50)
+    assert service.game.status == "lost"
+    assert snapshot is not None and snapshot["status"] == "lost"
+
+
+def test_prepare_save_snapshots_when_mines_are_placed():
+    service = GameService(seed=7)
+    service.start_game(1, 5, 5, 3)
+    service.game.id, service.game.sequence, service.game.snapshot_sequence = 1, 4, 0
+    service.toggle(4, 4)
+    moves, snapshot, counters = move_log.prepare_save(service.game, snapshot_interval=50)
+    assert snapshot is None
+    move_log.saved(service.game, counters)
+
+    service.toggle(4, 3)
+    service.clear(0, 0)
+    moves, snapshot, counters = move_log.prepare_save(service.game, snapshot_interval=50)
+    assert service.game.mines_placed_at == 7
+    assert snapshot["sequence"] == 7 and snapshot["board"].count_mines() == 3
+
+
+def test_replay_does_not_log_again():
+    service = get_game()
+    game = Game(rows=5, columns=5, board=load_board(service.game.board.to_bytes()), status="started",
+                mines=3, mines_left=3, flags=0, covered_safe_cells=22, version=0)
+
+    class LoggedMove:
+        action, row, column = "toggle", 2, 2
+
+    move_log.replay(game, [LoggedMove()])
+    assert game.board.status(2, 2) == "F"
+    assert game.mines_left == 2 and game.version == 1
+    assert game.unsaved_moves == []
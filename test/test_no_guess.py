@@ -0,0 +1,74 @@
+import random
+import threading
+import time
+
+from services import no_guess
+from services.board import Board
+from services.no_guess import NoGuessGenerator, find_mines, first_clear_cells
+from services.solver import solvable
+
+
+def board_with(rows, columns, cells):
+    board = Board(rows, columns)
+    board.place_mines(cells)
+    board.calculate_values()
+    return board
+
+
+def test_find_mines_returns_a_solvable_placement():
+    cells = find_mines(16, 16, 40, 8, 8, seed=4)
+    assert len(set(cells)) == 40
+    assert not set(cells) & set(first_clear_cells(16, 16, 8, 8))
+    assert solvable(board_with(16, 16, cells), 8, 8)
+    assert find_mines(16, 16, 40, 8, 8, seed=4) == cells
+
+
+def test_find_mines_gives_up():
+    # No room for the mines around a first clear in the middle of a 3x3 board.
+    assert find_mines(3, 3, 1, 1, 1, seed=1) is None
+    assert find_mines(16, 30, 99, 0, 0, seed=1, budget=0) is None
+
+
+def test_generator_in_process_and_on_a_pool():
+    rng = random.Random(2)
+    cells = NoGuessGenerator(processes=1).generate(9, 9, 10, 0, 0, rng)
+    assert solvable(board_with(9, 9, cells), 0, 0)
+
+    generator = NoGuessGenerator(processes=2, budget=30)
+    try:
+        for row, column in ((4, 4), (8, 0)):
+            cells = generator.generate(9, 9, 10, row, column, rng)
+            assert solvable(board_with(9, 9, cells), row, column)
+    finally:
+        generator.stop()
+    assert NoGuessGenerator(processes=2).generate(3, 3, 1, 1, 1, rng) is None
+
+
+def test_seed_from_either_generator():
+    assert 0 <= no_guess.seed_from(random.Random(1)) < 2 ** 62
+
+
+def test_pool_tasks_stop_at_the_callers_deadline():
+    assert find_mines(16, 30, 99, 0, 0, seed=1, attempts=2 ** 31, deadline=time.monotonic()) is None
+
+    # Boards this dense are almost never solvable from a corner, so every task runs to its deadline.
+    # Two calls share the pool, so the tasks of one queue behind those of the other, and must
+    # not run on past the budget once they get a worker.
+    generator = NoGuessGenerator(processes=2, budget=0.5, batch=2 ** 31)
+    try:
+        generator.generate(9, 9, 10, 4, 4, random.Random(1))
+        elapsed = []
+
+        def generate():
+            start = time.monotonic()
+            generator.generate(8, 8, 40, 0, 0, random.Random(1))
+            elapsed.append(time.monotonic() - start)
+
+        threads = [threading.Thread(target=generate) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(elapsed) < 0.5 + 0.25
+    finally:
+        generator.stop()
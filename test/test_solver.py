@@ -0,0 +1,135 @@
+import itertools
+import random
+
+from services.board import Board
+from services.solver import solve, solvable
+
+
+def masked(board):
+    return board.masked_window(0, 0, board.rows, board.columns)
+
+
+def random_board(rng, rows, columns, mines):
+    board = Board(rows, columns)
+    board.place_mines(rng.sample(range(rows * columns), mines))
+    board.calculate_values()
+    safe_cells = [(r, c) for r in range(rows) for c in range(columns) if not board.is_mine(r, c)]
+    board.flood_reveal(*rng.choice(safe_cells))
+    return board
+
+
+def brute_force(rows, columns, mines, cells):
+    """Mine probability of every covered cell over all arrangements matching the board."""
+    covered = [(r, c) for r in range(rows) for c in range(columns) if cells[r][c] in ("C", "F", "?")]
+    counts = dict.fromkeys(covered, 0)
+    total = 0
+    for placed in itertools.combinations(covered, mines):
+        placed = set(placed)
+        if all(cells[r][c] in ("C", "F", "?") or
+               cells[r][c] == sum((r + dr, c + dc) in placed for dr in (-1, 0, 1) for dc in (-1, 0, 1))
+               for r in range(rows) for c in range(columns)):
+            total += 1
+            for cell in placed:
+                counts[cell] += 1
+    return {cell: count / total for cell, count in counts.items()}
+
+
+def test_single_cell_and_subset_rules():
+    # The 1-2-1 pattern: the outer cells are mines and the middle one is safe.
+    assert solve([["C", "C", "C"], [1, 2, 1]]) == {
+        "safe": [[0, 1]], "mines": [[0, 0], [0, 2]], "probabilities": [],
+        "unconstrained_probability": None, "complete": True}
+    # The subset rule: each end 1 shares its cells with the next 1 but one.
+    result = solve([["C", "C", "C", "C"], [1, 1, 1, 1]])
+    assert result["safe"] == [[0, 1], [0, 2]]
+    assert result["mines"] == [[0, 0], [0, 3]]
+
+
+def test_flags_are_not_trusted():
+    result = solve([["F", "C"], [1, 1]])
+    assert result["mines"] == [] and result["safe"] == []
+    assert result["probabilities"] == [[0, 0, 0.5], [0, 1, 0.5]]
+
+
+def test_probabilities_weigh_the_unconstrained_cells():
+    board = [[1, "C", "C"], ["C", "C", "C"], ["C", "C", "C"]]
+    result = solve(board, mines=2)
+    assert result["probabilities"] == [[0, 1, 0.3333], [1, 0, 0.3333], [1, 1, 0.3333]]
+    assert result["unconstrained_probability"] == 0.2
+
+
+def test_numbers_at_the_window_edge_are_ignored():
+    # Inside a larger board the 1 may have its mine outside the window.
+    result = solve([["C", "C"], [1, "C"]], origin=(4, 4), board_size=(10, 10))
+    assert result == {"safe": [], "mines": [], "probabilities": [], "unconstrained_probability": None,
+                      "complete": True}
+    result = solve([["C", "C", "C"], ["C", 0, "C"], ["C", "C", "C"]], origin=(4, 4), board_size=(10, 10))
+    assert len(result["safe"]) == 8 and result["safe"][0] == [4, 4]
+
+
+def test_matches_brute_force_on_random_boards():
+    rng = random.Random(5)
+    for _ in range(30):
+        rows, columns = rng.randint(3, 4), rng.randint(3, 5)
+        mines = rng.randint(1, rows * columns // 4)
+        cells = masked(random_board(rng, rows, columns, mines))
+        expected = brute_force(rows, columns, mines, cells)
+
+        result = solve(cells, mines=mines)
+        assert result["complete"]
+        solved = {(r, c): 0.0 for r, c in result["safe"]}
+        solved.update({(r, c): 1.0 for r, c in result["mines"]})
+        solved.update({(r, c): p for r, c, p in result["probabilities"]})
+        for cell, probability in expected.items():
+            assert abs(solved.get(cell, result["unconstrained_probability"]) - probability) < 1e-4, (cells, cell)
+
+
+def test_budget_stops_the_solver():
+    rng = random.Random(3)
+    cells = masked(random_board(rng, 60, 60, 700))
+    result = solve(cells, mines=700, budget=0)
+    assert result["complete"] is False
+    # Whatever was found before the deadline is still right.
+    board_result = solve(cells, mines=700, budget=5)
+    assert set(map(tuple, result["safe"])) <= set(map(tuple, board_result["safe"]))
+
+
+def test_solvable_plays_the_board_from_the_first_clear():
+    # Every cell is deduced from the opening: a lone mine in the corner.
+    board = Board(4, 4)
+    board.place_mines([15])
+    board.calculate_values()
+    assert solvable(board, 0, 0)
+    assert not solvable(board, 3, 3)
+
+    # Two mines side by side behind a wall of 1s is a forced 50/50.
+    board = Board(2, 4)
+    board.place_mines([3])
+    board.calculate_values()
+    assert not solvable(board, 0, 0)
+
+
+def test_solvable_boards_need_no_guess():
+    rng = random.Random(9)
+    for _ in range(40):
+        board = Board(6, 6)
+        board.place_mines(rng.sample(range(1, 36), 5))
+        board.calculate_values()
+        if not solvable(board, 0, 0):
+            continue
+        # Clearing every safe cell the hint solver finds until the game is over never
+        # needs a guess.
+        board.flood_reveal(0, 0)
+        while board.covered_safe_cells():
+            hint = solve(masked(board), mines=5)
+            assert hint["safe"], masked(board)
+            for r, c in hint["safe"]:
+                board.flood_reveal(r, c)
+
+
+def test_solvable_stops_at_the_deadline():
+    board = Board(16, 16)
+    board.place_mines([17, 40, 99])
+    board.calculate_values()
+    assert solvable(board, 8, 8)
+    assert not solvable(board, 8, 8, deadline=0)
@@ -0,0 +1,80 @@
+import os
+import pytest
+
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateTable
+
+from models import db, Game
+from services.game_service import GameService
+from storage import configure_storage, storage_for, PostgresEngine, SQLiteEngine, StorageEngine
+
+
+def make_app(uri: str, **config):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config.update(config)
+    configure_storage(app)
+    db.init_app(app)
+    return app
+
+
+def test_storage_for_picks_the_backend():
+    assert isinstance(storage_for("sqlite:///games.db", {}), SQLiteEngine)
+    assert isinstance(storage_for(None, {}), SQLiteEngine)
+    assert isinstance(storage_for("postgresql+psycopg2://u:p@localhost/games", {}), PostgresEngine)
+    assert type(storage_for("mysql://u:p@localhost/games", {})) is StorageEngine
+
+
+def test_postgres_engine_options():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "postgresql://u:p@localhost/games"
+    app.config["DB_POOL_SIZE"] = 4
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_recycle": 60}
+    configure_storage(app)
+
+    options = app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+    assert options["pool_size"] == 4
+    assert options["max_overflow"] == 20
+    assert options["pool_pre_ping"] is True
+    assert options["query_cache_size"] == 500
+    # Explicit engine options win over the tuned defaults.
+    assert options["pool_recycle"] == 60
+    assert "connect_args" not in options
+
+
+def test_board_column_type_per_backend():
+    assert "BYTEA" in str(CreateTable(Game.__table__).compile(dialect=postgresql.dialect()))
+    assert "BLOB" in str(CreateTable(Game.__table__).compile(dialect=sqlite.dialect()))
+
+
+def test_sqlite_pragmas(tmp_path):
+    app = make_app(f"sqlite:///{tmp_path / 'games.db'}", SQLITE_BUSY_TIMEOUT_MS=2500)
+    with app.app_context():
+        assert db.session.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        # NORMAL
+        assert db.session.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert db.session.execute(text("PRAGMA busy_timeout")).scalar() == 2500
+        db.session.remove()
+        db.get_engine(app).dispose()
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URI"), reason="TEST_POSTGRES_URI is not set")
+def test_postgres_round_trip():
+    app = make_app(os.environ["TEST_POSTGRES_URI"])
+    with app.app_context():
+        db.create_all()
+        try:
+            service = GameService(seed=1)
+            service.start_game(1, 20, 20, 40)
+            db.session.add(service.game)
+            db.session.commit()
+            db.session.expire_all()
+
+            game = Game.query.get(service.game.id)
+            assert game.board == service.game.board
+        finally:
+            db.session.remove()
+            db.drop_all()
@@ -0,0 +1,53 @@
+from services.token_cache import TokenCache, CurrentUser
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cached_tokens_expire_after_the_ttl():
+    clock = FakeClock()
+    cache = TokenCache(ttl_seconds=60, clock=clock)
+    cache.put("token", CurrentUser(1, "ale@gmail.com"))
+    assert cache.get("token") == CurrentUser(1, "ale@gmail.com")
+
+    clock.now += 60
+    assert cache.get("token") is None
+    assert len(cache) == 0
+
+def test_cached_tokens_never_outlive_their_exp_claim():
+    clock = FakeClock()
+    cache = TokenCache(ttl_seconds=60, clock=clock)
+    cache.put("token", CurrentUser(1, "ale@gmail.com"), token_expiry=clock.now + 10)
+
+    clock.now += 10
+    assert cache.get("token") is None
+
+def test_least_recently_used_token_is_dropped():
+    cache = TokenCache(max_size=2, clock=FakeClock())
+    cache.put("a", CurrentUser(1, "a@a.com"))
+    cache.put("b", CurrentUser(2, "b@b.com"))
+    cache.get("a")
+    cache.put("c", CurrentUser(3, "c@c.com"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+
+def test_invalidate_user():
+    cache = TokenCache(clock=FakeClock())
+    cache.put("a1", CurrentUser(1, "a@a.com"))
+    cache.put("a2", CurrentUser(1, "a@a.com"))
+    cache.put("b", CurrentUser(2, "b@b.com"))
+
+    cache.invalidate_user("a@a.com")
+    assert cache.get("a1") is None and cache.get("a2") is None
+    assert cache.get("b") is not None
+
+def test_zero_size_disables_the_cache():
+    cache = TokenCache(max_size=0, clock=FakeClock())
+    cache.put("token", CurrentUser(1, "a@a.com"))
+    assert cache.get("token") is None